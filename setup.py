@@ -9,23 +9,25 @@ setup(name='ztools',
       description="Utilities for running and benchmarking Zonation",
       long_description="""\
 """,
-      classifiers=[],
+      classifiers=['Programming Language :: Python :: 3',
+                   'Programming Language :: Python :: 3 :: Only'],
       keywords='zonation test cbig',
-      author='Joona Lehtom\xc3\xa4ki',
+      author='Joona Lehtomäki',
       author_email='joona.lehtomaki@gmail.com',
       url='',
       license='MIT',
       packages=find_packages(exclude=['ez_setup', 'examples', 'tests']),
       include_package_data=True,
       zip_safe=False,
+      python_requires='>=3.7',
       install_requires=[
                   "pyyaml",
-                  "slackpy>=0.1.4"
+                  "numpy"
       ],
-      dependency_links = ['https://github.com/jlehtoma/slackpy/tarball/master#egg=slackpy-0.1.4'],
       entry_points={'console_scripts': [
                     'zrunner = ztools.runner:main',
-                    'zreader = ztools.reader:main'
+                    'zreader = ztools.reader:main',
+                    'zdiff = ztools.tools:main'
                     ]
                     },
       )
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import platform
+import stat
+import sys
+
+import numpy
+import pytest
+import yaml
+
+from ztools.rasters import RasterWriter
+
+# Stand-in for the Zonation executable: prints its version with -v and
+# otherwise writes a run info file like Zonation does, taking FAKE_DURATION
+# seconds (default 0.2).
+FAKE_ZONATION = '''#!{python}
+import os
+import sys
+import time
+
+if sys.argv[1] == '-v':
+    print('Zonation version: 3.1.11')
+    sys.exit(0)
+duration = float(os.environ.get('FAKE_DURATION', '0.2'))
+print('fake zonation output for ' + sys.argv[4])
+sys.stderr.write('fake zonation errors\\n')
+with open(sys.argv[4], 'w') as f:
+    f.write('Memory used: 12 MB\\n')
+    f.flush()
+    time.sleep(duration / 2)
+    f.write('Loaded data and initialized in 1 seconds\\n')
+    for percent in [25, 50, 75, 100]:
+        f.write('Removed {{0}}% of cells\\n'.format(percent))
+    f.write('Done in 2 seconds\\n')
+    f.flush()
+    time.sleep(duration / 2)
+    f.write('Elapsed time : 3000 ms\\nZIG3: DONE!\\n')
+'''
+
+
+@pytest.fixture
+def zonation(tmp_path):
+    ''' Path to a fake Zonation executable. '''
+    executable = tmp_path / 'bin' / 'zig3'
+    executable.parent.mkdir()
+    executable.write_text(FAKE_ZONATION.format(python=sys.executable))
+    executable.chmod(executable.stat().st_mode | stat.S_IEXEC)
+    return str(executable)
+
+
+@pytest.fixture
+def suite(tmp_path):
+    ''' Folder with bat files of 3 runs sharing the same inputs. '''
+    folder = tmp_path / 'suite'
+    (folder / 'out').mkdir(parents=True)
+    (folder / 'set.dat').write_text('[Settings]\nremoval rule = 1\n')
+    (folder / 'spp.spp').write_text('1.0 1.0 1 1 1 r1.asc\n')
+    (folder / 'r1.asc').write_text('ncols 2\nnrows 1\nxllcorner 0\n'
+                                   'yllcorner 0\ncellsize 1\n1 2\n')
+    bat_files = []
+    for i in range(1, 4):
+        bat_file = folder / 'do_{0}.bat'.format(i)
+        bat_file.write_text('call zig3.exe -r set.dat spp.spp '
+                            'out/run{0}.txt 0.0 0 1.0 0\n'.format(i))
+        bat_files.append(str(bat_file))
+    return bat_files
+
+
+
+@pytest.fixture
+def result_file(tmp_path):
+    ''' Factory writing a zrunner result file of runs on a given machine. '''
+    def write(name, runs, machine='node1',
+              report_time='2024-01-01 12:00:00', zversion='3.1.11'):
+        results = {'sys_info': [{'Report time': report_time},
+                                {'Uname': (platform.system(), machine,
+                                           '6.1.0', '#1', 'x86_64',
+                                           'x86_64')},
+                                {'Version': ('Debian', '12', 'bookworm')}],
+                   'z_info': zversion.split('.')}
+        results.update(runs)
+        file_path = str(tmp_path / name)
+        with open(file_path, 'w') as f:
+            f.write(yaml.dump(results, canonical=True))
+        return file_path
+    return write
+
+
+@pytest.fixture
+def raster_file(tmp_path):
+    ''' Factory writing a 2D array as a flat binary ENVI raster. '''
+    def write(name, data, nodata=-1.0):
+        data = numpy.asarray(data)
+        file_path = str(tmp_path / name)
+        writer = RasterWriter(file_path, data.shape[1], data.shape[0],
+                              data.dtype, nodata)
+        writer.write(data, 0, 0)
+        writer.close()
+        return file_path
+    return write
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from ztools.cache import (file_digest, HashCache, ResultCache,
+                          run_fingerprint)
+from ztools.runner import read_run
+
+
+def counting_digest(calls):
+    def hash_function(file_path):
+        calls.append(file_path)
+        return file_digest(file_path)
+    return hash_function
+
+
+def touch(file_path, content):
+    ''' Rewrite a file with a different modification time. '''
+    stat = os.stat(file_path)
+    with open(file_path, 'w') as f:
+        f.write(content)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_hash_cache_reuse(tmp_path):
+    data = tmp_path / 'data.txt'
+    data.write_text('abc')
+    cache_file = str(tmp_path / 'cache' / 'hashes.json')
+    calls = []
+    hash_cache = HashCache(cache_file, counting_digest(calls))
+    digest = hash_cache.file_hash(str(data))
+    assert digest == file_digest(str(data))
+    assert hash_cache.file_hash(str(data)) == digest
+    assert len(calls) == 1
+
+    hash_cache.save()
+    reloaded = HashCache(cache_file, counting_digest(calls))
+    assert reloaded.file_hash(str(data)) == digest
+    assert len(calls) == 1
+
+    touch(str(data), 'abd')
+    assert reloaded.file_hash(str(data)) != digest
+    assert len(calls) == 2
+
+
+def test_hash_cache_corrupt_file(tmp_path):
+    cache_file = tmp_path / 'hashes.json'
+    cache_file.write_text('{not json')
+    data = tmp_path / 'data.txt'
+    data.write_text('abc')
+    hash_cache = HashCache(str(cache_file))
+    assert hash_cache.file_hash(str(data)) == file_digest(str(data))
+    hash_cache.save()
+    assert not os.path.exists(str(cache_file) + '.tmp')
+
+
+def test_run_fingerprint(suite, zonation, tmp_path):
+    folder = os.path.dirname(suite[0])
+    cmd_args = read_run(suite[:1], zonation)[suite[0]]
+    hash_cache = HashCache(str(tmp_path / 'hashes.json'))
+
+    def fingerprint(args=cmd_args, z_info=('3', '1', '11')):
+        return run_fingerprint(suite[0], args, z_info, hash_cache)
+
+    original = fingerprint()
+    assert fingerprint() == original
+    # The executable does not change the results
+    assert fingerprint(['/other/zig3'] + cmd_args[1:]) == original
+    assert fingerprint(z_info=('3', '1', '12')) != original
+    assert fingerprint(cmd_args[:-1] + ['2']) != original
+
+    for name in ['r1.asc', 'set.dat', 'spp.spp']:
+        input_file = os.path.join(folder, name)
+        with open(input_file) as f:
+            content = f.read()
+        touch(input_file, content + '\n')
+        assert fingerprint() != original
+        touch(input_file, content)
+        assert fingerprint() == original
+
+
+def test_result_cache(tmp_path):
+    result_cache = ResultCache(str(tmp_path / 'cache'))
+    runinfo_file = tmp_path / 'out' / 'run_info.txt'
+    runinfo_file.parent.mkdir()
+    runinfo_file.write_text('Elapsed time 1 s\n')
+    run_info = {'Elapsed time': 1.0, 'resources': {'peak_rss': 1000}}
+    result_cache.put('ab12', run_info, str(runinfo_file))
+
+    restored = tmp_path / 'restored' / 'run_info.txt'
+    cached = result_cache.get('ab12', str(restored))
+    assert cached == dict(run_info, cached=True)
+    assert restored.read_text() == 'Elapsed time 1 s\n'
+
+
+def test_result_cache_misses(tmp_path):
+    result_cache = ResultCache(str(tmp_path / 'cache'))
+    runinfo_file = tmp_path / 'run_info.txt'
+    runinfo_file.write_text('')
+    result_cache.put('ab12', {'ERROR': 'failed'}, str(runinfo_file))
+    result_cache.put('cd34', {'Elapsed time': 1.0},
+                     str(tmp_path / 'missing.txt'))
+    for fingerprint in ['ab12', 'cd34', 'ef56']:
+        assert result_cache.get(fingerprint,
+                                str(tmp_path / 'restored.txt')) is None
+    assert not (tmp_path / 'restored.txt').exists()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import socket
+import time
+
+import pytest
+
+from ztools import cluster
+from ztools.cluster import _receive, _send, Coordinator, parse_address, work
+from ztools.runner import _run_coroutine, read_run
+
+
+def test_parse_address():
+    assert parse_address('node1:5000') == ('node1', 5000)
+    assert parse_address('5000') == ('localhost', 5000)
+    assert parse_address(':5000', '') == ('', 5000)
+    with pytest.raises(ValueError):
+        parse_address('node1')
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_lost_worker_runs_queued_first(monkeypatch, zonation, suite):
+    monkeypatch.setenv('FAKE_DURATION', '1.0')
+    cmd_args = read_run(suite, zonation)
+    run_a, run_b, run_c = suite
+    started = []
+    run_repeated_async = cluster.run_repeated_async
+
+    async def record(file_path, cmd_args, **options):
+        started.append(file_path)
+        return await run_repeated_async(file_path, cmd_args, **options)
+
+    monkeypatch.setattr(cluster, 'run_repeated_async', record)
+    finished = []
+    coordinator = Coordinator(cmd_args, {'sample_interval': 0.05},
+                              on_finish=lambda *args: finished.append(args))
+    port = free_port()
+
+    async def wait_for(condition):
+        for i in range(500):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError('timed out')
+
+    async def lost_worker():
+        # Takes a run and disconnects without a result
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        await _send(writer, {'type': 'hello', 'name': 'lost', 'slots': 1})
+        message = await _receive(reader)
+        writer.close()
+        return message['file_path']
+
+    async def suite_run():
+        serving = asyncio.ensure_future(coordinator.serve('127.0.0.1', port))
+        await asyncio.sleep(0.1)
+        first = asyncio.ensure_future(work('127.0.0.1', port, 1, 'first'))
+        await wait_for(lambda: started)
+        lost = await lost_worker()
+        # Queued again ahead of the run not handed out yet
+        await wait_for(lambda: coordinator._pending.qsize() == 2)
+        second = asyncio.ensure_future(work('127.0.0.1', port, 1, 'second'))
+        output = await serving
+        return lost, output, await first, await second
+
+    lost, output, n_first, n_second = _run_coroutine(suite_run())
+
+    assert lost == run_b
+    assert started == [run_a, run_b, run_c]
+    assert sorted(output) == sorted(suite)
+    assert n_first + n_second == 3
+    assert output[run_a]['worker'].startswith('first#')
+    for run_info in output.values():
+        assert 'ERROR' not in run_info
+        assert run_info['cellrem'] == 2
+        assert run_info['sys_info']
+    assert sorted(item[1] for item in finished) == [1, 2, 3]
+
+
+def test_deadline_sent_as_time_left(zonation, suite):
+    cmd_args = read_run(suite, zonation)
+    deadline = time.monotonic() + 1000
+    coordinator = Coordinator(cmd_args, {'deadline': deadline})
+    port = free_port()
+
+    async def worker():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        await _send(writer, {'type': 'hello', 'name': 'raw', 'slots': 3})
+        messages = [await _receive(reader) for run in suite]
+        for message in messages:
+            await _send(writer, {'type': 'result',
+                                 'file_path': message['file_path'],
+                                 'run_info': {'elapsed': 1.0}})
+        await _receive(reader)
+        writer.close()
+        return messages
+
+    async def suite_run():
+        serving = asyncio.ensure_future(coordinator.serve('127.0.0.1', port))
+        await asyncio.sleep(0.1)
+        messages = await worker()
+        return messages, await serving
+
+    messages, output = _run_coroutine(suite_run())
+    assert sorted(output) == sorted(suite)
+    for message in messages:
+        # Seconds left, not the coordinator's clock
+        assert 'deadline' not in message['options']
+        assert 990 < message['options']['time_left'] <= 1000
+
+
+def test_worker_deadline_from_time_left(zonation, suite):
+    cmd_args = read_run(suite, zonation)
+    # The suite time is up before the runs are handed out
+    coordinator = Coordinator(cmd_args, {'deadline': time.monotonic(),
+                                         'sample_interval': 0})
+    port = free_port()
+
+    async def suite_run():
+        serving = asyncio.ensure_future(coordinator.serve('127.0.0.1', port))
+        await asyncio.sleep(0.1)
+        n_runs = await work('127.0.0.1', port, 2, 'late')
+        return await serving, n_runs
+
+    output, n_runs = _run_coroutine(suite_run())
+    assert n_runs == 3
+    for run_info in output.values():
+        assert run_info['ERROR'] == 'TIMEOUT'
+        assert run_info['killed']['limit'] == 'suite'
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+import pytest
+from scipy import stats
+
+from ztools.correlation import (average_ranks, count_inversions,
+                                kendall_tau, spearman_rho, stratified_sample,
+                                tau_error_bound)
+from ztools.rasters import open_raster
+from ztools.tools import raster_differences, CORRELATION_CELL_BYTES
+
+
+def brute_force_inversions(keys):
+    return sum(1 for i in range(len(keys)) for j in range(i + 1, len(keys))
+               if keys[i] > keys[j])
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 3, 7, 8, 100, 257])
+def test_count_inversions(n):
+    keys = numpy.random.RandomState(n).randint(0, 10, n)
+    assert count_inversions(keys) == brute_force_inversions(keys)
+
+
+def test_count_inversions_large_keys():
+    # Too large to combine with the pair index in int64
+    keys = numpy.random.RandomState(0).randint(0, 2 ** 62, 200,
+                                               dtype=numpy.int64)
+    assert count_inversions(keys) == brute_force_inversions(list(keys))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_kendall_spearman_match_scipy(seed):
+    rng = numpy.random.RandomState(seed)
+    x = rng.rand(2000)
+    # Weakly correlated, so the p-values are not in the far tails where the
+    # normal approximation of Spearman's t statistic differs
+    y = 0.1 * x + rng.normal(0, 0.5, x.size)
+    # Ties in both
+    x = numpy.round(x, 1)
+    y = numpy.round(y, 2)
+
+    tau, p_tau = kendall_tau(x, y)
+    expected = stats.kendalltau(x, y)
+    assert tau == pytest.approx(expected[0], abs=1e-12)
+    assert p_tau == pytest.approx(expected[1], rel=1e-6, abs=1e-300)
+
+    rho, p_rho = spearman_rho(x, y)
+    expected = stats.spearmanr(x, y)
+    assert rho == pytest.approx(expected[0], abs=1e-12)
+    assert p_rho == pytest.approx(expected[1], rel=0.2, abs=1e-4)
+
+
+def test_average_ranks_match_scipy():
+    values = numpy.array([3, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5])
+    assert numpy.allclose(average_ranks(values), stats.rankdata(values))
+
+
+def test_degenerate_correlations():
+    assert numpy.isnan(kendall_tau([1, 1, 1], [1, 2, 3])[0])
+    assert numpy.isnan(spearman_rho([1, 2], [1, 2])[0])
+
+
+def test_stratified_sample():
+    mask = numpy.zeros((10, 10), dtype=bool)
+    mask[::2] = True
+    index = stratified_sample(mask, 0.2, numpy.random.RandomState(0))
+    assert index.size == 10
+    assert mask.ravel()[index].all()
+    assert numpy.all(numpy.diff(index) > 0)
+    assert tau_error_bound(1.0, 100) == 0.0
+
+
+def rasters(raster_file, shape=(200, 100)):
+    rng = numpy.random.RandomState(0)
+    data_1 = rng.rand(*shape).astype(numpy.float32)
+    data_2 = (data_1 + rng.normal(0, 0.1, shape)).astype(numpy.float32)
+    data_1[0, :10] = -1.0
+    return (open_raster(raster_file('a.img', data_1)),
+            open_raster(raster_file('b.img', data_2)), data_1, data_2)
+
+
+def test_raster_correlations_exact(raster_file):
+    dataset_1, dataset_2, data_1, data_2 = rasters(raster_file)
+    differences = raster_differences(dataset_1, dataset_2, threads=2)
+    mask = data_1 != -1.0
+    expected = stats.kendalltau(data_1[mask], data_2[mask])[0]
+    assert differences['kendall_tau'][0] == pytest.approx(expected)
+    assert 'correlation_sample' not in differences
+
+
+def test_raster_correlations_memory_limit(raster_file):
+    dataset_1, dataset_2, data_1, data_2 = rasters(raster_file)
+    cell_bytes = CORRELATION_CELL_BYTES + 8
+    # Exact correlations of the 19990 cells do not fit, switch to a sample
+    differences = raster_differences(dataset_1, dataset_2,
+                                     max_memory=5000 * cell_bytes)
+    assert 4900 <= differences['correlation_sample'] <= 5100
+    assert differences['kendall_tau_error'] > 0
+    mask = data_1 != -1.0
+    expected = stats.kendalltau(data_1[mask], data_2[mask])[0]
+    assert (abs(differences['kendall_tau'][0] - expected) <=
+            differences['kendall_tau_error'])
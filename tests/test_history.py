@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import yaml
+
+from ztools.history import (load_history, recorded_duration,
+                            recorded_peak_memory)
+
+
+def write_results(file_path, runs):
+    results = {'sys_info': [{'Report time': '2026-01-01T00:00:00'}],
+               'z_info': ['4', '0', '0']}
+    results.update(runs)
+    with open(file_path, 'w') as f:
+        yaml.dump(results, f)
+    return str(file_path)
+
+
+def test_history_matches_runs_by_name(tmp_path):
+    files = [write_results(tmp_path / 'a.yaml',
+                           {'/a/do_1.bat': {'measured': 10.0,
+                                            'resources': {'peak_rss': 100}}}),
+             write_results(tmp_path / 'b.yaml',
+                           {'/b/do_1.bat': {'measured': 30.0,
+                                            'resources': {'peak_rss': 300}},
+                            '/b/do_2.bat': {'measured': 5.0,
+                                            'ERROR': 'failed'}})]
+    history = load_history(files + [str(tmp_path / 'missing.yaml')])
+
+    assert sorted(history) == ['do_1.bat', 'do_2.bat']
+    assert recorded_peak_memory(history, '/c/do_1.bat') == 300
+    assert recorded_duration(history, '/c/do_1.bat') == 20.0
+    # Failed runs have no usable duration
+    assert recorded_duration(history, '/c/do_2.bat') is None
+    assert recorded_duration(history, '/c/do_3.bat') is None
+
+
+def test_peak_memory_fallbacks():
+    history = {'do_1.bat': [{'resources': {'rusage': {'maxrss': 2048}}}],
+               'do_2.bat': [{'memory': 12}],
+               'do_3.bat': [{'measured': 1.0}]}
+    assert recorded_peak_memory(history, 'do_1.bat') == 2048
+    assert recorded_peak_memory(history, 'do_2.bat') == 12 * 1024 * 1024
+    assert recorded_peak_memory(history, 'do_3.bat') is None
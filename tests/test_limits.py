@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import resource
+import stat
+import sys
+import time
+
+from ztools import runner
+
+# Stand-ins for a Zonation run exceeding its limits
+BUSY = 'while True: pass\n'
+ALLOCATE = '''import time
+data = bytearray(256 * 1024 * 1024)
+time.sleep(30)
+'''
+ABORT = '''import os
+try:
+    data = bytearray(1024 * 1024 * 1024)
+except MemoryError:
+    os.abort()
+'''
+IGNORE_TERM = '''import signal, time
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+time.sleep(30)
+'''
+
+
+def limited_run(suite, zonation, code):
+    ''' Get the command of a run with the executable replaced by code. '''
+    executable = os.path.join(os.path.dirname(zonation), 'limited')
+    with open(executable, 'w') as f:
+        f.write('#!{0}\n{1}'.format(sys.executable, code))
+    os.chmod(executable, os.stat(executable).st_mode | stat.S_IEXEC)
+    cmd_args = runner.read_run(suite[:1], zonation)[suite[0]]
+    return [executable] + cmd_args[1:]
+
+
+def test_rlimits():
+    assert runner._rlimits() == []
+    assert runner._rlimits(1.2, 1000) == [
+        (resource.RLIMIT_CPU, (2, 7)), (resource.RLIMIT_AS, (1000, 1000))]
+
+
+def test_cpu_time_limit(suite, zonation):
+    cmd_args = limited_run(suite, zonation, BUSY)
+    run_info = runner.run_analysis(suite[0], cmd_args, sample_interval=0,
+                                   max_cpu_time=1)
+    assert run_info['ERROR'] == 'TIMEOUT'
+    assert run_info['killed']['limit'] == 'cpu time'
+    assert run_info['killed']['cpu_time'] >= 0.9
+    assert run_info['measured'] < 10
+
+
+def test_memory_limit_sampled(suite, zonation):
+    cmd_args = limited_run(suite, zonation, ALLOCATE)
+    run_info = runner.run_analysis(suite[0], cmd_args, sample_interval=0.05,
+                                   max_memory=64 * 1024 * 1024, grace=1.0)
+    assert run_info['ERROR'] == 'OOM'
+    killed = run_info['killed']
+    assert killed['limit'] == 'memory'
+    assert killed['rss'] > 64 * 1024 * 1024
+    assert run_info['measured'] < 10
+
+
+def test_memory_limit_address_space(suite, zonation):
+    cmd_args = limited_run(suite, zonation, ABORT)
+    run_info = runner.run_analysis(suite[0], cmd_args, sample_interval=0,
+                                   max_memory=512 * 1024 * 1024)
+    assert run_info['ERROR'] == 'OOM'
+    assert run_info['killed']['limit'] == 'memory'
+
+
+def test_suite_deadline(suite, zonation):
+    cmd_args = runner.read_run(suite[:1], zonation)[suite[0]]
+    run_info = runner.run_analysis(suite[0], cmd_args,
+                                   deadline=time.monotonic() - 1)
+    assert run_info == {'ERROR': 'TIMEOUT',
+                        'killed': {'limit': 'suite', 'elapsed': 0.0}}
+
+
+def terminated_cpu_time(cmd_args, suite, **options):
+    ''' Run until terminated and get the CPU time used by the runner. '''
+    async def run():
+        interrupt = asyncio.Event()
+        if options.pop('interrupt_after', None):
+            asyncio.get_event_loop().call_later(0.3, interrupt.set)
+        return await runner.run_analysis_async(
+            suite[0], cmd_args, sample_interval=0, interrupt=interrupt,
+            grace=1.5, **options)
+
+    cpu_time = time.process_time()
+    run_info = asyncio.run(run())
+    return run_info, time.process_time() - cpu_time
+
+
+def test_grace_period_does_not_spin(suite, zonation):
+    # Ignores SIGTERM, so the runner waits the whole grace period
+    cmd_args = limited_run(suite, zonation, IGNORE_TERM)
+    run_info, cpu_time = terminated_cpu_time(cmd_args, suite,
+                                             interrupt_after=True)
+    assert run_info['ERROR'] == 'INTERRUPTED'
+    assert run_info['measured'] > 1.5
+    assert cpu_time < 0.5
+
+    run_info, cpu_time = terminated_cpu_time(cmd_args, suite, timeout=0.3)
+    assert run_info['ERROR'] == 'TIMEOUT'
+    assert run_info['measured'] > 1.5
+    assert cpu_time < 0.5
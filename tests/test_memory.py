@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from ztools.memory import (CELL_OVERHEAD_BYTES, estimate_memory,
+                           FEATURE_CELL_BYTES, HISTORY_MARGIN, raster_cells,
+                           referenced_files)
+from ztools.runner import _first_fit, read_run
+
+
+def test_referenced_files(suite, zonation):
+    folder = os.path.dirname(suite[0])
+    with open(os.path.join(folder, 'set.dat'), 'a') as f:
+        f.write('mask file = mask.asc\ncost file = costs.txt\n'
+                'condition file = missing.asc\n')
+    for name in ['mask.asc', 'costs.txt']:
+        open(os.path.join(folder, name), 'w').close()
+    cmd_args = read_run(suite[:1], zonation)[suite[0]]
+
+    files = referenced_files(suite[0], cmd_args)
+    assert files == {'dat': [os.path.join(folder, 'set.dat')],
+                     'spp': [os.path.join(folder, 'spp.spp')],
+                     'rasters': [os.path.join(folder, 'mask.asc'),
+                                 os.path.join(folder, 'r1.asc')],
+                     'other': [os.path.join(folder, 'costs.txt')]}
+
+
+def test_raster_cells(tmp_path, raster_file):
+    ascii_grid = tmp_path / 'grid.asc'
+    ascii_grid.write_text('ncols 30\nnrows 20\ncellsize 1\n')
+    assert raster_cells(str(ascii_grid)) == 600
+    import numpy
+    assert raster_cells(raster_file('r.img', numpy.zeros((7, 9)))) == 63
+    # Without a header the size of the file is used
+    flat = tmp_path / 'flat.bin'
+    flat.write_bytes(b'\0' * 400)
+    assert raster_cells(str(flat)) == 100
+
+
+def test_estimate_memory(suite, zonation):
+    cmd_args = read_run(suite[:1], zonation)[suite[0]]
+    # A single 2 x 1 raster
+    assert estimate_memory(suite[0], cmd_args) == (
+        2 * FEATURE_CELL_BYTES + 2 * CELL_OVERHEAD_BYTES)
+    history = {'do_1.bat': [{'resources': {'peak_rss': 1000}}]}
+    assert estimate_memory(suite[0], cmd_args, history) == int(
+        1000 * HISTORY_MARGIN)
+    assert estimate_memory(suite[0], ['zig3']) is None
+
+
+def test_first_fit():
+    pending = [('a', []), ('b', []), ('c', [])]
+    estimates = {'a': 10, 'b': 5}
+    assert _first_fit(pending, estimates, 10) == 0
+    assert _first_fit(pending, estimates, 6) == 1
+    # Runs without an estimate always fit
+    assert _first_fit(pending, estimates, 0) == 2
+    assert _first_fit(pending[:2], estimates, 4) is None
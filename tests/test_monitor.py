@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from ztools.monitor import ResourceMonitor, Watchdog
+
+pytestmark = pytest.mark.skipif(not os.path.isdir('/proc/self'),
+                                reason='requires /proc')
+
+# Allocates 64 MiB in a child process and keeps a core busy
+WORKLOAD = '''
+import subprocess, sys
+child = subprocess.Popen([sys.executable, '-c',
+    'import time\\ndata = bytearray(64 * 1024 * 1024)\\n'
+    'end = time.time() + 30\\nwhile time.time() < end: pass'])
+child.wait()
+'''
+
+
+def start(code):
+    return subprocess.Popen([sys.executable, '-c', code],
+                            start_new_session=True)
+
+
+def wait_for(condition, timeout=10.0):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end
+        time.sleep(0.05)
+
+
+def test_resource_monitor_tree(tmp_path):
+    process = start(WORKLOAD)
+    monitor = ResourceMonitor(process.pid, interval=0.1)
+    try:
+        def sample():
+            monitor.sample()
+            return (monitor.samples[-1][1] > 64 * 1024 * 1024 and
+                    monitor.cpu_time() > 0.3)
+        wait_for(sample)
+    finally:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    monitor.sample()
+
+    summary = monitor.summary()
+    assert summary['samples'] == len(monitor.samples)
+    assert summary['peak_rss'] > 64 * 1024 * 1024
+    assert summary['cpu_peak'] > 0
+    assert 0 < summary['cpu_mean'] <= 100 * os.cpu_count()
+    # The CPU time of exited processes still counts
+    assert monitor.cpu_time() > 0.3
+
+    csv_file = str(tmp_path / 'resources.csv')
+    monitor.write_timeseries(csv_file)
+    with open(csv_file) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == 'time,rss,cpu,read_bytes,write_bytes'
+    assert len(lines) == len(monitor.samples) + 1
+
+
+def test_resource_monitor_missing_process():
+    monitor = ResourceMonitor(2 ** 22 + 1)
+    assert monitor.summary() == {'samples': 0, 'interval': 1.0}
+    monitor.sample()
+    assert monitor.summary()['peak_rss'] == 0
+
+
+def test_watchdog():
+    process = start('import time; time.sleep(30)')
+    monitor = ResourceMonitor(process.pid)
+    watchdog = Watchdog(process, timeout=5.0, max_memory=1024,
+                        monitor=monitor)
+    try:
+        assert watchdog.check(1.0) is None
+        wait_for(lambda: monitor.sample() or monitor.samples[-1][1] > 0)
+        assert watchdog.check(1.0) == 'OOM'
+        assert watchdog.check(5.0) == 'TIMEOUT'
+
+        watchdog.terminate('TIMEOUT', 5.0)
+        assert process.wait(10) == -signal.SIGTERM
+    finally:
+        watchdog.kill()
+    assert watchdog.reason == 'TIMEOUT'
+    assert watchdog.usage['elapsed'] == 5.0
+    assert watchdog.usage['rss'] > 1024
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from ztools.notify import Notifier, Sink, SlackSink, WebhookSink
+
+
+class Endpoint(object):
+    ''' Local stand-in for a webhook answering with the given statuses. '''
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers['Content-Length'])
+                endpoint.requests.append(json.loads(
+                    self.rfile.read(length).decode('utf-8')))
+                status = (endpoint.statuses.pop(0) if endpoint.statuses
+                          else 200)
+                self.send_response(status)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{0}/hook'.format(
+            self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def endpoint():
+    endpoint = Endpoint()
+    yield endpoint
+    endpoint.close()
+
+
+def notifier(sink, **kwargs):
+    options = {'batch_window': 0.05, 'backoff': 0.01}
+    options.update(kwargs)
+    return Notifier(sink, **options)
+
+
+def test_sink_is_abstract():
+    with pytest.raises(TypeError):
+        Sink()
+
+
+def test_retry_after_server_error(endpoint):
+    endpoint.statuses = [500]
+    worker = notifier(WebhookSink(endpoint.url))
+    worker.start()
+    worker.notify('Run 1', 'finished in 10 s')
+    worker.close()
+    assert len(endpoint.requests) == 2
+    assert endpoint.requests[0] == endpoint.requests[1]
+    assert endpoint.requests[1]['notifications'][0]['title'] == 'Run 1'
+    assert worker.sent == 1
+
+
+def test_start_and_finish_coalesced(endpoint):
+    worker = notifier(WebhookSink(endpoint.url), batch_window=1.0)
+    worker.start()
+    worker.notify('Run 1', 'started')
+    worker.notify('Run 2', 'started')
+    worker.notify('Run 1', 'finished', level='warning')
+    worker.close()
+    assert len(endpoint.requests) == 1
+    notifications = endpoint.requests[0]['notifications']
+    assert [(item['title'], item['message']) for item in notifications] == [
+        ('Run 1', 'finished'), ('Run 2', 'started')]
+    assert notifications[0]['level'] == 'warning'
+
+
+def test_dropped_notifications_reported(endpoint):
+    worker = notifier(WebhookSink(endpoint.url), max_queue=2)
+    # Not started yet, so the queue fills up
+    results = [worker.notify('Run {0}'.format(i), 'started')
+               for i in range(5)]
+    assert results == [True, True, False, False, False]
+    assert worker.dropped == 3
+    worker.start()
+    worker.close()
+    notifications = [item for request in endpoint.requests
+                     for item in request['notifications']]
+    assert [item['title'] for item in notifications] == [
+        'Run 0', 'Run 1', 'Notifications dropped']
+    assert notifications[-1]['message'].startswith('3 ')
+
+
+def test_close_times_out_with_unreachable_sink():
+    # A port nothing listens on
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    worker = notifier(WebhookSink('http://127.0.0.1:{0}/'.format(port),
+                                  timeout=0.5),
+                      retries=100, backoff=0.2, max_backoff=0.2)
+    worker.start()
+    worker.notify('Run 1', 'started')
+    t0 = time.time()
+    worker.close(timeout=0.5)
+    assert time.time() - t0 < 2.0
+    assert worker.sent == 0
+
+
+def test_slack_payload():
+    sink = SlackSink('http://localhost/', '#runs', user_name='bot')
+    payload = sink.payload([{'title': 'Run 1', 'message': 'failed',
+                             'level': 'error', 'time': 1700000000.5}])
+    assert payload['channel'] == '#runs'
+    assert payload['username'] == 'bot'
+    assert payload['attachments'] == [{'title': 'Run 1', 'text': 'failed',
+                                       'fallback': 'Run 1: failed',
+                                       'color': '#a30200',
+                                       'ts': 1700000000}]
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+import pytest
+
+from ztools.parser import is_finished, parse_results, RuninfoTailer
+from ztools.utilities import ZonationRuninfoException
+
+RUNINFO = ['Memory used: 12 MB',
+           'Loaded 3 biodiversity features',
+           'Non-missing cells: 1000',
+           'Done in 9 seconds',
+           'Loaded data and initialized in 5 seconds',
+           'Memory used: 40.5 MB',
+           'Removed 50% of cells',
+           'Done in 120 seconds',
+           'Elapsed time : 130500 ms',
+           'ZIG3: DONE!']
+
+
+def write_runinfo(file_path, lines):
+    with open(str(file_path), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return str(file_path)
+
+
+def test_parse_results(tmp_path):
+    results = parse_results(write_runinfo(tmp_path / 'run.txt', RUNINFO))
+    # "Done in" before initialization is not the cell removal time
+    assert results == {'init': 5, 'cellrem': 120, 'elapsed': 130.5,
+                       'features': 3, 'cells': 1000, 'memory': 40.5}
+
+
+def test_parse_results_invalid_bytes(tmp_path):
+    # A Windows-1252 path is not valid UTF-8
+    runinfo_file = tmp_path / 'run.txt'
+    runinfo_file.write_bytes(b'Output file: C:\\data\\m\xe4nnik\xf6.txt\n' +
+                             '\n'.join(RUNINFO).encode('ascii') + b'\n')
+    assert parse_results(str(runinfo_file))['elapsed'] == 130.5
+
+
+def test_parse_results_incomplete(tmp_path):
+    runinfo_file = write_runinfo(tmp_path / 'run.txt', RUNINFO[:-1])
+    assert not is_finished(runinfo_file)
+    with pytest.raises(ZonationRuninfoException):
+        parse_results(runinfo_file)
+    with pytest.raises(ZonationRuninfoException):
+        parse_results(str(tmp_path / 'missing.txt'))
+
+
+def test_is_finished_marker_across_blocks(tmp_path):
+    runinfo_file = write_runinfo(tmp_path / 'run.txt',
+                                 ['x' * 100, 'ZIG3: DONE!', 'y' * 3])
+    for block_size in [1, 4, 7, 64, 65536]:
+        assert is_finished(runinfo_file, block_size)
+
+
+def events(tailer):
+    return [event['event'] for event in tailer.poll()]
+
+
+def test_tailer_follows_stages(tmp_path):
+    runinfo_file = str(tmp_path / 'run.txt')
+    tailer = RuninfoTailer(runinfo_file)
+    assert events(tailer) == []
+    with open(runinfo_file, 'w') as f:
+        f.write('Loaded data and initialized in 5 seconds\nRemoved 5')
+        f.flush()
+        assert events(tailer) == ['started', 'init']
+        # The incomplete line is only handled when it is complete
+        f.write('0% of cells\nDone in 120 seconds\n')
+        f.flush()
+        assert events(tailer) == ['progress', 'cellrem']
+        f.write('Elapsed time : 130500 ms\nZIG3: DONE!\n')
+    assert events(tailer) == ['elapsed', 'done']
+    assert tailer.stage == 'done'
+    assert set(tailer.stage_times()) == {'waiting', 'loading', 'cellrem',
+                                         'finishing'}
+    tailer.close()
+
+
+def test_tailer_ignores_stale_file(tmp_path):
+    # A file written by an earlier repetition in the same second
+    runinfo_file = write_runinfo(tmp_path / 'run.txt', RUNINFO)
+    tailer = RuninfoTailer(runinfo_file)
+    assert events(tailer) == []
+    # Zonation truncates and rewrites it
+    write_runinfo(runinfo_file, ['Loaded data and initialized in 5 seconds'])
+    assert events(tailer) == ['started', 'init']
+    tailer.close()
+
+
+def test_tailer_counts_bytes(tmp_path):
+    # Multibyte characters must not make the tailer think the file shrank
+    runinfo_file = str(tmp_path / 'run.txt')
+    tailer = RuninfoTailer(runinfo_file)
+    with open(runinfo_file, 'w', encoding='utf-8') as f:
+        f.write('Käyttö ääkkösillä ' * 20 + '\n')
+        f.write('Loaded data and initialized in 5 seconds\n')
+        f.flush()
+        assert events(tailer) == ['started', 'init']
+        f.write('Done in 120 seconds\n')
+    assert events(tailer) == ['cellrem']
+    tailer.close()
+
+
+def test_tailer_stall(tmp_path):
+    tailer = RuninfoTailer(str(tmp_path / 'run.txt'), stall_timeout=0.01)
+    write_runinfo(tmp_path / 'run.txt', ['Memory used: 12 MB'])
+    assert events(tailer) == ['started']
+    time.sleep(0.05)
+    assert events(tailer) == ['stalled']
+    # Reported only once per stall
+    assert events(tailer) == []
+    tailer.close()
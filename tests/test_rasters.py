@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+import pytest
+
+from ztools import rasters
+from ztools.rasters import (MemmapDataset, open_raster, payload_digest,
+                            read_header, reopen_raster)
+from ztools.tools import raster_differences
+
+UTM35N = ('PROJCS["WGS 84 / UTM zone 35N",GEOGCS["WGS 84",DATUM["WGS_1984",'
+          'SPHEROID["WGS 84",6378137,298.257223563]],PRIMEM["Greenwich",0],'
+          'UNIT["degree",0.0174532925199433]],'
+          'PROJECTION["Transverse_Mercator"],'
+          'PARAMETER["latitude_of_origin",0],'
+          'PARAMETER["central_meridian",27],'
+          'PARAMETER["scale_factor",0.9996],'
+          'PARAMETER["false_easting",500000],'
+          'PARAMETER["false_northing",0],UNIT["metre",1]]')
+
+
+def write_ehdr(tmp_path, name, data, byte_order='I', skip=0, nodata=None):
+    ''' Write a 2D array as a flat binary raster with an EHdr header. '''
+    data = numpy.asarray(data)
+    pixel_type = 'FLOAT' if data.dtype.kind == 'f' else (
+        'SIGNEDINT' if data.dtype.kind == 'i' else 'UNSIGNEDINT')
+    lines = ['NROWS {0}'.format(data.shape[0]),
+             'NCOLS {0}'.format(data.shape[1]),
+             'NBANDS 1', 'NBITS {0}'.format(data.dtype.itemsize * 8),
+             'PIXELTYPE {0}'.format(pixel_type),
+             'BYTEORDER {0}'.format(byte_order),
+             'SKIPBYTES {0}'.format(skip)]
+    if nodata is not None:
+        lines.append('NODATA {0}'.format(nodata))
+    (tmp_path / (name + '.hdr')).write_text('\n'.join(lines) + '\n')
+    order = '>' if byte_order == 'M' else '<'
+    file_path = tmp_path / (name + '.bil')
+    file_path.write_bytes(b'\0' * skip +
+                          data.astype(data.dtype.newbyteorder(order)).tobytes())
+    return str(file_path)
+
+
+def test_read_header_envi(raster_file):
+    layout = read_header(raster_file('r.img',
+                                     numpy.zeros((3, 4), 'float32')))
+    assert (layout['rows'], layout['cols'], layout['offset']) == (3, 4, 0)
+    assert layout['dtype'] == numpy.dtype('<f4')
+    assert layout['nodata'] == -1.0
+
+
+def test_read_header_ehdr(tmp_path):
+    data = numpy.arange(6, dtype='int16').reshape(2, 3)
+    layout = read_header(write_ehdr(tmp_path, 'r', data, byte_order='M',
+                                    skip=8, nodata=-9999))
+    assert (layout['rows'], layout['cols'], layout['offset']) == (2, 3, 8)
+    assert layout['dtype'] == numpy.dtype('>i2')
+    assert layout['nodata'] == -9999.0
+
+
+def test_read_header_unsupported(tmp_path):
+    assert read_header(str(tmp_path / 'r.tif')) is None
+    (tmp_path / 'multi.hdr').write_text('ENVI\nsamples = 2\nlines = 2\n'
+                                        'bands = 3\ndata type = 4\n')
+    assert read_header(str(tmp_path / 'multi.img')) is None
+    (tmp_path / 'broken.hdr').write_text('ENVI\nsamples = 2\n')
+    assert read_header(str(tmp_path / 'broken.img')) is None
+
+
+def test_memmap_dataset(tmp_path):
+    data = numpy.arange(12, dtype='float64').reshape(3, 4)
+    dataset = open_raster(write_ehdr(tmp_path, 'r', data, byte_order='M',
+                                     skip=16))
+    assert isinstance(dataset, MemmapDataset)
+    assert (dataset.RasterXSize, dataset.RasterYSize) == (4, 3)
+    assert reopen_raster(dataset) is dataset
+    band = dataset.GetRasterBand(1)
+    numpy.testing.assert_array_equal(band.ReadAsArray(), data)
+    numpy.testing.assert_array_equal(band.ReadAsArray(1, 1, 2, 2),
+                                     data[1:3, 1:3])
+    with pytest.raises(ValueError):
+        dataset.GetRasterBand(2)
+
+
+def test_memmap_block_size(raster_file, monkeypatch):
+    monkeypatch.setattr(rasters, 'BLOCK_CELLS', 20)
+    band = open_raster(raster_file('r.img', numpy.zeros((10, 6)))) \
+        .GetRasterBand(1)
+    assert band.GetBlockSize() == [6, 3]
+    band = open_raster(raster_file('wide.img', numpy.zeros((2, 30)))) \
+        .GetRasterBand(1)
+    assert band.GetBlockSize() == [30, 1]
+
+
+def test_raster_writer_round_trip(tmp_path, raster_file):
+    data = numpy.random.RandomState(0).rand(5, 7).astype('float32')
+    source = open_raster(raster_file('r.img', data))
+    source.georeference = {'map info': 'UTM, 1, 1, 0, 0, 10, 10'}
+
+    writer = rasters.RasterWriter(str(tmp_path / 'copy.img'), 7, 5,
+                                  numpy.float32, -1.0, like=source)
+    writer.write(data[:3], 0, 0)
+    writer.write(data[3:, :4], 0, 3)
+    writer.write(data[3:, 4:], 4, 3)
+    writer.close()
+
+    copy = open_raster(str(tmp_path / 'copy.img'))
+    numpy.testing.assert_array_equal(copy.GetRasterBand(1).ReadAsArray(),
+                                     data)
+    assert copy.GetRasterBand(1).GetNoDataValue() == -1.0
+    assert copy.georeference == source.georeference
+
+
+def write_georeferenced(tmp_path, raster_file):
+    ''' Write an ENVI raster with map info and a coordinate system. '''
+    file_path = raster_file('geo.img', numpy.ones((4, 5), 'float32'))
+    with open(str(tmp_path / 'geo.hdr'), 'a') as f:
+        f.write('map info = {UTM, 2.0, 3.0, 500020.0, 6999970.0, 10.0, '
+                '10.0, 35, North, WGS-84}\n')
+        f.write('coordinate system string = {' + UTM35N + '}\n')
+    return file_path
+
+
+def test_georeference_envi(tmp_path, raster_file):
+    dataset = open_raster(write_georeferenced(tmp_path, raster_file))
+    # The tie point is pixel (2, 3), so the corner is one and two cells away
+    assert dataset.GetGeoTransform() == (500010.0, 10.0, 0.0, 6999990.0,
+                                         0.0, -10.0)
+    assert dataset.GetProjection() == UTM35N
+    assert open_raster(raster_file('plain.img', numpy.ones((2, 2)))) \
+        .GetGeoTransform() is None
+
+
+def test_georeference_ehdr(tmp_path):
+    file_path = write_ehdr(tmp_path, 'r', numpy.zeros((2, 3), 'float32'))
+    with open(str(tmp_path / 'r.hdr'), 'a') as f:
+        f.write('ULXMAP 105.0\nULYMAP 395.0\nXDIM 10\nYDIM 10\n')
+    (tmp_path / 'r.prj').write_text('PROJCS["ETRS89 / TM35FIN(E,N)"]\n')
+    dataset = open_raster(file_path)
+    assert dataset.GetGeoTransform() == (100.0, 10.0, 0.0, 400.0, 0.0,
+                                         -10.0)
+    assert dataset.GetProjection() == 'PROJCS["ETRS89 / TM35FIN(E,N)"]'
+
+    # Written as ENVI map info
+    writer = rasters.RasterWriter(str(tmp_path / 'copy.img'), 3, 2,
+                                  like=dataset)
+    writer.close()
+    copy = open_raster(str(tmp_path / 'copy.img'))
+    assert copy.GetGeoTransform() == dataset.GetGeoTransform()
+    assert copy.GetProjection() == dataset.GetProjection()
+
+
+def test_georeference_geotiff(tmp_path, raster_file):
+    pytest.importorskip('osgeo.gdal')
+    source = open_raster(write_georeferenced(tmp_path, raster_file))
+    writer = rasters.RasterWriter(str(tmp_path / 'copy.tif'), 5, 4,
+                                  like=source, compress=True)
+    writer.write(numpy.ones((4, 5)), 0, 0)
+    writer.close()
+    copy = open_raster(str(tmp_path / 'copy.tif'))
+    assert copy.GetGeoTransform() == pytest.approx(source.GetGeoTransform())
+    assert 'UTM zone 35N' in copy.GetProjection()
+
+
+def test_difference_raster_georeference(tmp_path, raster_file):
+    source = write_georeferenced(tmp_path, raster_file)
+    other = raster_file('other.img', numpy.zeros((4, 5), 'float32'))
+    difference_file = str(tmp_path / 'difference.img')
+    raster_differences(open_raster(source), open_raster(other),
+                       correlation='none', difference_file=difference_file)
+    difference = open_raster(difference_file)
+    assert difference.GetGeoTransform() == \
+        open_raster(source).GetGeoTransform()
+    assert difference.GetProjection() == open_raster(source).GetProjection()
+
+
+def test_payload_digest(tmp_path, raster_file):
+    data = numpy.arange(20, dtype='float32').reshape(4, 5)
+    digest = payload_digest(raster_file('a.img', data))
+    # Header fields other than the layout do not matter
+    other = raster_file('b.img', data)
+    with open(str(tmp_path / 'b.hdr'), 'a') as f:
+        f.write('description = {another run}\n')
+    assert payload_digest(other, block_size=7) == digest
+
+    changed = data.copy()
+    changed[3, 4] = -1
+    assert payload_digest(raster_file('c.img', changed)) != digest
+    assert payload_digest(raster_file('d.img', data, nodata=0)) != digest
+    assert payload_digest(raster_file('e.img', data.reshape(5, 4))) != digest
+
+
+def test_open_raster_without_gdal(tmp_path, monkeypatch):
+    monkeypatch.setattr(rasters, 'gdal', None)
+    tif = tmp_path / 'r.tif'
+    tif.write_bytes(b'II*\0')
+    with pytest.raises(IOError):
+        open_raster(str(tif))
+    with pytest.raises(IOError):
+        rasters.RasterWriter(str(tmp_path / 'out.tif'), 2, 2)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from ztools import reader
+from ztools.reader import compare_results, run_samples, ZReader
+
+
+def run(cellrem, **kwargs):
+    run_info = {'init': 1.0, 'cellrem': cellrem, 'elapsed': cellrem + 1.0,
+                'measured': cellrem + 1.5}
+    run_info.update(kwargs)
+    return run_info
+
+
+def repeated(values):
+    return run(values[0], samples={'cellrem': list(values)})
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    # Do not write parsed results into the user's cache
+    monkeypatch.setattr(reader.read_result_files, '__defaults__',
+                        (1, None))
+
+
+def test_read_result_files(result_file, no_cache):
+    file_path = result_file('a.yaml', {'/suite/do_1.bat': run(10.0)})
+    results = reader.read_result_files([file_path, 'missing.yaml'])
+    assert [item[0] for item in results] == [file_path]
+    zreader = ZReader(*results[0])
+    assert zreader.zversion == '3.1.11'
+    assert zreader.uname['name'] == 'node1'
+    assert zreader.results['do_1.bat']['cellrem'] == 10.0
+
+
+def readers(*result_sets):
+    sys_info = [{'Report time': '2024-01-01 12:00:00'},
+                {'Uname': ('Linux', 'node1', '6.1.0', '#1', 'x86_64')},
+                {'Version': ('Debian', '12', 'bookworm')}]
+    return [ZReader('results.yaml', dict(runs, sys_info=sys_info,
+                                         z_info=['3', '1', '11']))
+            for runs in result_sets]
+
+
+def test_run_samples_pools_result_sets():
+    samples = run_samples(readers({'do_1.bat': repeated([10.0, 11.0])},
+                                  {'do_1.bat': run(12.0)}))
+    assert samples['do_1.bat']['cellrem'] == [10.0, 11.0, 12.0]
+    assert samples['do_1.bat']['init'] == [1.0, 1.0]
+
+
+def test_run_samples_failure_independent_of_order():
+    ok = {'do_1.bat': run(10.0)}
+    failed = {'do_1.bat': {'ERROR': 'TIMEOUT'}}
+    assert run_samples(readers(ok, failed))['do_1.bat'] is None
+    assert run_samples(readers(failed, ok))['do_1.bat'] is None
+
+
+def verdicts(rows):
+    return dict(((row[0], row[1]), row[6]) for row in rows)
+
+
+def test_compare_results():
+    baseline = readers({'slow.bat': repeated([10.0, 10.1, 9.9, 10.0, 10.2]),
+                        'same.bat': repeated([10.0, 10.1, 9.9, 10.0, 10.2]),
+                        'noisy.bat': repeated([10.0, 30.0, 5.0, 8.0, 25.0])})
+    candidate = readers({'slow.bat': repeated([12.0, 12.1, 11.9, 12.0, 12.2]),
+                         'same.bat': repeated([10.1, 10.0, 10.0, 9.9, 10.1]),
+                         'noisy.bat': repeated([12.0, 28.0, 6.0, 9.0,
+                                                26.0])})
+    result = verdicts(compare_results(baseline, candidate,
+                                      stages=['cellrem']))
+    assert result == {('slow.bat', 'cellrem'): 'SLOWER',
+                      ('same.bat', 'cellrem'): 'same',
+                      ('noisy.bat', 'cellrem'): 'unclear'}
+
+
+def test_compare_results_few_repeats():
+    # zrunner -r 3: the test could not be significant at alpha 0.05
+    baseline = readers({'slow.bat': repeated([10.0, 10.1, 10.2]),
+                        'same.bat': repeated([10.0, 10.1, 10.2])})
+    candidate = readers({'slow.bat': repeated([20.0, 20.1, 20.2]),
+                         'same.bat': repeated([10.2, 10.1, 10.0])})
+    rows = compare_results(baseline, candidate, stages=['cellrem'])
+    assert verdicts(rows) == {('slow.bat', 'cellrem'): 'SLOWER',
+                              ('same.bat', 'cellrem'): 'same'}
+    assert [row[5] for row in rows] == [None, None]
+
+    # With 4 samples each a clear slowdown is significant
+    baseline = readers({'slow.bat': repeated([10.0, 10.1, 10.2, 10.3])})
+    candidate = readers({'slow.bat': repeated([20.0, 20.1, 20.2, 20.3])})
+    rows = compare_results(baseline, candidate, stages=['cellrem'])
+    assert verdicts(rows) == {('slow.bat', 'cellrem'): 'SLOWER'}
+    assert rows[0][5] < 0.05
+
+
+def test_compare_results_missing_and_failed():
+    baseline = readers({'do_1.bat': run(10.0), 'do_2.bat': run(10.0),
+                        'do_3.bat': {'ERROR': 'TIMEOUT'}})
+    candidate = readers({'do_2.bat': run(10.0)},
+                        {'do_2.bat': {'ERROR': 'OOM'},
+                         'do_3.bat': {'ERROR': 'TIMEOUT'}})
+    result = verdicts(compare_results(baseline, candidate))
+    assert result == {('do_1.bat', '-'): 'MISSING',
+                      ('do_2.bat', '-'): 'FAILED',
+                      ('do_3.bat', '-'): 'FAILED'}
+
+
+def test_compare_main_exit_status(result_file, no_cache):
+    baseline = result_file('base.yaml', {'/suite/do_1.bat': run(10.0),
+                                         '/suite/do_2.bat': run(10.0)})
+    same = result_file('same.yaml', {'/suite/do_1.bat': run(10.0),
+                                     '/suite/do_2.bat': run(10.1)})
+    missing = result_file('missing.yaml', {'/suite/do_1.bat': run(10.0)})
+
+    reader.compare_main(['-b', baseline, '-c', same])
+    with pytest.raises(SystemExit) as e:
+        reader.compare_main(['-b', baseline, '-c', missing])
+    assert e.value.code == 1
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import yaml
+
+from ztools import runner
+from ztools.utilities import load_results
+
+
+def run_main(monkeypatch, argv):
+    monkeypatch.setattr(sys, 'argv', ['zrunner'] + argv)
+    runner.main()
+
+
+def test_main_runs_suite(monkeypatch, tmp_path, zonation, suite):
+    monkeypatch.chdir(os.path.dirname(suite[0]))
+    with open('suite.yaml', 'w') as f:
+        yaml.dump({'runs': [os.path.basename(item) for item in suite]}, f)
+    output_file = str(tmp_path / 'results.yaml')
+    run_main(monkeypatch, ['-l', 'suite.yaml', '-x', zonation,
+                           '-o', output_file,
+                           '--cache-dir', str(tmp_path / 'cache'),
+                           '--sample-interval', '0.05'])
+
+    results = load_results(output_file)
+    assert results['z_info'] == ['3', '1', '11']
+    assert results['sys_info'][0]['Report time']
+    assert len(results['sys_info'][1]['Uname']) >= 5
+    for bat_file in suite:
+        run_info = results[bat_file]
+        assert 'ERROR' not in run_info
+        assert run_info['init'] == 1
+        assert run_info['cellrem'] == 2
+        assert run_info['elapsed'] == 3
+        assert run_info['measured'] > 0
+
+
+def test_run_analysis_rusage(zonation, suite):
+    cmd_args = runner.read_run(suite[:1], zonation)[suite[0]]
+    run_info = runner.run_analysis(suite[0], cmd_args, sample_interval=0.05)
+    assert 'ERROR' not in run_info
+    assert run_info['cellrem'] == 2
+    assert set(run_info['stages']) >= {'loading', 'cellrem'}
+    assert all(os.path.exists(item) for item in run_info['logs'].values())
+
+    resources = run_info['resources']
+    rusage = resources['rusage']
+    # Reaped by the runner, so the kernel's exact totals are reported
+    assert rusage['maxrss'] > 0
+    assert resources['max_rss'] == rusage['maxrss']
+    assert resources['peak_rss'] >= resources['max_rss']
+    assert resources['cpu_time'] == round(rusage['utime'] + rusage['stime'],
+                                          3)
+
+
+def test_run_analysis_timeout(monkeypatch, zonation, suite):
+    monkeypatch.setenv('FAKE_DURATION', '30')
+    cmd_args = runner.read_run(suite[:1], zonation)[suite[0]]
+    run_info = runner.run_analysis(suite[0], cmd_args, sample_interval=0,
+                                   timeout=0.5, grace=1.0)
+    assert run_info['ERROR'] == 'TIMEOUT'
+    assert run_info['killed']['limit'] == 'wall clock'
+    assert run_info['measured'] < 10
+    assert 'rusage' in run_info['resources']
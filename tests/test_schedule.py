@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import itertools
+
+import pytest
+
+from ztools.runner import report_predictions
+from ztools.schedule import (lpt_order, parse_shard, predict_makespan,
+                             predicted_durations, shard_runs)
+
+RUNS = ['/suite/do_{0}.bat'.format(i) for i in range(1, 21)]
+DURATIONS = dict((file_path, float(10 + (i * 37) % 90))
+                 for i, file_path in enumerate(RUNS))
+
+
+def test_parse_shard():
+    assert parse_shard('1/4') == (0, 4)
+    assert parse_shard('4/4') == (3, 4)
+    for shard in ['0/4', '5/4', '1/0', 'a/b', '1']:
+        with pytest.raises(ValueError):
+            parse_shard(shard)
+
+
+@pytest.mark.parametrize('durations', [None, DURATIONS])
+def test_shards_are_disjoint_and_cover_suite(durations):
+    shards = [shard_runs(RUNS, index, 3, durations) for index in range(3)]
+    assert sorted(itertools.chain(*shards)) == sorted(RUNS)
+    # The split does not depend on the order or folder of the runs
+    moved = ['/other' + file_path for file_path in reversed(RUNS)]
+    moved_durations = durations and dict(
+        ('/other' + file_path, duration)
+        for file_path, duration in durations.items())
+    assert [sorted(shard_runs(moved, index, 3, moved_durations))
+            for index in range(3)] == [
+        sorted('/other' + file_path for file_path in shard)
+        for shard in shards]
+
+
+def test_balanced_shards():
+    loads = [sum(DURATIONS[file_path]
+                 for file_path in shard_runs(RUNS, index, 3, DURATIONS))
+             for index in range(3)]
+    # LPT is within 4/3 of the optimum, which is at least the mean load
+    assert max(loads) <= 4.0 / 3 * sum(loads) / 3
+
+
+def test_lpt_order():
+    order = lpt_order(RUNS, DURATIONS)
+    assert sorted(order) == sorted(RUNS)
+    assert [DURATIONS[file_path] for file_path in order] == sorted(
+        DURATIONS.values(), reverse=True)
+
+
+def test_predict_makespan():
+    durations = {'a': 6.0, 'b': 4.0, 'c': 3.0, 'd': 3.0}
+    assert predict_makespan(['a', 'b', 'c', 'd'], durations, 1) == 16.0
+    # a then d in one slot, b then c in the other
+    assert predict_makespan(['a', 'b', 'c', 'd'], durations, 2) == 9.0
+    assert predict_makespan(['a', 'b', 'c', 'd'], durations, 8) == 6.0
+    # Longest first is better than shortest first
+    assert (predict_makespan(lpt_order(RUNS, DURATIONS), DURATIONS, 4) <=
+            predict_makespan(sorted(RUNS, key=DURATIONS.get), DURATIONS, 4))
+
+
+def test_predict_makespan_memory_budget():
+    durations = {'a': 6.0, 'b': 4.0, 'c': 3.0, 'd': 3.0}
+    estimates = {'a': 8, 'b': 8, 'c': 2, 'd': 20}
+    # a and c share the budget, b waits for a, d is larger than the budget
+    # and runs alone last
+    assert predict_makespan(['a', 'b', 'c', 'd'], durations, 4, 10,
+                            estimates) == 6.0 + 4.0 + 3.0
+
+
+def test_predicted_durations():
+    history = {'do_1.bat': [{'measured': 10.0}, {'measured': 30.0}],
+               'do_2.bat': [{'measured': 40.0}]}
+    durations = predicted_durations(['/s/do_1.bat', '/s/do_2.bat',
+                                     '/s/do_3.bat'], history)
+    # The unrecorded run is predicted the median of the others
+    assert durations == {'/s/do_1.bat': 20.0, '/s/do_2.bat': 40.0,
+                         '/s/do_3.bat': 40.0}
+    assert predicted_durations(['/s/do_3.bat'], history) == {}
+
+
+def test_report_predictions_per_repetition(capsys):
+    # A benchmark of 3 repetitions: the run time is compared per repetition
+    output = {'/s/do_1.bat': {'measured': 11.0,
+                              'samples': {'measured': [10.0, 11.0, 12.0]}}}
+    report_predictions(output, ['/s/do_1.bat'], {'/s/do_1.bat': 10.0},
+                       40.0, 44.0)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[2].split() == ['do_1.bat', '10', '11', '+10.0%', '-']
+    assert lines[3].split() == ['makespan', '40', '44', '+10.0%', '-']
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+import pytest
+from scipy import stats
+
+from ztools.stats import (bootstrap_ci, mann_whitney_u, median, min_p_value,
+                          min_samples, quantile, summarize)
+
+
+def test_quantile_matches_numpy():
+    values = [3.0, 1.0, 4.0, 1.5, 9.0, 2.6]
+    for q in [0.0, 0.1, 0.25, 0.5, 0.75, 0.99, 1.0]:
+        assert quantile(values, q) == pytest.approx(
+            numpy.percentile(values, 100 * q))
+    assert median([5.0]) == 5.0
+
+
+@pytest.mark.parametrize('m, n', [(3, 4), (5, 5), (10, 7), (20, 20)])
+def test_mann_whitney_exact_matches_scipy(m, n):
+    rng = numpy.random.RandomState(m * n)
+    x = list(rng.normal(0, 1, m))
+    y = list(rng.normal(0.5, 1, n))
+    u, p = mann_whitney_u(x, y)
+    expected = stats.mannwhitneyu(x, y, alternative='two-sided',
+                                  method='exact')
+    assert u == expected.statistic
+    assert p == pytest.approx(expected.pvalue)
+
+
+@pytest.mark.parametrize('m, n', [(5, 6), (30, 40)])
+def test_mann_whitney_ties_match_scipy(m, n):
+    rng = numpy.random.RandomState(m + n)
+    x = list(numpy.round(rng.normal(0, 1, m), 1))
+    y = list(numpy.round(rng.normal(0.3, 1, n), 1))
+    u, p = mann_whitney_u(x, y)
+    expected = stats.mannwhitneyu(x, y, alternative='two-sided',
+                                  method='asymptotic', use_continuity=True)
+    assert u == expected.statistic
+    assert p == pytest.approx(expected.pvalue)
+
+
+def test_mann_whitney_identical_samples():
+    assert mann_whitney_u([1.0, 1.0], [1.0, 1.0]) == (2.0, 1.0)
+
+
+def test_min_p_value():
+    # The p-value of fully separated samples
+    for m, n in [(2, 2), (3, 3), (3, 4), (4, 4), (5, 3)]:
+        assert min_p_value(m, n) == pytest.approx(
+            mann_whitney_u(range(m), range(m, m + n))[1])
+    assert min_p_value(1, 1) == 1.0
+    assert min_samples(0.05) == 4
+    assert min_samples(0.01) == 5
+
+
+def test_bootstrap_ci():
+    samples = list(numpy.random.RandomState(0).normal(10, 1, 30))
+    lower, upper = bootstrap_ci(samples)
+    assert lower < median(samples) < upper
+    # Fixed seed, the same samples give the same interval
+    assert bootstrap_ci(samples) == (lower, upper)
+    assert bootstrap_ci([4.0]) == (4.0, 4.0)
+
+
+def test_summarize():
+    summary = summarize([10.0, 12.0, 11.0, 13.0])
+    assert summary['n'] == 4
+    assert summary['median'] == 11.5
+    assert summary['iqr'] == 1.5
+    assert (summary['min'], summary['max']) == (10.0, 13.0)
+    assert summary['ci'][0] <= 11.5 <= summary['ci'][1]
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from ztools.reader import merge_main, print_table, ZReader
+from ztools.store import format_table, ResultStore
+from ztools.utilities import load_results
+
+
+def run(measured, **kwargs):
+    run_info = {'init': 1.0, 'cellrem': measured - 2.0,
+                'elapsed': measured - 0.5, 'measured': measured,
+                'resources': {'peak_rss': 1024}}
+    run_info.update(kwargs)
+    return run_info
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.db'))
+    yield store
+    store.close()
+
+
+def test_import_and_query(store, result_file):
+    files = [result_file('a.yaml', {'/suite/do_1.bat': run(10.0),
+                                    '/suite/do_2.bat': run(20.0)},
+                         machine='node1'),
+             result_file('b.yaml', {'/suite/do_1.bat': run(12.0),
+                                    '/suite/do_2.bat': {'ERROR': 'OOM'}},
+                         machine='node2', report_time='2024-01-02 12:00:00',
+                         zversion='4.0.0')]
+    assert store.import_files(files) == 4
+    # Importing again does not add duplicates
+    assert store.import_files(files) == 0
+
+    header, rows = store.query(run='do_1%')
+    assert header[:4] == ['report_time', 'machine', 'zversion', 'run']
+    assert [row[1:4] for row in rows] == [('node1', '3.1.11', 'do_1.bat'),
+                                          ('node2', '4.0.0', 'do_1.bat')]
+
+    header, rows = store.query(group_by=['machine'], since='2024-01-01',
+                               until='2024-01-01')
+    assert header == ['machine', 'n', 'min', 'mean', 'max']
+    assert rows == [('node1', 2, 10.0, 15.0, 20.0)]
+
+    # Failed runs are not aggregated
+    header, rows = store.query(group_by=['zversion'])
+    assert rows == [('3.1.11', 2, 10.0, 15.0, 20.0),
+                    ('4.0.0', 1, 12.0, 12.0, 12.0)]
+
+    with pytest.raises(ValueError):
+        store.query(group_by=['data'])
+
+
+def test_import_merged_shards(store, result_file, tmp_path):
+    shards = [result_file('shard_1.yaml', {'/suite/do_1.bat': run(10.0)},
+                          machine='node1'),
+              result_file('shard_2.yaml', {'/suite/do_2.bat': run(20.0),
+                                           '/suite/do_3.bat': run(30.0)},
+                          machine='node2', report_time='2024-01-01 13:00:00')]
+    merged_file = str(tmp_path / 'merged.yaml')
+    merge_main(shards + ['-o', merged_file])
+    merged = load_results(merged_file)
+    assert merged['sys_info'] == load_results(shards[0])['sys_info']
+
+    assert store.import_files([merged_file]) == 3
+    header, rows = store.query()
+    machines = dict((row[3], (row[0], row[1])) for row in rows)
+    assert machines == {'do_1.bat': ('2024-01-01 12:00:00', 'node1'),
+                        'do_2.bat': ('2024-01-01 13:00:00', 'node2'),
+                        'do_3.bat': ('2024-01-01 13:00:00', 'node2')}
+
+    zreader = ZReader(merged_file, merged)
+    assert zreader.machines == {'do_2.bat': 'node2', 'do_3.bat': 'node2'}
+
+
+def test_merge_rejects_inconsistent_shards(result_file, tmp_path, capsys):
+    base = result_file('a.yaml', {'/suite/do_1.bat': run(10.0)})
+    output_file = str(tmp_path / 'merged.yaml')
+    for other in [result_file('b.yaml', {'/suite/do_1.bat': run(10.0)}),
+                  result_file('c.yaml', {'/suite/do_2.bat': run(10.0)},
+                              zversion='4.0.0')]:
+        with pytest.raises(SystemExit):
+            merge_main([base, other, '-o', output_file])
+    errors = capsys.readouterr().err
+    assert 'found in both' in errors
+    assert 'Zonation version' in errors
+
+
+def test_print_table_labels(result_file, capsys):
+    files = [result_file('a.yaml', {'/suite/do_1.bat': run(10.0)}),
+             result_file('b.yaml', {'/suite/do_1.bat': run(11.0),
+                                    '/suite/do_2.bat': run(5.0)})]
+    readers = [ZReader(file_path, load_results(file_path))
+               for file_path in files]
+    readers[1].machines['do_2.bat'] = 'node2'
+    print_table(readers)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ['run', 'node1', '(3.1.11)', 'node1+node2',
+                                '(3.1.11)']
+    assert lines[2].split() == ['do_1.bat', '10', '11']
+    assert lines[3].split() == ['do_2.bat', '-', '5']
+
+
+def test_format_table():
+    table = format_table(['a', 'value'], [('x', 1.5), ('long', None)])
+    assert table.splitlines() == ['a     value', '----  -----',
+                                  'x     1.5', 'long  -']
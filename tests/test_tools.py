@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+import pytest
+
+from ztools import rasters, tools
+from ztools.rasters import open_raster
+from ztools.tools import (DifferenceStatistics, overlap_indices,
+                          raster_differences, replicate_variability,
+                          threshold_range, TileStatistics)
+
+
+def raster_pair(raster_file, shape=(300, 200), dtype=numpy.float32):
+    rng = numpy.random.RandomState(0)
+    data_1 = rng.rand(*shape).astype(dtype)
+    data_2 = data_1.copy()
+    data_2[rng.rand(*shape) < 0.3] += numpy.float32(0.01)
+    data_1[:3, :5] = -1.0
+    data_2[-1, -7:] = -1.0
+    mask = (data_1 != -1.0) & (data_2 != -1.0)
+    return (raster_file('a.img', data_1), raster_file('b.img', data_2),
+            data_1, data_2, mask)
+
+
+def test_difference_statistics_match_numpy():
+    rng = numpy.random.RandomState(1)
+    data_1 = rng.normal(0, 1, (40, 30))
+    data_2 = data_1 + rng.normal(0, 0.1, data_1.shape)
+    mask = rng.rand(*data_1.shape) > 0.1
+
+    stats = DifferenceStatistics()
+    other = DifferenceStatistics()
+    for rows in range(0, 40, 7):
+        window = slice(rows, rows + 7)
+        (stats if rows % 2 else other).update(data_1[window],
+                                              data_2[window], mask[window])
+    stats.merge(other)
+
+    diff = (data_1 - data_2)[mask]
+    differences = stats.differences()
+    assert not stats.equal
+    assert stats.count == diff.size
+    assert differences['mean'] == pytest.approx(diff.mean())
+    assert differences['std'] == pytest.approx(diff.std())
+    assert differences['max'] == diff.max()
+    assert differences['min'] == diff.min()
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_raster_differences(raster_file, threads):
+    file_1, file_2, data_1, data_2, mask = raster_pair(raster_file)
+    differences = raster_differences(open_raster(file_1),
+                                     open_raster(file_2), threads=threads,
+                                     correlation='none')
+    diff = (data_1.astype(numpy.float32) - data_2)[mask]
+    assert differences['mean'] == pytest.approx(float(diff.mean()), rel=1e-4)
+    assert differences['max'] == pytest.approx(float(diff.max()))
+    top_1 = data_1[mask] >= 0.99
+    top_2 = data_2[mask] >= 0.99
+    assert differences['jaccard'][1] == pytest.approx(
+        (top_1 & top_2).sum() / float((top_1 | top_2).sum()))
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    ''' Split the test rasters into many blocks, so that every thread of a
+    pool gets tiles, and count the threads reopening the rasters.
+    '''
+    monkeypatch.setattr(rasters, 'BLOCK_CELLS', 1000)
+    reopened = []
+
+    def reopen_raster(dataset):
+        reopened.append(dataset)
+        return dataset
+    monkeypatch.setattr(tools, 'reopen_raster', reopen_raster)
+    return reopened
+
+
+def assert_close(result, expected):
+    if isinstance(expected, dict):
+        assert sorted(result) == sorted(expected)
+        for key in expected:
+            assert_close(result[key], expected[key])
+    elif isinstance(expected, (list, tuple)):
+        assert len(result) == len(expected)
+        for item, expected_item in zip(result, expected):
+            assert_close(item, expected_item)
+    elif isinstance(expected, float):
+        assert result == pytest.approx(expected, rel=1e-9, abs=1e-12)
+    else:
+        assert result == expected
+
+
+@pytest.mark.parametrize('correlation', ['exact', 'sample'])
+def test_raster_differences_threads(raster_file, tmp_path, small_blocks,
+                                    correlation):
+    file_1, file_2 = raster_pair(raster_file)[:2]
+    results = []
+    for threads in [1, 4]:
+        name = 'threads{0}'.format(threads)
+        results.append(raster_differences(
+            open_raster(file_1), open_raster(file_2), threads=threads,
+            correlation=correlation, sample_size=5000,
+            thresholds=threshold_range(0.5, 0.99, 0.01),
+            difference_file=str(tmp_path / (name + '.img')),
+            pyramid_file=str(tmp_path / (name + '.npz')), tile_size=16))
+    # Both passes over the 60 blocks ran on 4 threads
+    assert len(small_blocks) == 2 * 3 * 2
+
+    single, threaded = results
+    for item in [single, threaded]:
+        item.pop('difference_raster')
+        item.pop('pyramid')
+    assert_close(threaded, single)
+    numpy.testing.assert_array_equal(
+        open_raster(str(tmp_path / 'threads4.img')).GetRasterBand(1)
+        .ReadAsArray(),
+        open_raster(str(tmp_path / 'threads1.img')).GetRasterBand(1)
+        .ReadAsArray())
+    pyramid_1 = numpy.load(str(tmp_path / 'threads1.npz'))
+    pyramid_4 = numpy.load(str(tmp_path / 'threads4.npz'))
+    assert sorted(pyramid_1.files) == sorted(pyramid_4.files)
+    for key in pyramid_1.files:
+        numpy.testing.assert_allclose(pyramid_4[key], pyramid_1[key],
+                                      rtol=1e-9)
+
+
+def test_raster_differences_equal(raster_file):
+    data = numpy.arange(12, dtype=numpy.float32).reshape(3, 4)
+    differences = raster_differences(open_raster(raster_file('a.img', data)),
+                                     open_raster(raster_file('b.img', data)))
+    assert differences == {}
+
+
+def brute_force_tiles(diff, mask, tile_size, tolerance):
+    rows, cols = diff.shape
+    shape = (-(-rows // tile_size), -(-cols // tile_size))
+    tiles = dict((field, numpy.zeros(shape))
+                 for field in TileStatistics.FIELDS)
+    for row in range(rows):
+        for col in range(cols):
+            if not mask[row, col]:
+                continue
+            tile = (row // tile_size, col // tile_size)
+            value = float(diff[row, col])
+            tiles['count'][tile] += 1
+            tiles['sum'][tile] += value
+            tiles['sum_sq'][tile] += value * value
+            tiles['max_abs'][tile] = max(tiles['max_abs'][tile], abs(value))
+            tiles['different'][tile] += abs(value) > tolerance
+    return tiles
+
+
+def test_tile_statistics_blocks_across_tiles():
+    rng = numpy.random.RandomState(0)
+    diff = rng.normal(0, 1, (53, 71)).astype(numpy.float32)
+    diff[rng.rand(*diff.shape) < 0.5] = 0.0
+    mask = rng.rand(*diff.shape) > 0.2
+    expected = brute_force_tiles(diff, mask, 8, 1e-08)
+
+    # Blocks of 7 x 13 cells are not aligned with the 8 x 8 tiles
+    stats = TileStatistics(71, 53, tile_size=8)
+    other = TileStatistics(71, 53, tile_size=8)
+    for i, yoff in enumerate(range(0, 53, 7)):
+        for xoff in range(0, 71, 13):
+            window = (slice(yoff, yoff + 7), slice(xoff, xoff + 13))
+            (stats if i % 2 else other).update(diff[window], mask[window],
+                                               xoff, yoff)
+    stats.merge(other)
+
+    for field in TileStatistics.FIELDS:
+        assert numpy.allclose(stats.tiles[field], expected[field]), field
+    assert stats.tiles['count'].dtype == numpy.int64
+
+
+def test_tile_statistics_pyramid_and_hotspots():
+    diff = numpy.zeros((20, 20))
+    diff[12:16, 4:8] = 2.0
+    stats = TileStatistics(20, 20, tile_size=4)
+    stats.update(diff, numpy.ones(diff.shape, dtype=bool), 0, 0)
+
+    levels = stats.pyramid()
+    assert [level['count'].shape for level in levels] == [
+        (5, 5), (3, 3), (2, 2), (1, 1)]
+    assert levels[-1]['count'][0, 0] == 400
+    assert levels[-1]['max_abs'][0, 0] == 2.0
+
+    hotspots = stats.hotspots()
+    assert len(hotspots) == 1
+    assert hotspots[0]['window'] == [4, 12, 4, 4]
+    assert hotspots[0]['max_abs'] == 2.0
+
+
+def test_overlap_matches_per_threshold_counts():
+    rng = numpy.random.RandomState(2)
+    data_1 = rng.rand(50, 40).astype(numpy.float32)
+    data_2 = numpy.clip(data_1 + rng.normal(0, 0.05, data_1.shape), 0,
+                        1).astype(numpy.float32)
+    mask = numpy.ones(data_1.shape, dtype=bool)
+    thresholds = threshold_range(0.5, 0.99, 0.01)
+
+    stats = DifferenceStatistics(thresholds=thresholds)
+    other = DifferenceStatistics(thresholds=thresholds)
+    stats.update(data_1[:20], data_2[:20], mask[:20])
+    other.update(data_1[20:], data_2[20:], mask[20:])
+    stats.merge(other)
+    overlap = stats.overlap()
+
+    assert overlap['thresholds'] == pytest.approx(list(thresholds))
+    for i, threshold in enumerate(thresholds):
+        top_1 = data_1 >= numpy.float32(threshold)
+        top_2 = data_2 >= numpy.float32(threshold)
+        both = float((top_1 & top_2).sum())
+        n_1, n_2 = float(top_1.sum()), float(top_2.sum())
+        assert overlap['jaccard'][i] == pytest.approx(
+            both / (n_1 + n_2 - both) if n_1 + n_2 else 1.0)
+        assert overlap['dice'][i] == pytest.approx(
+            2 * both / (n_1 + n_2) if n_1 + n_2 else 1.0)
+        assert overlap['overlap'][i] == pytest.approx(
+            both / min(n_1, n_2) if min(n_1, n_2) else 1.0)
+    # The single treshold of the Jaccard index agrees with the histogram
+    assert stats.differences()['jaccard'][1] == pytest.approx(
+        overlap['jaccard'][-1])
+
+
+def test_overlap_indices_without_cells():
+    counts = numpy.array([0, 2])
+    overlap = overlap_indices(counts, numpy.array([0, 4]),
+                              numpy.array([0, 2]))
+    assert overlap == {'jaccard': [1.0, 0.5], 'dice': [1.0, 2.0 / 3],
+                       'overlap': [1.0, 1.0]}
+
+
+@pytest.mark.parametrize('threads', [1, 2])
+def test_replicate_variability_matches_numpy(raster_file, tmp_path, threads):
+    rng = numpy.random.RandomState(3)
+    base = rng.rand(60, 50)
+    replicates = [(base + rng.normal(0, 0.01, base.shape)).astype(
+                  numpy.float32) for i in range(4)]
+    replicates[0][:2] = base[:2]
+    for replicate in replicates[1:]:
+        replicate[:2] = replicates[0][:2]
+    replicates[2][10, :5] = -1.0
+    files = [raster_file('r{0}.img'.format(i), replicate)
+             for i, replicate in enumerate(replicates)]
+    output_files = {'variance': str(tmp_path / 'variance.img'),
+                    'range': str(tmp_path / 'range.img')}
+
+    summary = replicate_variability([open_raster(item) for item in files],
+                                    output_files, threads=threads)
+
+    stack = numpy.array(replicates, dtype=numpy.float64)
+    valid = (stack != -1.0).all(axis=0)
+    variance = stack.var(axis=0, ddof=1)[valid]
+    ranges = numpy.ptp(stack, axis=0)[valid]
+    assert summary['replicates'] == 4
+    assert summary['cells'] == valid.sum()
+    assert summary['partial_cells'] == 5
+    assert summary['unstable_cells'] == numpy.count_nonzero(ranges > 1e-08)
+    assert summary['mean']['mean'] == pytest.approx(
+        stack.mean(axis=0)[valid].mean())
+    assert summary['variance']['mean'] == pytest.approx(variance.mean())
+    assert summary['variance']['max'] == pytest.approx(variance.max())
+    assert summary['std']['mean'] == pytest.approx(
+        numpy.sqrt(variance).mean())
+    assert summary['range']['max'] == pytest.approx(ranges.max())
+
+    written = open_raster(output_files['variance']).GetRasterBand(1)
+    values = written.ReadAsArray()
+    assert written.GetNoDataValue() == -1.0
+    assert (values[~valid] == -1.0).all()
+    assert numpy.allclose(values[valid], variance, rtol=1e-5, atol=1e-12)
+
+
+def test_replicate_variability_threads(raster_file, tmp_path, small_blocks):
+    rng = numpy.random.RandomState(4)
+    files = [raster_file('r{0}.img'.format(i),
+                         rng.rand(60, 50).astype(numpy.float32))
+             for i in range(3)]
+    results = []
+    for threads in [1, 3]:
+        output_files = {'variance': str(tmp_path / 'variance{0}.img'.format(
+            threads))}
+        results.append(replicate_variability(
+            [open_raster(item) for item in files], output_files,
+            threads=threads))
+    # The 3 rasters were reopened by 2 of the 3 threads
+    assert len(small_blocks) == 2 * 3
+    assert_close(results[1], results[0])
+    numpy.testing.assert_array_equal(
+        open_raster(str(tmp_path / 'variance3.img')).GetRasterBand(1)
+        .ReadAsArray(),
+        open_raster(str(tmp_path / 'variance1.img')).GetRasterBand(1)
+        .ReadAsArray())
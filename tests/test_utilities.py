@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from ztools.utilities import (get_zonation_info, linux_distribution,
+                              parse_size)
+
+
+def test_linux_distribution(tmp_path):
+    release_file = tmp_path / 'os-release'
+    release_file.write_text('# comment\nNAME="Debian GNU/Linux"\n'
+                            'VERSION_ID="12"\nVERSION_CODENAME=bookworm\n')
+    assert linux_distribution([str(tmp_path / 'missing'),
+                               str(release_file)]) == (
+        'Debian GNU/Linux', '12', 'bookworm')
+    assert linux_distribution([str(tmp_path / 'missing')]) == ('', '', '')
+
+
+def test_get_zonation_info(zonation):
+    assert get_zonation_info(zonation) == ('3', '1', '11')
+
+
+def test_parse_size():
+    assert parse_size('200G') == 200 * 1024 ** 3
+    assert parse_size('512') == 512
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import numpy
+import yaml
+
+from ztools import tools
+from ztools.cache import HashCache
+from ztools.rasters import payload_digest
+from ztools.tools import (checksum_pairs, compare_pair, compare_pairs,
+                          raster_pairs)
+from ztools.utilities import ResultsLoader
+
+
+def output_folders(tmp_path, raster_file, names=('a', 'b', 'c')):
+    ''' Write two output folders with a rank raster per name, the rasters
+    named 'b' differ.
+    '''
+    for folder in ['out1', 'out2']:
+        (tmp_path / folder).mkdir()
+    data = numpy.random.RandomState(0).rand(20, 30).astype('float32')
+    for name in names:
+        raster_file('out1/{0}.rank.compressed.img'.format(name), data)
+        other = data.copy()
+        if name == 'b':
+            other[:10] = other[:10][::-1]
+        raster_file('out2/{0}.rank.compressed.img'.format(name), other)
+    return str(tmp_path / 'out1'), str(tmp_path / 'out2')
+
+
+def failing_worker(pair, options):
+    if os.path.basename(pair[0]).startswith('b'):
+        raise ValueError('cannot compare')
+    return dict(tools.group_files(pair), size=options['size'])
+
+
+def test_raster_pairs(tmp_path, raster_file, capsys):
+    folder1, folder2 = output_folders(tmp_path, raster_file)
+    raster_file('out1/d.rank.compressed.img', numpy.zeros((2, 2)))
+    pairs = raster_pairs(folder1, folder2, suffix='.rank.*', ext='.img')
+    assert pairs == [(os.path.join(folder1, name + '.rank.compressed.img'),
+                      os.path.join(folder2, name + '.rank.compressed.img'))
+                     for name in 'abc']
+    assert 'Raster d.rank.compressed.img not found in folder(s) 2' in \
+        capsys.readouterr().out
+
+
+def test_compare_pair(tmp_path, raster_file):
+    folder1, folder2 = output_folders(tmp_path, raster_file)
+    pair = (os.path.join(folder1, 'b.rank.compressed.img'),
+            os.path.join(folder2, 'b.rank.compressed.img'))
+    differences = compare_pair(pair, {'difference_dir': str(tmp_path),
+                                      'raster_ext': '.img', 'tile_size': 8})
+    assert (differences['file1'], differences['file2']) == pair
+    assert differences['max'] > 0
+    assert differences['difference_raster'] == str(
+        tmp_path / 'b.rank.compressed.difference.img')
+    assert os.path.exists(differences['difference_raster'])
+    assert os.path.exists(differences['pyramid'])
+
+
+def test_compare_pairs(tmp_path, raster_file):
+    pairs = [(name + '1', name + '2') for name in 'abcd']
+    finished = []
+    # Each pair alone fills the budget, so the pairs run one at a time
+    results = compare_pairs(pairs, {'size': 1}, jobs=2, mem_budget=10,
+                            estimates=dict((pair, 10) for pair in pairs),
+                            on_finish=finished.append, worker=failing_worker)
+    assert results == finished
+    assert sorted(item['file1'] for item in results) == ['a1', 'b1', 'c1',
+                                                         'd1']
+    errors = [item for item in results if 'ERROR' in item]
+    assert errors == [{'file1': 'b1', 'file2': 'b2',
+                       'ERROR': 'cannot compare'}]
+
+
+def test_main(tmp_path, raster_file, monkeypatch):
+    folder1, folder2 = output_folders(tmp_path, raster_file)
+    output_file = str(tmp_path / 'differences.yaml')
+    monkeypatch.setattr(sys, 'argv', [
+        'zdiff', folder1, folder2, '-o', output_file, '-j', '2',
+        '-m', '1G', '--no-checksum', '-d', str(tmp_path / 'diffs')])
+    tools.main()
+
+    with open(output_file) as f:
+        results = yaml.load(f, Loader=ResultsLoader)
+    by_name = dict((os.path.basename(item['file1']), item)
+                   for item in results)
+    assert sorted(by_name) == ['a.rank.compressed.img',
+                               'b.rank.compressed.img',
+                               'c.rank.compressed.img']
+    # Equal rasters only have their file names
+    assert by_name['a.rank.compressed.img'] == {
+        'file1': os.path.join(folder1, 'a.rank.compressed.img'),
+        'file2': os.path.join(folder2, 'a.rank.compressed.img')}
+    assert by_name['b.rank.compressed.img']['kendall_tau'][0] < 1.0
+    assert (tmp_path / 'diffs' /
+            'b.rank.compressed.difference.img').exists()
+
+
+def test_checksum_pairs(tmp_path, raster_file):
+    folder1, folder2 = output_folders(tmp_path, raster_file)
+    pairs = raster_pairs(folder1, folder2, suffix='.rank.*', ext='.img')
+    calls = []
+
+    def digest(file_path):
+        calls.append(file_path)
+        return payload_digest(file_path)
+
+    cache_file = str(tmp_path / 'hashes.json')
+    hash_cache = HashCache(cache_file, digest)
+    identical = checksum_pairs(pairs, hash_cache, jobs=2)
+    assert sorted(identical) == [pairs[0], pairs[2]]
+    assert identical[pairs[0]] == payload_digest(pairs[0][1])
+    assert len(calls) == 6
+
+    # Unchanged rasters are not read again
+    hash_cache.save()
+    assert checksum_pairs(pairs, HashCache(cache_file, digest)) == identical
+    assert len(calls) == 6
+
+
+def test_checksum_pairs_unreadable(tmp_path, raster_file, capsys):
+    folder1, folder2 = output_folders(tmp_path, raster_file)
+    pairs = raster_pairs(folder1, folder2, suffix='.rank.*', ext='.img')
+    os.remove(pairs[0][0])
+    identical = checksum_pairs(pairs, HashCache(str(tmp_path / 'h.json'),
+                                                payload_digest))
+    assert sorted(identical) == [pairs[2]]
+    assert 'WARNING: Could not hash' in capsys.readouterr().out
+
+
+def test_main_checksum(tmp_path, raster_file, monkeypatch):
+    folder1, folder2 = output_folders(tmp_path, raster_file)
+    output_file = str(tmp_path / 'differences.yaml')
+    cache_file = str(tmp_path / 'hashes.json')
+    monkeypatch.setattr(sys, 'argv', [
+        'zdiff', folder1, folder2, '-o', output_file, '-j', '1',
+        '--hash-cache', cache_file])
+    tools.main()
+
+    with open(output_file) as f:
+        results = yaml.load(f, Loader=ResultsLoader)
+    by_name = dict((os.path.basename(item['file1']), item)
+                   for item in results)
+    for name in ['a.rank.compressed.img', 'c.rank.compressed.img']:
+        assert by_name[name]['checksum'] == payload_digest(
+            os.path.join(folder1, name))
+        assert 'max' not in by_name[name]
+    assert 'checksum' not in by_name['b.rank.compressed.img']
+    assert by_name['b.rank.compressed.img']['max'] > 0
+    assert os.path.isfile(cache_file)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import shutil
+
+import yaml
+
+from ztools.memory import referenced_files
+from ztools.utilities import ResultsLoader
+
+# Default location of the zrunner caches
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ztools')
+
+
+def file_digest(file_path, algorithm='sha1', block_size=1024 * 1024):
+    ''' Calculate the hash of a file's contents reading it in large blocks.
+
+    @param file_path String path to a file
+    @param algorithm String name of a hashlib algorithm
+    @param block_size int number of bytes read at a time
+    @return digest String hex digest
+    '''
+    digest = hashlib.new(algorithm)
+    with open(file_path, 'rb') as f:
+        block = f.read(block_size)
+        while block:
+            digest.update(block)
+            block = f.read(block_size)
+    return digest.hexdigest()
+
+
+class HashCache(object):
+    ''' Persistent cache of file content hashes.
+
+    Hashes are keyed by absolute path and are only recalculated when the
+    size or modification time of the file changes, so checking large rasters
+    that have not changed is cheap.
+    '''
+
+    def __init__(self, cache_file, hash_function=file_digest):
+        self.cache_file = cache_file
+        self.hash_function = hash_function
+        self._hashes = {}
+        self._dirty = False
+
+        try:
+            with open(cache_file, 'r') as f:
+                self._hashes = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+
+    def file_hash(self, file_path):
+        ''' Get the hash of a file, calculating it only if needed.
+
+        @param file_path String path to a file
+        @return digest String hex digest
+        '''
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        entry = self._hashes.get(file_path)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+            return entry[2]
+
+        digest = self.hash_function(file_path)
+        self._hashes[file_path] = [stat.st_size, stat.st_mtime, digest]
+        self._dirty = True
+        return digest
+
+    def save(self):
+        ''' Write the cache to disk if it has changed. '''
+        if not self._dirty:
+            return
+        cache_dir = os.path.dirname(self.cache_file)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Write to a temporary file first so an interrupted write does not
+        # corrupt the cache
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self._hashes, f)
+        os.rename(tmp_file, self.cache_file)
+        self._dirty = False
+
+
+def run_fingerprint(file_path, cmd_args, z_info, hash_cache):
+    ''' Calculate a fingerprint identifying the inputs of a Zonation run.
+
+    The fingerprint covers the command line arguments (except the
+    executable), the contents of the dat, spp and raster files referenced by
+    the run and the Zonation version. Runs with equal fingerprints produce
+    the same results.
+
+    @param file_path String path to the bat/sh file
+    @param cmd_args list of Zonation command line arguments
+    @param z_info tuple Zonation version as returned by get_zonation_info()
+    @param hash_cache HashCache used for the file contents
+    @return fingerprint String hex digest
+    '''
+    fingerprint = hashlib.sha1()
+    fingerprint.update(' '.join(cmd_args[1:]).encode('utf-8'))
+    fingerprint.update('.'.join(z_info).encode('utf-8'))
+
+    base_dir = os.path.dirname(file_path)
+    files = referenced_files(file_path, cmd_args)
+    for key in ['dat', 'spp', 'rasters', 'other']:
+        for input_file in sorted(files[key]):
+            fingerprint.update(os.path.relpath(input_file,
+                                               base_dir).encode('utf-8'))
+            fingerprint.update(hash_cache.file_hash(input_file).encode('ascii'))
+
+    return fingerprint.hexdigest()
+
+
+class ResultCache(object):
+    ''' Cache of run results keyed by run fingerprint.
+
+    Each entry holds the per-run result dict and a copy of the run info
+    file produced by Zonation.
+    '''
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = os.path.join(cache_dir, 'runs')
+
+    def get(self, fingerprint, runinfo_file):
+        ''' Get cached results of a run and restore its run info file.
+
+        @param fingerprint String run fingerprint
+        @param runinfo_file String path where the run info file is restored
+        @return run_info dict of cached results or None if not cached
+        '''
+        entry_dir = self._entry_dir(fingerprint)
+        try:
+            with open(os.path.join(entry_dir, 'result.yaml'), 'r') as f:
+                run_info = yaml.load(f, Loader=ResultsLoader)
+            output_dir = os.path.dirname(runinfo_file)
+            if output_dir and not os.path.isdir(output_dir):
+                os.makedirs(output_dir)
+            shutil.copyfile(os.path.join(entry_dir, 'run_info.txt'),
+                            runinfo_file)
+        except (IOError, OSError, yaml.YAMLError):
+            return None
+
+        run_info['cached'] = True
+        return run_info
+
+    def put(self, fingerprint, run_info, runinfo_file):
+        ''' Store the results of a successful run.
+
+        Failed runs (results with an ERROR) are not cached.
+
+        @param fingerprint String run fingerprint
+        @param run_info dict of run results
+        @param runinfo_file String path to the run info file of the run
+        '''
+        if 'ERROR' in run_info or not os.path.isfile(runinfo_file):
+            return
+        entry_dir = self._entry_dir(fingerprint)
+        if not os.path.isdir(entry_dir):
+            os.makedirs(entry_dir)
+        shutil.copyfile(runinfo_file, os.path.join(entry_dir, 'run_info.txt'))
+        with open(os.path.join(entry_dir, 'result.yaml'), 'w') as f:
+            f.write(yaml.safe_dump(run_info))
+
+    def _entry_dir(self, fingerprint):
+        return os.path.join(self.cache_dir, fingerprint[:2], fingerprint)
@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import os
+import platform
+import signal
+import time
+
+from ztools.runner import run_repeated_async
+from ztools.utilities import get_system_info
+
+# Seconds between heartbeats sent by idle and busy workers
+HEARTBEAT_INTERVAL = 10.0
+
+# Seconds without any message after which a worker is considered lost
+WORKER_TIMEOUT = 60.0
+
+# Maximum length of a single message line in bytes
+MESSAGE_LIMIT = 16 * 1024 * 1024
+
+
+def parse_address(address, default_host='localhost'):
+    ''' Parse a HOST:PORT (or PORT) address.
+
+    @param address String address
+    @param default_host String host used if only the port is given
+    @return host, port tuple of String and int
+    '''
+    host, _, port = address.rpartition(':')
+    try:
+        return host or default_host, int(port)
+    except ValueError:
+        raise ValueError('Invalid address (HOST:PORT): {0}'.format(address))
+
+
+async def _send(writer, message, lock=None):
+    ''' Send a message as a line of JSON.
+
+    @param writer asyncio.StreamWriter
+    @param message dict
+    @param lock asyncio.Lock serialising writers sharing the stream
+    '''
+    data = json.dumps(message, default=str).encode('utf-8') + b'\n'
+    if lock is None:
+        writer.write(data)
+        await writer.drain()
+        return
+    async with lock:
+        writer.write(data)
+        await writer.drain()
+
+
+async def _receive(reader):
+    ''' Receive a message sent with _send().
+
+    @param reader asyncio.StreamReader
+    @return message dict or None if the connection was closed
+    '''
+    line = await reader.readline()
+    if not line:
+        return None
+    return json.loads(line.decode('utf-8'))
+
+
+class Coordinator(object):
+    ''' Hands out the runs of a suite to workers connecting over TCP.
+
+    The protocol is newline delimited JSON. A worker opens with
+    {"type": "hello", "name": ..., "slots": N, "sys_info": ...} and is sent
+    up to N {"type": "run", "file_path": ..., "cmd_args": [...],
+    "options": {...}} messages at a time. It answers each with
+    {"type": "result", "file_path": ..., "run_info": {...}} and sends
+    {"type": "heartbeat"} while its runs are in progress. When all runs are
+    done the workers are sent {"type": "done"}.
+
+    The suite deadline of the run options (time.monotonic() of the
+    coordinator) is sent as the seconds left until it, "time_left", when
+    the run is handed out. The clocks of the machines need not agree, each
+    worker sets its own deadline from the seconds left.
+
+    A worker is lost when its connection closes or it has not sent anything
+    in worker_timeout seconds. Its unfinished runs are queued again ahead of
+    the runs not handed out yet, so runs are still started in the order of
+    cmd_args (e.g. longest first), and given to the next worker with a free
+    slot.
+
+    The run_info of each run gets the get_system_info() of the worker that
+    ran it under 'sys_info' and the worker name under 'worker'.
+    '''
+
+    def __init__(self, cmd_args, run_options=None, on_start=None,
+                 on_finish=None, worker_timeout=WORKER_TIMEOUT):
+        '''
+        @param cmd_args dict of command sequences as returned by read_run()
+        @param run_options dict of keyword arguments passed to
+                           run_repeated_async() on the workers
+        @param on_start callable(file_path, run_no) called when a run is
+                        handed out
+        @param on_finish callable(file_path, run_no, run_info) called when
+                         a run finishes
+        @param worker_timeout float seconds of silence after which a worker
+                              is lost
+        '''
+        self.cmd_args = dict(cmd_args)
+        self.run_options = dict(run_options or {})
+        # Workers interrupt their runs themselves
+        self.run_options.pop('interrupt', None)
+        self.on_start = on_start
+        self.on_finish = on_finish
+        self.worker_timeout = worker_timeout
+        self.output = {}
+
+        # Pending runs by their position in cmd_args
+        self._pending = None
+        self._order = dict((file_path, i)
+                           for i, file_path in enumerate(self.cmd_args))
+        self._finished = None
+        self._writers = set()
+        self._run_no = 0
+        self._run_nos = {}
+        self._n_workers = 0
+
+    async def serve(self, host, port):
+        ''' Serve the suite until all runs are done or interrupted.
+
+        @param host String address to listen on
+        @param port int port to listen on
+        @return output dict of per-run dicts keyed by the bat/sh file path
+        '''
+        self._pending = asyncio.PriorityQueue()
+        for item in self.cmd_args.items():
+            self._queue(*item)
+        self._finished = asyncio.Event()
+        if not self.cmd_args:
+            return self.output
+
+        loop = asyncio.get_event_loop()
+        handled = []
+        for signum in [signal.SIGINT, getattr(signal, 'SIGTERM', None)]:
+            try:
+                loop.add_signal_handler(signum, self._finished.set)
+                handled.append(signum)
+            except (NotImplementedError, RuntimeError, TypeError,
+                    ValueError):
+                pass
+
+        server = await asyncio.start_server(self._handle, host, port,
+                                            limit=MESSAGE_LIMIT)
+        print('INFO: Serving {0} runs on {1}'.format(
+              len(self.cmd_args), ', '.join(
+                  '{0}:{1}'.format(*sock.getsockname()[:2])
+                  for sock in server.sockets)))
+        try:
+            await self._finished.wait()
+        finally:
+            for signum in handled:
+                loop.remove_signal_handler(signum)
+            server.close()
+            for writer in list(self._writers):
+                try:
+                    await _send(writer, {'type': 'done'})
+                except (ConnectionError, OSError):
+                    pass
+                writer.close()
+            await server.wait_closed()
+
+        n_missing = len(self.cmd_args) - len(self.output)
+        if n_missing:
+            print('WARNING: Interrupted, {0} runs not finished'.format(
+                  n_missing))
+        return self.output
+
+    async def _handle(self, reader, writer):
+        ''' Serve a single worker connection. '''
+        self._writers.add(writer)
+        lock = asyncio.Lock()
+        in_flight = {}
+        dispatcher = None
+        name = '{0}:{1}'.format(*writer.get_extra_info('peername')[:2])
+        try:
+            hello = await asyncio.wait_for(_receive(reader),
+                                           self.worker_timeout)
+            if not hello or hello.get('type') != 'hello':
+                print('WARNING: Unexpected greeting from {0}'.format(name))
+                return
+            self._n_workers += 1
+            name = '{0}#{1}'.format(hello.get('name') or name,
+                                    self._n_workers)
+            sys_info = hello.get('sys_info')
+            slots = asyncio.Semaphore(max(int(hello.get('slots') or 1), 1))
+            print('INFO: Worker {0} connected with {1} slots'.format(
+                  name, hello.get('slots')))
+
+            dispatcher = asyncio.ensure_future(
+                self._dispatch(writer, lock, slots, in_flight))
+            while not self._finished.is_set():
+                message = await asyncio.wait_for(_receive(reader),
+                                                 self.worker_timeout)
+                if message is None:
+                    raise ConnectionError('connection closed')
+                if message.get('type') != 'result':
+                    continue
+                file_path = message['file_path']
+                if file_path not in in_flight:
+                    continue
+                del in_flight[file_path]
+                slots.release()
+                run_info = message['run_info']
+                run_info['sys_info'] = sys_info
+                run_info['worker'] = name
+                self._record(file_path, run_info)
+        except (asyncio.TimeoutError, ConnectionError, OSError,
+                ValueError) as e:
+            if not self._finished.is_set():
+                print('WARNING: Lost worker {0}: {1}'.format(
+                      name, str(e) or type(e).__name__))
+        finally:
+            if dispatcher:
+                dispatcher.cancel()
+            # Hand out the unfinished runs of the worker again
+            for item in in_flight.items():
+                if item[0] not in self.output:
+                    print('INFO: Queueing {0} again'.format(item[0]))
+                    self._queue(*item)
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, writer, lock, slots, in_flight):
+        ''' Send pending runs to a worker whenever it has a free slot. '''
+        while True:
+            await slots.acquire()
+            _, file_path, cmd_args = await self._pending.get()
+            in_flight[file_path] = cmd_args
+            if file_path not in self._run_nos:
+                self._run_no += 1
+                self._run_nos[file_path] = self._run_no
+                if self.on_start:
+                    self.on_start(file_path, self._run_no)
+            try:
+                await _send(writer, {'type': 'run', 'file_path': file_path,
+                                     'cmd_args': cmd_args,
+                                     'options': self._options()}, lock)
+            except (ConnectionError, OSError):
+                # The connection handler notices and queues the run again
+                return
+
+    def _options(self):
+        ''' Get the run options sent with a run. '''
+        options = dict(self.run_options)
+        deadline = options.pop('deadline', None)
+        if deadline is not None:
+            options['time_left'] = deadline - time.monotonic()
+        return options
+
+    def _queue(self, file_path, cmd_args):
+        self._pending.put_nowait((self._order[file_path], file_path,
+                                  cmd_args))
+
+    def _record(self, file_path, run_info):
+        self.output[file_path] = run_info
+        if self.on_finish:
+            self.on_finish(file_path, self._run_nos[file_path], run_info)
+        if len(self.output) == len(self.cmd_args):
+            self._finished.set()
+
+
+async def work(host, port, jobs=1, name=None):
+    ''' Run the runs handed out by a coordinator until it is done.
+
+    Results are sent back as each run finishes. If the worker is interrupted
+    (SIGINT or SIGTERM) or loses the coordinator, its runs in progress are
+    terminated and not reported, so the coordinator runs them elsewhere.
+
+    @param host String coordinator host
+    @param port int coordinator port
+    @param jobs int number of concurrent runs
+    @param name String worker name (default: host name and pid)
+    @return n_runs int number of runs completed
+    '''
+    if name is None:
+        name = '{0}:{1}'.format(platform.node(), os.getpid())
+    reader, writer = await asyncio.open_connection(host, port,
+                                                   limit=MESSAGE_LIMIT)
+    lock = asyncio.Lock()
+    interrupt = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    handled = []
+    for signum in [signal.SIGINT, getattr(signal, 'SIGTERM', None)]:
+        try:
+            loop.add_signal_handler(signum, interrupt.set)
+            handled.append(signum)
+        except (NotImplementedError, RuntimeError, TypeError, ValueError):
+            pass
+
+    await _send(writer, {'type': 'hello', 'name': name, 'slots': jobs,
+                         'sys_info': get_system_info()}, lock)
+    print('INFO: Connected to {0}:{1} as {2}'.format(host, port, name))
+
+    runs = set()
+    n_runs = 0
+
+    async def run(message):
+        nonlocal n_runs
+        options = dict(message.get('options') or {}, interrupt=interrupt)
+        time_left = options.pop('time_left', None)
+        if time_left is not None:
+            options['deadline'] = time.monotonic() + time_left
+        try:
+            run_info = await run_repeated_async(message['file_path'],
+                                                message['cmd_args'],
+                                                **options)
+        except Exception as e:
+            print('ERROR: Run {0} failed: {1}'.format(message['file_path'],
+                                                      e))
+            run_info = {'ERROR': str(e)}
+        if interrupt.is_set():
+            return
+        try:
+            await _send(writer, {'type': 'result',
+                                 'file_path': message['file_path'],
+                                 'run_info': run_info}, lock)
+            n_runs += 1
+        except (ConnectionError, OSError) as e:
+            print('WARNING: Cannot send the results of {0}: {1}'.format(
+                  message['file_path'], e))
+
+    async def heartbeat():
+        try:
+            while True:
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+                await _send(writer, {'type': 'heartbeat'}, lock)
+        except (ConnectionError, OSError):
+            # Noticed by the receiving side
+            pass
+
+    beat = asyncio.ensure_future(heartbeat())
+    interrupted = asyncio.ensure_future(interrupt.wait())
+    try:
+        while True:
+            receiving = asyncio.ensure_future(_receive(reader))
+            await asyncio.wait([receiving, interrupted],
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not receiving.done():
+                receiving.cancel()
+                break
+            try:
+                message = receiving.result()
+            except (ConnectionError, OSError, ValueError) as e:
+                print('WARNING: Lost coordinator: {0}'.format(e))
+                break
+            if message is None or message.get('type') == 'done':
+                break
+            if message.get('type') == 'run':
+                task = asyncio.ensure_future(run(message))
+                runs.add(task)
+                task.add_done_callback(runs.discard)
+    finally:
+        # Runs still in progress are not wanted anymore
+        interrupt.set()
+        if runs:
+            await asyncio.wait(list(runs))
+        beat.cancel()
+        interrupted.cancel()
+        for signum in handled:
+            loop.remove_signal_handler(signum)
+        writer.close()
+    return n_runs
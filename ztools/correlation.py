@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+
+import numpy
+
+CORRELATION_METHODS = ['exact', 'sample', 'none']
+
+
+def _dense_ranks(values):
+    ''' Rank values from 0 so that equal values get the same rank.
+
+    @param values numpy array
+    @return ranks, order tuple of int64 rank array and the sorting order
+    '''
+    order = numpy.argsort(values, kind='stable')
+    sorted_values = values[order]
+    ranks = numpy.empty(values.size, dtype=numpy.int64)
+    ranks[order] = numpy.concatenate(
+        ([0], numpy.cumsum(sorted_values[1:] != sorted_values[:-1])))
+    return ranks, order
+
+
+def _tie_counts(ranks):
+    ''' Tie statistics of dense ranks used by Kendall's tau-b.
+
+    @param ranks numpy int array of dense ranks
+    @return tuple of the number of tied pairs and the sums of
+            t(t-1)(t-2) and t(t-1)(2t+5) over groups of t ties
+    '''
+    counts = numpy.bincount(ranks).astype(numpy.float64)
+    counts = counts[counts > 1]
+    return (float((counts * (counts - 1) / 2).sum()),
+            float((counts * (counts - 1) * (counts - 2)).sum()),
+            float((counts * (counts - 1) * (2 * counts + 5)).sum()))
+
+
+def count_inversions(keys):
+    ''' Count the pairs i < j with keys[i] > keys[j].
+
+    Bottom-up merge sort: at each level neighbouring sorted runs are merged
+    with a stable sort (which merges the two runs in linear time), and for
+    every element of a right run the number of larger elements in its left
+    run is read from the merged order. All runs of a level are processed at
+    once with numpy, so the cost is O(n log n) with little Python overhead.
+
+    @param keys numpy array of non-negative integers (e.g. dense ranks)
+    @return inversions int number of inverted pairs
+    '''
+    keys = numpy.asarray(keys, dtype=numpy.int64)
+    n = keys.size
+    if n < 2:
+        return 0
+
+    span = int(keys.max()) + 1
+    # Combined pair and key sort keys must fit in int64, otherwise the pairs
+    # and keys are sorted as two keys (slower)
+    combined = span <= 2 ** 62 // n
+    position = numpy.arange(n, dtype=numpy.int64)
+    inversions = 0
+    level = 0
+    while (1 << level) < n:
+        width = 1 << level
+        pair = position >> (level + 1)
+
+        # Offsetting by pair keeps the pairs in place in a single stable
+        # sort. Equal keys keep the left element first, so ties do not count.
+        if combined:
+            order = numpy.argsort(pair * span + keys, kind='stable')
+        else:
+            order = numpy.lexsort((keys, pair))
+        merged_right = ((order >> level) & 1).astype(bool)
+
+        # Every pair with a right run has a full left run of width elements
+        # and all earlier pairs are full, so the left elements of its pair
+        # merged before a right element are the left elements merged so far
+        # minus those of the earlier pairs.
+        left_seen = numpy.cumsum(~merged_right)[merged_right]
+        n_right = left_seen.size
+        inversions += int(n_right * width +
+                          width * int(pair[merged_right].sum()) -
+                          int(left_seen.sum()))
+
+        keys = keys[order]
+        level += 1
+
+    return inversions
+
+
+def kendall_tau(x, y):
+    ''' Kendall's tau-b of two samples in O(n log n) time.
+
+    Knight's algorithm: after sorting the pairs by x (and y within ties of
+    x), the discordant pairs are the inversions of y. The p-value uses the
+    normal approximation with tie corrected variance, like
+    scipy.stats.kendalltau for large samples.
+
+    @param x numpy array
+    @param y numpy array of the same size
+    @return tau, p tuple of the correlation and its two-sided p-value
+    '''
+    x = numpy.asarray(x).ravel()
+    y = numpy.asarray(y).ravel()
+    n = x.size
+    if n < 2:
+        return float('nan'), float('nan')
+
+    x_ranks, _ = _dense_ranks(x)
+    y_ranks, _ = _dense_ranks(y)
+
+    # Sort by x, then by y within ties of x
+    order = numpy.lexsort((y_ranks, x_ranks))
+    x_sorted = x_ranks[order]
+    y_sorted = y_ranks[order]
+
+    # Pairs tied in both
+    new_pair = numpy.concatenate(([True], (x_sorted[1:] != x_sorted[:-1]) |
+                                  (y_sorted[1:] != y_sorted[:-1]), [True]))
+    joint = numpy.diff(numpy.nonzero(new_pair)[0]).astype(numpy.float64)
+    joint_ties = float((joint * (joint - 1) / 2).sum())
+
+    x_ties, x0, x1 = _tie_counts(x_ranks)
+    y_ties, y0, y1 = _tie_counts(y_ranks)
+    discordant = count_inversions(y_sorted)
+
+    total = n * (n - 1) / 2.0
+    con_minus_dis = total - x_ties - y_ties + joint_ties - 2.0 * discordant
+    if total == x_ties or total == y_ties:
+        return float('nan'), float('nan')
+    tau = con_minus_dis / math.sqrt(total - x_ties) / math.sqrt(total -
+                                                                 y_ties)
+    tau = min(1.0, max(-1.0, tau))
+
+    m = float(n) * (n - 1)
+    variance = ((m * (2 * n + 5) - x1 - y1) / 18.0 +
+                (2 * x_ties * y_ties) / m)
+    if n > 2:
+        variance += x0 * y0 / (9 * m * (n - 2))
+    p = 1.0
+    if variance > 0:
+        p = math.erfc(abs(con_minus_dis) / math.sqrt(variance) / math.sqrt(2))
+    return tau, p
+
+
+def average_ranks(values):
+    ''' Rank values from 1, ties get the average of their ranks.
+
+    @param values numpy array
+    @return ranks numpy float64 array
+    '''
+    ranks, order = _dense_ranks(values)
+    # Start and end (exclusive) position of each group of ties
+    counts = numpy.bincount(ranks)
+    ends = numpy.cumsum(counts)
+    return ((ends - counts + 1 + ends) / 2.0)[ranks]
+
+
+def spearman_rho(x, y):
+    ''' Spearman's rank correlation of two samples.
+
+    The p-value uses the large sample normal approximation of the t
+    statistic, adequate for raster sized samples.
+
+    @param x numpy array
+    @param y numpy array of the same size
+    @return rho, p tuple of the correlation and its two-sided p-value
+    '''
+    x_ranks = average_ranks(numpy.asarray(x).ravel())
+    y_ranks = average_ranks(numpy.asarray(y).ravel())
+    n = x_ranks.size
+    if n < 3:
+        return float('nan'), float('nan')
+
+    x_ranks -= x_ranks.mean()
+    y_ranks -= y_ranks.mean()
+    denominator = math.sqrt(float(numpy.dot(x_ranks, x_ranks)) *
+                            float(numpy.dot(y_ranks, y_ranks)))
+    if denominator == 0:
+        return float('nan'), float('nan')
+    rho = min(1.0, max(-1.0, float(numpy.dot(x_ranks, y_ranks)) /
+                       denominator))
+
+    if rho in [-1.0, 1.0]:
+        return rho, 0.0
+    t = rho * math.sqrt((n - 2) / (1 - rho * rho))
+    return rho, math.erfc(abs(t) / math.sqrt(2))
+
+
+def tau_error_bound(tau, n, confidence=0.95):
+    ''' Error bound of Kendall's tau estimated from a random sample.
+
+    Uses the distribution free bound var(t) <= 2 (1 - tau^2) / n of Daniels
+    and Kendall with a normal quantile for the given confidence.
+
+    @param tau float tau estimated from the sample
+    @param n int sample size
+    @param confidence float confidence level (0.95 or 0.99)
+    @return bound float half-width of the confidence interval
+    '''
+    z = {0.95: 1.959964, 0.99: 2.575829}[confidence]
+    return z * math.sqrt(2 * max(0.0, 1 - tau * tau) / n)
+
+
+def stratified_sample(mask, fraction, rng):
+    ''' Draw a sample of the cells with data in a block.
+
+    Using each raster block as a stratum with proportional allocation spreads
+    the sample evenly over the raster.
+
+    @param mask numpy boolean array of cells with data in a block
+    @param fraction float fraction of cells sampled
+    @param rng numpy.random.RandomState
+    @return index numpy array of flat indices of sampled cells
+    '''
+    cells = numpy.flatnonzero(mask)
+    size = int(round(fraction * cells.size))
+    if size >= cells.size:
+        return cells
+    return numpy.sort(rng.choice(cells, size, replace=False))
+
+
+def rank_correlations(values_1, values_2, method='exact', n_total=None,
+                      confidence=0.95):
+    ''' Calculate Kendall's tau and Spearman's rho for a comparison result.
+
+    @param values_1 numpy array of values (all cells or a sample)
+    @param values_2 numpy array of values (all cells or a sample)
+    @param method String 'exact' (all cells) or 'sample'
+    @param n_total int number of cells the sample was drawn from
+    @param confidence float confidence level of the sample error bound
+    @return correlations dict with kendall_tau and spearman_rho tuples of
+            (value, p), and for samples the sample size and the error bound
+            of tau
+    '''
+    tau = kendall_tau(values_1, values_2)
+    rho = spearman_rho(values_1, values_2)
+    correlations = {'kendall_tau': (float(tau[0]), float(tau[1])),
+                    'spearman_rho': (float(rho[0]), float(rho[1]))}
+    if method == 'sample' and n_total and values_1.size < n_total:
+        correlations['correlation_sample'] = int(values_1.size)
+        correlations['kendall_tau_error'] = tau_error_bound(
+            tau[0], values_1.size, confidence)
+    return correlations
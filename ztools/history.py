@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import yaml
+
+from ztools.stats import median
+from ztools.utilities import load_results
+
+
+def load_history(result_files):
+    ''' Reads previous zrunner result files into a run history.
+
+    Runs are identified by the basename of their bat/sh file so that results
+    recorded on other machines (with other absolute paths) are matched too.
+
+    @param result_files String list of result YAML file paths
+    @return history dict mapping run names to lists of recorded run dicts
+    '''
+    history = {}
+
+    for result_file in result_files:
+        try:
+            results = load_results(result_file)
+        except (IOError, yaml.YAMLError) as e:
+            print('WARNING: Could not read history file {0}: {1}'.format(
+                  result_file, e))
+            continue
+
+        for key, run_info in results.items():
+            if key in ['sys_info', 'z_info'] or not isinstance(run_info,
+                                                                dict):
+                continue
+            history.setdefault(os.path.basename(key), []).append(run_info)
+
+    return history
+
+
+def recorded_peak_memory(history, file_path):
+    ''' Get the largest peak memory recorded for a run in previous results.
+
+    The peak resident memory measured by zrunner (resources: peak_rss or
+    the maxrss of the rusage) is used where recorded, otherwise the memory
+    use Zonation reports in its run info file ('memory', in MB), so results
+    written without resource sampling are used too.
+
+    @param history dict run history as returned by load_history()
+    @param file_path String path to the bat/sh file of the run
+    @return peak int peak resident memory in bytes or None if not recorded
+    '''
+    peaks = []
+    for run_info in history.get(os.path.basename(file_path), []):
+        resources = run_info.get('resources') or {}
+        rusage = resources.get('rusage') or {}
+        peak = resources.get('peak_rss') or rusage.get('maxrss')
+        if not peak and run_info.get('memory'):
+            peak = int(run_info['memory'] * 1024 * 1024)
+        if peak:
+            peaks.append(peak)
+
+    if peaks:
+        return max(peaks)
+    return None
+
+
+def recorded_duration(history, file_path):
+    ''' Get the median wall clock time recorded for a run in previous results.
+
+    Failed runs are ignored.
+
+    @param history dict run history as returned by load_history()
+    @param file_path String path to the bat/sh file of the run
+    @return seconds float measured run time or None if not recorded
+    '''
+    durations = [run_info['measured'] for run_info in
+                 history.get(os.path.basename(file_path), [])
+                 if 'ERROR' not in run_info and
+                 run_info.get('measured') is not None]
+    if durations:
+        return median(durations)
+    return None
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+
+from ztools.history import recorded_peak_memory
+
+# Zonation holds the feature data as single precision floats
+FEATURE_CELL_BYTES = 4
+# Per-cell bookkeeping (rank, removal order, neighbourhoods etc.) on top of
+# the feature data. Rough upper bound, deliberately on the safe side.
+CELL_OVERHEAD_BYTES = 64
+# Margin added on top of peaks recorded in previous runs
+HISTORY_MARGIN = 1.1
+
+RASTER_EXTENSIONS = ['.asc', '.img', '.tif', '.tiff', '.rst', '.bil',
+                     '.flt', '.nc', '.grd']
+
+
+def _resolve(path, base_dir):
+    path = path.strip().strip('"').replace('\\', '/')
+    return os.path.normpath(os.path.join(base_dir, path))
+
+
+def _is_raster(path):
+    return os.path.splitext(path)[1].lower() in RASTER_EXTENSIONS
+
+
+def referenced_files(file_path, cmd_args):
+    ''' Get the input files referenced by a Zonation run.
+
+    The dat and spp files are the 3rd and 4th items of the command sequence
+    parsed from the bat/sh file. Feature rasters are listed in the last
+    column of the spp file. Settings in the dat file whose key refers to a
+    file or layer (mask file, cost file, condition layer etc.) are included
+    if they point to an existing file. Relative paths are resolved against
+    the folder of the bat/sh file, which is also the working directory of
+    the run.
+
+    @param file_path String path to the bat/sh file
+    @param cmd_args list of Zonation command line arguments
+    @return files dict with lists of paths for keys 'dat', 'spp', 'rasters'
+            and 'other'
+    '''
+    base_dir = os.path.dirname(file_path)
+    files = {'dat': [], 'spp': [], 'rasters': [], 'other': []}
+
+    if len(cmd_args) < 4:
+        return files
+
+    dat_file = _resolve(cmd_args[2], base_dir)
+    spp_file = _resolve(cmd_args[3], base_dir)
+
+    if os.path.isfile(dat_file):
+        files['dat'].append(dat_file)
+        setting_pattern = re.compile(r'^\s*([^=\[#]*(file|layer)[^=]*)=(.+)$',
+                                     re.IGNORECASE)
+        with open(dat_file, 'r') as f:
+            for line in f:
+                match = setting_pattern.match(line)
+                if not match:
+                    continue
+                path = _resolve(match.group(3), base_dir)
+                if not os.path.isfile(path):
+                    continue
+                if _is_raster(path):
+                    files['rasters'].append(path)
+                else:
+                    files['other'].append(path)
+
+    if os.path.isfile(spp_file):
+        files['spp'].append(spp_file)
+        with open(spp_file, 'r') as f:
+            for line in f:
+                items = line.split()
+                # Feature rows have 5 numeric columns followed by the raster
+                if len(items) < 6:
+                    continue
+                path = _resolve(' '.join(items[5:]), base_dir)
+                if os.path.isfile(path):
+                    files['rasters'].append(path)
+                else:
+                    print('WARNING: Feature raster {0} not found'.format(path))
+
+    return files
+
+
+def raster_cells(raster_file):
+    ''' Get the number of cells in a raster without reading its data.
+
+    The dimensions are read from the header of ESRI ASCII grids and from the
+    .hdr sidecar of ENVI and ESRI BIL/FLT rasters. For other formats the
+    number of cells is approximated from the file size assuming 4 bytes per
+    cell.
+
+    @param raster_file String path to a raster file
+    @return n_cells int number of cells
+    '''
+    dims = {}
+    root, ext = os.path.splitext(raster_file)
+
+    if ext.lower() == '.asc':
+        header, keys = raster_file, ('ncols', 'nrows')
+    else:
+        header, keys = root + '.hdr', ('samples', 'lines', 'ncols', 'nrows')
+
+    if os.path.isfile(header):
+        with open(header, 'r') as f:
+            for i, line in enumerate(f):
+                items = line.replace('=', ' ').split()
+                if len(items) >= 2 and items[0].lower() in keys:
+                    try:
+                        dims[items[0].lower()] = int(float(items[1]))
+                    except ValueError:
+                        pass
+                # Headers are short, ASCII grid data starts after ~6 lines
+                if i > 100:
+                    break
+
+    cols = dims.get('samples', dims.get('ncols'))
+    rows = dims.get('lines', dims.get('nrows'))
+    if cols and rows:
+        return cols * rows
+
+    return os.path.getsize(raster_file) // FEATURE_CELL_BYTES
+
+
+def estimate_memory(file_path, cmd_args, history=None):
+    ''' Estimates the peak memory of a Zonation run before it is started.
+
+    If previous results record a peak for the run, that peak (plus a safety
+    margin) is used. Otherwise the estimate is derived from the size of the
+    input rasters: feature data for every referenced raster plus per-cell
+    bookkeeping for the largest raster.
+
+    @param file_path String path to the bat/sh file
+    @param cmd_args list of Zonation command line arguments
+    @param history dict run history as returned by load_history()
+    @return estimate int estimated peak memory in bytes or None if unknown
+    '''
+    if history:
+        peak = recorded_peak_memory(history, file_path)
+        if peak:
+            return int(peak * HISTORY_MARGIN)
+
+    rasters = referenced_files(file_path, cmd_args)['rasters']
+    if not rasters:
+        return None
+
+    cells = [raster_cells(raster) for raster in rasters]
+    return (sum(cells) * FEATURE_CELL_BYTES +
+            max(cells) * CELL_OVERHEAD_BYTES)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import signal
+import time
+
+PROC = '/proc'
+
+
+def _read_stat(pid):
+    ''' Read CPU ticks, resident memory and parent pid of a process.
+
+    @param pid int process id
+    @return tuple (ppid, cpu_ticks, rss_pages) or None if process is gone
+    '''
+    try:
+        with open(os.path.join(PROC, str(pid), 'stat'), 'r') as f:
+            stat = f.read()
+    except (IOError, OSError):
+        return None
+    # The command name may contain spaces, fields are counted after it
+    fields = stat[stat.rfind(')') + 2:].split()
+    # Fields 4, 14, 15 and 24 of proc(5), offset by the pid and comm fields
+    return int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[21])
+
+
+def _read_io(pid):
+    ''' Read bytes read and written by a process from storage.
+
+    @param pid int process id
+    @return tuple (read_bytes, write_bytes), zeros if not available
+    '''
+    counters = {}
+    try:
+        with open(os.path.join(PROC, str(pid), 'io'), 'r') as f:
+            for line in f:
+                key, value = line.split(':')
+                counters[key] = int(value)
+    except (IOError, OSError, ValueError):
+        pass
+    return counters.get('read_bytes', 0), counters.get('write_bytes', 0)
+
+
+def _children(pid):
+    ''' Get the direct children of a process.
+
+    Uses /proc/PID/task/TID/children where the kernel provides it and falls
+    back to scanning the parent pid of every process.
+
+    @param pid int process id
+    @return list of child process ids
+    '''
+    task_dir = os.path.join(PROC, str(pid), 'task')
+    try:
+        tasks = os.listdir(task_dir)
+        children = []
+        for task in tasks:
+            with open(os.path.join(task_dir, task, 'children'), 'r') as f:
+                children.extend(int(item) for item in f.read().split())
+        return children
+    except (IOError, OSError):
+        pass
+
+    children = []
+    for item in os.listdir(PROC):
+        if item.isdigit():
+            stat = _read_stat(int(item))
+            if stat and stat[0] == pid:
+                children.append(int(item))
+    return children
+
+
+def rusage_dict(rusage):
+    ''' Convert a resource.struct_rusage into a plain dict.
+
+    @param rusage struct_rusage as returned by os.wait4()
+    @return rusage dict (times in seconds, maxrss in bytes)
+    '''
+    return {'utime': round(rusage.ru_utime, 3),
+            'stime': round(rusage.ru_stime, 3),
+            'maxrss': rusage.ru_maxrss * 1024,
+            'minflt': rusage.ru_minflt,
+            'majflt': rusage.ru_majflt,
+            'inblock': rusage.ru_inblock,
+            'oublock': rusage.ru_oublock,
+            'nvcsw': rusage.ru_nvcsw,
+            'nivcsw': rusage.ru_nivcsw}
+
+
+class ResourceMonitor(object):
+    ''' Samples the resource use of a process tree from /proc.
+
+    Each sample sums the resident memory, CPU time and I/O of the process
+    and all of its descendants. CPU utilisation is reported as percent of
+    a single core, so a run using 4 cores fully shows as 400 %. A sample is
+    taken whenever sample() is called, e.g. every interval seconds from an
+    event loop.
+
+    On systems without /proc the monitor does nothing.
+    '''
+
+    def __init__(self, pid, interval=1.0):
+        self.pid = pid
+        self.interval = interval
+        # Time series of (seconds, rss bytes, cpu %, read bytes, write bytes)
+        self.samples = []
+
+        self._t0 = None
+        self._prev = None
+        self._cpu_ticks = {}
+        self._io = {}
+        self._clock_ticks = 100
+        self._page_size = 4096
+        if hasattr(os, 'sysconf'):
+            self._clock_ticks = os.sysconf('SC_CLK_TCK')
+            self._page_size = os.sysconf('SC_PAGE_SIZE')
+
+    def sample(self):
+        ''' Take a single sample of the process tree. '''
+        rss = self._sample_tree()
+        now = time.time()
+        ticks = sum(self._cpu_ticks.values())
+        if self._t0 is None:
+            self._t0 = now
+        cpu = 0.0
+        if self.samples and now > self._prev[0]:
+            cpu = (100.0 * (ticks - self._prev[1]) / self._clock_ticks /
+                   (now - self._prev[0]))
+        self._prev = (now, ticks)
+        read_bytes = sum(item[0] for item in self._io.values())
+        write_bytes = sum(item[1] for item in self._io.values())
+        self.samples.append((round(now - self._t0, 3), rss, round(cpu, 1),
+                             read_bytes, write_bytes))
+
+    def summary(self):
+        ''' Summarise the collected samples.
+
+        The first sample only establishes the CPU baseline and is excluded
+        from the CPU statistics.
+
+        @return resources dict with peak_rss, cpu_mean, cpu_peak, read_bytes,
+                write_bytes and the number of samples
+        '''
+        resources = {'samples': len(self.samples),
+                     'interval': self.interval}
+        if not self.samples:
+            return resources
+
+        cpu = [sample[2] for sample in self.samples[1:]]
+        duration = self.samples[-1][0]
+        total_ticks = sum(self._cpu_ticks.values())
+
+        resources['peak_rss'] = max(sample[1] for sample in self.samples)
+        resources['cpu_peak'] = max(cpu) if cpu else 0.0
+        resources['cpu_mean'] = 0.0
+        if duration > 0:
+            resources['cpu_mean'] = round(100.0 * total_ticks /
+                                          self._clock_ticks / duration, 1)
+        resources['read_bytes'] = self.samples[-1][3]
+        resources['write_bytes'] = self.samples[-1][4]
+        return resources
+
+    def cpu_time(self):
+        ''' Get the CPU time used by the process tree so far.
+
+        @return seconds float user and system time of all sampled processes
+        '''
+        return round(float(sum(self._cpu_ticks.values())) /
+                     self._clock_ticks, 3)
+
+    def write_timeseries(self, file_path):
+        ''' Write the full sample time series as a CSV file.
+
+        @param file_path String path to the output CSV file
+        '''
+        with open(file_path, 'w') as f:
+            f.write('time,rss,cpu,read_bytes,write_bytes\n')
+            for sample in self.samples:
+                f.write(','.join(str(item) for item in sample) + '\n')
+
+    def _sample_tree(self):
+        ''' Walk the process tree and update per-process counters.
+
+        Counters of processes that have exited are kept so that CPU time and
+        I/O of short-lived children still count towards the totals.
+
+        @return rss int resident memory of the live tree in bytes
+        '''
+        rss = 0
+        stack = [self.pid]
+        while stack:
+            pid = stack.pop()
+            stat = _read_stat(pid)
+            if stat is None:
+                continue
+            self._cpu_ticks[pid] = stat[1]
+            rss += stat[2] * self._page_size
+            self._io[pid] = _read_io(pid)
+            stack.extend(_children(pid))
+        return rss
+
+
+class Watchdog(object):
+    ''' Checks a run against its wall clock and memory limits.
+
+    The caller polls check() while the run is in progress and calls
+    terminate() when a limit is exceeded, followed by kill() if the run has
+    not exited after a grace period. The process must lead its own process
+    group (e.g. started with start_new_session=True) as the whole group is
+    signalled. The memory limit applies to the resident memory of the
+    process tree as sampled by a ResourceMonitor.
+
+    After the run, reason is None or the reason passed to terminate()
+    ('TIMEOUT', 'OOM', ...) and usage holds the measured usage at the time
+    the run was terminated.
+    '''
+
+    def __init__(self, process, timeout=None, max_memory=None, monitor=None):
+        self.process = process
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.monitor = monitor
+        self.reason = None
+        self.usage = {}
+
+    def check(self, elapsed):
+        ''' Check the run against its limits.
+
+        @param elapsed float seconds since the run started
+        @return reason String 'TIMEOUT' or 'OOM' if a limit is exceeded,
+                otherwise None
+        '''
+        if self.timeout is not None and elapsed >= self.timeout:
+            return 'TIMEOUT'
+        if (self.max_memory and self.monitor and self.monitor.samples and
+                self.monitor.samples[-1][1] > self.max_memory):
+            return 'OOM'
+        return None
+
+    def terminate(self, reason, elapsed):
+        ''' Record the usage of the run and send SIGTERM to its group.
+
+        @param reason String reason of the termination
+        @param elapsed float seconds since the run started
+        '''
+        self.reason = reason
+        self.usage = {'elapsed': round(elapsed, 3)}
+        if self.monitor and self.monitor.samples:
+            self.usage['rss'] = self.monitor.samples[-1][1]
+            self.usage['cpu_time'] = self.monitor.cpu_time()
+        self._signal(signal.SIGTERM)
+
+    def kill(self):
+        ''' Send SIGKILL to the group of a run ignoring SIGTERM. '''
+        self._signal(getattr(signal, 'SIGKILL', signal.SIGTERM))
+
+    def _signal(self, signum):
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(self.process.pid, signum)
+            else:
+                self.process.kill()
+        except OSError:
+            # Already exited
+            pass
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from abc import ABCMeta, abstractmethod
+import json
+import queue
+import random
+import threading
+import time
+from urllib.request import Request, urlopen
+
+# Colors of Slack attachments by notification level
+SLACK_COLORS = {'info': '#2eb886', 'warning': '#daa038', 'error': '#a30200'}
+
+
+class Sink(metaclass=ABCMeta):
+    ''' Destination of notifications.
+
+    Abstract interface: subclasses implement send(), which delivers a batch
+    of notifications and raises an exception if the delivery failed (the
+    batch is retried). Each notification is a dict with keys 'title',
+    'message', 'level' ('info', 'warning' or 'error') and 'time'
+    (time.time() when it was created).
+    '''
+
+    @abstractmethod
+    def send(self, notifications):
+        ''' Deliver a batch of notifications.
+
+        @param notifications list of notification dicts
+        '''
+
+
+class WebhookSink(Sink):
+    ''' Posts notifications as JSON to an HTTP endpoint.
+
+    The body is {"notifications": [...]} with the notification dicts. Any
+    status other than 2xx fails the delivery.
+    '''
+
+    def __init__(self, url, timeout=10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def payload(self, notifications):
+        ''' Build the JSON body of a batch.
+
+        @param notifications list of notification dicts
+        @return payload dict
+        '''
+        return {'notifications': notifications}
+
+    def send(self, notifications):
+        data = json.dumps(self.payload(notifications)).encode('utf-8')
+        request = Request(self.url, data=data,
+                          headers={'Content-Type': 'application/json'})
+        # urlopen raises HTTPError for error statuses
+        with urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class SlackSink(WebhookSink):
+    ''' Posts notifications to a Slack incoming webhook.
+
+    A batch is sent as a single message with an attachment per
+    notification.
+    '''
+
+    def __init__(self, url, channel, user_name='zlogger', timeout=10.0):
+        WebhookSink.__init__(self, url, timeout)
+        self.channel = channel
+        self.user_name = user_name
+
+    def payload(self, notifications):
+        attachments = [{'title': item['title'],
+                        'text': item['message'],
+                        'fallback': '{0}: {1}'.format(item['title'],
+                                                      item['message']),
+                        'color': SLACK_COLORS.get(item['level'], ''),
+                        'ts': int(item['time'])}
+                       for item in notifications]
+        return {'channel': self.channel, 'username': self.user_name,
+                'attachments': attachments}
+
+
+class Notifier(threading.Thread):
+    ''' Delivers notifications to a sink from a background thread.
+
+    notify() only puts the notification in a bounded queue and never
+    blocks, so a slow or unreachable sink cannot delay the runs. When the
+    queue is full new notifications are dropped and their number is
+    reported with the next delivered batch.
+
+    The worker waits batch_window seconds after the first notification of a
+    batch for more to arrive and sends them together, at most max_batch at
+    a time. Within a batch, notifications with the same key (the title by
+    default) are coalesced and only the latest one is sent, e.g. a run that
+    starts and finishes within the window is reported only as finished.
+    A failed delivery is retried up to retries times waiting backoff,
+    2 * backoff, 4 * backoff, ... (at most max_backoff) seconds with some
+    jitter in between, after which the batch is dropped with a warning.
+    '''
+
+    def __init__(self, sink, max_queue=1000, batch_window=2.0, max_batch=20,
+                 retries=5, backoff=1.0, max_backoff=60.0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.sink = sink
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.dropped = 0
+
+        self._queue = queue.Queue(max_queue)
+        self._closing = threading.Event()
+        self._reported_drops = 0
+
+    def notify(self, title, message, level='info', key=None):
+        ''' Queue a notification.
+
+        @param title String title of the notification
+        @param message String text of the notification
+        @param level String 'info', 'warning' or 'error'
+        @param key String key for coalescing (default: the title)
+        @return queued bool False if the notification was dropped
+        '''
+        notification = {'title': title, 'message': message, 'level': level,
+                        'time': time.time()}
+        try:
+            self._queue.put_nowait((key or title, notification))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self, timeout=30.0):
+        ''' Deliver the queued notifications and stop the worker.
+
+        The worker is given at most timeout seconds (including retries), so
+        an unreachable sink cannot hang the exit.
+
+        @param timeout float seconds to wait for the worker
+        '''
+        self._closing.set()
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        finished = False
+        while not finished:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            window_end = time.time() + self.batch_window
+            while len(batch) < self.max_batch and not self._closing.is_set():
+                try:
+                    item = self._queue.get(
+                        timeout=max(window_end - time.time(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    finished = True
+                    break
+                batch.append(item)
+            if self._closing.is_set() and not finished:
+                # Drain the rest without waiting for the window
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        finished = True
+                        break
+                    batch.append(item)
+            self._deliver(self._coalesce(batch))
+
+    def _coalesce(self, batch):
+        ''' Keep the latest notification of each key in order of first
+        appearance.
+
+        @param batch list of (key, notification) tuples
+        @return notifications list of notification dicts
+        '''
+        latest = {}
+        keys = []
+        for key, notification in batch:
+            if key not in latest:
+                keys.append(key)
+            latest[key] = notification
+        notifications = [latest[key] for key in keys]
+        dropped = self.dropped - self._reported_drops
+        if dropped:
+            self._reported_drops = self.dropped
+            notifications.append({'title': 'Notifications dropped',
+                                  'message': '{0} notifications did not fit '
+                                             'in the queue'.format(dropped),
+                                  'level': 'warning', 'time': time.time()})
+        return notifications
+
+    def _deliver(self, notifications):
+        ''' Send a batch to the sink, retrying with exponential backoff.
+
+        @param notifications list of notification dicts
+        '''
+        for attempt in range(self.retries + 1):
+            try:
+                self.sink.send(notifications)
+                self.sent += len(notifications)
+                return
+            except Exception as e:
+                error = e
+            if attempt == self.retries:
+                break
+            delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+        print('WARNING: Could not deliver {0} notifications: {1}'.format(
+              len(notifications), error))
@@ -1,9 +1,81 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import re
+import time
+
 from ztools.utilities import ZonationRuninfoException
 
+# All messages parsed from a run info file are matched with a single pattern.
+# The name of the matching group tells which message was found:
+#
+# init      "Loaded data and initialized in X seconds"
+# cellrem   "Done in X seconds" (cell removal)
+# elapsed   "Elapsed time : X ms" (overall)
+# features  "Loaded X biodiversity features"
+# cells     "Non-missing cells: X"
+# memory    "Memory used: X MB"
+# finished  "ZIG3: DONE!"
+RUNINFO_PATTERN = re.compile(
+    r'Loaded data and initialized in (?P<init>\d+(?:\.\d+)?) seconds'
+    r'|Done in (?P<cellrem>\d+(?:\.\d+)?) seconds'
+    r'|Elapsed time : (?P<elapsed>\d+) ms'
+    r'|Loaded (?P<features>\d+) biodiversity features'
+    r'|[Nn]on-?missing cells\s*[:=]?\s*(?P<cells>\d+)'
+    r'|[Mm]emory used\s*[:=]?\s*(?P<memory>\d+(?:\.\d+)?)\s*MB'
+    r'|(?P<finished>ZIG3: DONE!)')
+
+# Zonation does not return any error codes and it creates
+# a runinfo file even if it does not finish. If this finishing
+# message is not found, assume that the process did not finish.
+FINISHED_MARKER = b'ZIG3: DONE!'
+
+# Cell removal progress is reported as a percentage on its own line
+PROGRESS_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+
+# Stage timings have to appear in this order, a timing message found out of
+# order (e.g. "Done in" before initialization) is not a stage timing
+STAGE_ORDER = ['init', 'cellrem', 'elapsed']
+
+
+def _number(value):
+    ''' Convert a parsed number to int if it is integral, float otherwise. '''
+    value = float(value)
+    if value.is_integer():
+        return int(value)
+    return value
+
+
+def is_finished(file_path, block_size=65536):
+    ''' Check whether a run info file has the finishing message.
+
+    The message is written at the very end of the file, so the file is
+    scanned backwards in blocks and usually only the last block is read.
+
+    @param file_path String path to a Zonation run info file
+    @param block_size int number of bytes read at a time
+    @return finished bool True if the finishing message was found
+    '''
+    overlap = len(FINISHED_MARKER) - 1
+
+    with open(file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        carry = b''
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            block = f.read(size)
+            # Carry the start of the later block to catch a marker split
+            # across the block boundary
+            if FINISHED_MARKER in block + carry:
+                return True
+            carry = (block + carry)[:overlap]
+
+    return False
+
 
 def parse_results(file_path):
     ''' Parses Zonation *.run_info.txt file to obtain time elapsed in different
@@ -12,6 +84,12 @@ def parse_results(file_path):
     If a specified run info file cannot be found, raise an exception. If the
     file is found but is incomplete, raise an exception.
 
+    The file is read line by line in a single pass, so memory use does not
+    depend on the file size. Besides the stage times ('init', 'cellrem' and
+    'elapsed'), the number of features ('features'), the number of cells with
+    data ('cells') and the largest reported memory use in MB ('memory') are
+    returned if Zonation reported them.
+
     @param file_path String path to a Zonation run info file
     @return elapsed_time dict holding the parsed time values
     '''
@@ -19,57 +97,213 @@ def parse_results(file_path):
     elapsed_time = {}
 
     try:
-        f = open(file_path, 'r')
+        finished = is_finished(file_path)
     except IOError:
         msg = 'Input run info file {0} does not exist'.format(file_path)
         raise ZonationRuninfoException(msg)
 
-    # Data loading and initialization is reported with message:
-    # "Loaded data and initialized in X seconds"
-    init_pattern = re.compile('(?<=Loaded data and initialized in )' +
-                              '(.*)(?= seconds)')
-
-    # Cell removal is reported with message:
-    # "Done in X seconds"
-    cellrem_pattern = re.compile('(?<=Done in )(.*)(?= seconds)')
-
-    # Overall elapsed time is reported with message:
-    # "Elapsed time : X ms"
-    elapsed_pattern = re.compile('(?<=Elapsed time : )(.*)(?= ms)')
-
-    # Zonation does not return any error codes and it creates
-    # a runinfo file even if it does not finish. If a particular finishing
-    # message is not found, assume that the process did not finish.
-    finished_pattern = re.compile('(?<=ZIG3: DONE!)')
-
-    with f:
-        # Track whehter Zonation apparently finished
-        finished = False
-        for line in f.readlines():
-            # NOTE: the following assumes a fixed order of appearance in the
-            # text file
-            if 'init' not in elapsed_time.keys():
-                if init_pattern.findall(line):
-                    value = init_pattern.findall(line)[0]
-                    elapsed_time['init'] = int(value)
-            elif 'cellrem' not in elapsed_time.keys():
-                if cellrem_pattern.findall(line):
-                    value = cellrem_pattern.findall(line)[0]
-                    elapsed_time['cellrem'] = int(value)
-            elif 'elapsed' not in elapsed_time.keys():
-                if elapsed_pattern.findall(line):
-                    # Reported time is milliseconds so it needs to be divided
-                    # by 1000
-                    value = elapsed_pattern.findall(line)[0]
-                    elapsed_time['elapsed'] = int(value) / 1000
-            elif 'finished' not in elapsed_time.keys():
-                if finished_pattern.findall(line):
-                    finished = True
-                    # This is the final item
-                    break
-
-        if not finished:
-            msg = 'Run info file {0} found but incomplete'.format(file_path)
-            raise ZonationRuninfoException(msg)
+    # No need to parse a file that is known to be incomplete
+    if not finished:
+        msg = 'Run info file {0} found but incomplete'.format(file_path)
+        raise ZonationRuninfoException(msg)
+
+    # Index of the next expected stage timing in STAGE_ORDER
+    next_stage = 0
+
+    # Zonation writes paths and names in the encoding of the system (e.g.
+    # Windows-1252), decoding errors must not abort the suite
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = RUNINFO_PATTERN.search(line)
+            if match is None:
+                continue
+            key = match.lastgroup
+            if key == 'finished':
+                # This is the final item
+                break
+            value = _number(match.group(key))
+            if key in STAGE_ORDER:
+                if (next_stage < len(STAGE_ORDER) and
+                        key == STAGE_ORDER[next_stage]):
+                    if key == 'elapsed':
+                        # Reported time is milliseconds so it needs to be
+                        # divided by 1000
+                        value = value / 1000
+                    elapsed_time[key] = value
+                    next_stage += 1
+            elif key == 'memory':
+                elapsed_time[key] = max(value, elapsed_time.get(key, 0))
+            else:
+                elapsed_time[key] = value
 
     return elapsed_time
+
+
+class RuninfoTailer(object):
+    ''' Incremental reader of a Zonation run info file that is still being
+    written.
+
+    Each call to poll() reads whatever has been appended to the file since
+    the previous call and returns the events found in the complete lines.
+    Events are dicts with at least keys 'event', 'stage' and 'time' (wall
+    clock seconds since the tailer was created):
+
+        started   the run info file appeared
+        init      data loaded and initialized, 'seconds' reported by Zonation
+        progress  cell removal progress, 'percent' removed
+        cellrem   cell removal done, 'seconds' reported by Zonation
+        elapsed   total elapsed time, 'seconds' reported by Zonation
+        done      Zonation finished
+        stalled   file has not grown in stall_timeout seconds, 'idle' seconds
+
+    The run goes through stages waiting -> loading -> cellrem -> finishing ->
+    done. A file left over from an earlier run (existing when the tailer was
+    created) is ignored until Zonation rewrites it, i.e. until its inode,
+    size or modification time changes.
+    '''
+
+    def __init__(self, file_path, stall_timeout=None, chunk_size=65536):
+        self.file_path = file_path
+        self.stall_timeout = stall_timeout
+        self.chunk_size = chunk_size
+        self.stage = 'waiting'
+        self.progress = None
+
+        self._t0 = time.time()
+        self._stale = self._signature()
+        self._f = None
+        # Bytes read so far, lines are decoded once complete
+        self._offset = 0
+        self._buffer = b''
+        self._stage_start = self._t0
+        self._stage_times = {}
+        self._last_growth = self._t0
+        self._stalled = False
+
+    def poll(self):
+        ''' Read newly appended data and return the resulting events.
+
+        @return events list of event dicts
+        '''
+        events = []
+        now = time.time()
+
+        if self._f is None and not self._open():
+            return events
+        if self._offset == 0 and not self._buffer and self.stage == 'waiting':
+            events.append(self._set_stage('loading', 'started', now))
+
+        # A run info file shorter than what has been read has been rewritten
+        try:
+            size = os.fstat(self._f.fileno()).st_size
+        except (IOError, OSError):
+            size = self._offset
+        if size < self._offset:
+            self._f.seek(0)
+            self._offset = 0
+            self._buffer = b''
+
+        grown = False
+        while True:
+            chunk = self._f.read(self.chunk_size)
+            if not chunk:
+                break
+            grown = True
+            self._offset += len(chunk)
+            self._buffer += chunk
+            lines = self._buffer.split(b'\n')
+            # The last item is an incomplete line (or empty)
+            self._buffer = lines.pop()
+            for line in lines:
+                events.extend(self._handle_line(
+                    line.decode('utf-8', 'replace'), now))
+
+        if grown:
+            self._last_growth = now
+            self._stalled = False
+        elif (self.stall_timeout and not self._stalled and
+              self.stage != 'done' and
+              now - self._last_growth > self.stall_timeout):
+            self._stalled = True
+            events.append(self._event('stalled', now,
+                                      idle=round(now - self._last_growth, 1)))
+
+        return events
+
+    def stage_times(self):
+        ''' Get the wall clock time spent in each stage so far.
+
+        The time of the current stage runs until now.
+
+        @return stage_times dict of seconds per stage
+        '''
+        stage_times = dict(self._stage_times)
+        if self.stage != 'done':
+            stage_times[self.stage] = round(stage_times.get(self.stage, 0) +
+                                            time.time() - self._stage_start, 3)
+        return stage_times
+
+    def close(self):
+        ''' Close the followed file. '''
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def _signature(self):
+        ''' Identify the current version of the run info file.
+
+        @return tuple (inode, size, mtime in ns) or None if there is no file
+        '''
+        try:
+            stat = os.stat(self.file_path)
+        except (IOError, OSError):
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _open(self):
+        signature = self._signature()
+        # No file yet or a stale file from an earlier run
+        if signature is None or signature == self._stale:
+            return False
+        try:
+            self._f = open(self.file_path, 'rb')
+        except (IOError, OSError):
+            return False
+        self._stale = None
+        return True
+
+    def _event(self, name, now, **kwargs):
+        event = {'event': name, 'stage': self.stage,
+                 'time': round(now - self._t0, 3)}
+        event.update(kwargs)
+        return event
+
+    def _set_stage(self, stage, name, now, **kwargs):
+        self._stage_times[self.stage] = round(now - self._stage_start, 3)
+        self._stage_start = now
+        self.stage = stage
+        return self._event(name, now, **kwargs)
+
+    def _handle_line(self, line, now):
+        match = RUNINFO_PATTERN.search(line)
+        key = match.lastgroup if match else None
+
+        if self.stage == 'loading' and key == 'init':
+            return [self._set_stage('cellrem', 'init', now,
+                                    seconds=_number(match.group(key)))]
+        elif self.stage == 'cellrem':
+            if key == 'cellrem':
+                return [self._set_stage('finishing', 'cellrem', now,
+                                        seconds=_number(match.group(key)))]
+            match = PROGRESS_PATTERN.search(line)
+            if match:
+                self.progress = float(match.group(1))
+                return [self._event('progress', now, percent=self.progress)]
+        elif self.stage == 'finishing':
+            if key == 'elapsed':
+                return [self._event('elapsed', now,
+                                    seconds=int(match.group(key)) / 1000)]
+            elif key == 'finished':
+                return [self._set_stage('done', 'done', now)]
+        return []
+
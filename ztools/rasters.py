@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import zlib
+
+import numpy
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import gdal
+    from gdalconst import GA_ReadOnly
+except ImportError:
+    try:
+        from osgeo import gdal
+        from osgeo.gdalconst import GA_ReadOnly
+    except ImportError:
+        gdal = None
+
+# ENVI data type codes
+ENVI_DTYPES = {1: 'u1', 2: 'i2', 3: 'i4', 4: 'f4', 5: 'f8', 12: 'u2',
+               13: 'u4', 14: 'i8', 15: 'u8'}
+
+# ESRI EHdr pixel types by (PIXELTYPE, NBITS)
+EHDR_DTYPES = {('UNSIGNEDINT', 8): 'u1', ('SIGNEDINT', 8): 'i1',
+               ('UNSIGNEDINT', 16): 'u2', ('SIGNEDINT', 16): 'i2',
+               ('UNSIGNEDINT', 32): 'u4', ('SIGNEDINT', 32): 'i4',
+               ('FLOAT', 32): 'f4', ('FLOAT', 64): 'f8'}
+
+# Number of cells in a block of a memory mapped raster
+BLOCK_CELLS = 1024 * 1024
+
+# GDAL data type names (GDT_*) by numpy data type
+GDAL_TYPES = {'uint8': 'Byte', 'int16': 'Int16', 'uint16': 'UInt16',
+              'int32': 'Int32', 'uint32': 'UInt32', 'float32': 'Float32',
+              'float64': 'Float64'}
+
+# Tile size of GeoTIFFs written by RasterWriter
+TILE_SIZE = 256
+
+# Header fields of ENVI rasters copied to new rasters
+ENVI_GEOREFERENCE = ['map info', 'projection info', 'coordinate system string']
+
+
+def _header_file(raster_file):
+    ''' Find the header of a flat binary raster.
+
+    Both "name.hdr" and "name.img.hdr" are used for ENVI headers.
+
+    @param raster_file String path to a raster file
+    @return header String path to the header file or None
+    '''
+    for header in [os.path.splitext(raster_file)[0] + '.hdr',
+                   raster_file + '.hdr']:
+        if os.path.isfile(header):
+            return header
+    return None
+
+
+def _envi_geotransform(map_info):
+    ''' Convert ENVI map info into a GDAL geotransform.
+
+    Map info holds the projection name, a tie point as a 1-based pixel
+    position and its map coordinates, and the pixel size. Rotated grids are
+    not supported.
+
+    @param map_info String value of the map info header field
+    @return geotransform tuple of 6 floats or None
+    '''
+    items = [item.strip() for item in (map_info or '').split(',')]
+    if any(item.lower().startswith('rotation') for item in items):
+        return None
+    try:
+        pixel_x, pixel_y, x, y, size_x, size_y = [float(item)
+                                                  for item in items[1:7]]
+    except ValueError:
+        return None
+    return (x - (pixel_x - 1) * size_x, size_x, 0.0,
+            y + (pixel_y - 1) * size_y, 0.0, -size_y)
+
+
+def _ehdr_geotransform(fields):
+    ''' Convert the map coordinates of an EHdr header into a GDAL
+    geotransform.
+
+    @param fields dict of header fields (lower case keys)
+    @return geotransform tuple of 6 floats or None
+    '''
+    try:
+        x, y = float(fields['ulxmap']), float(fields['ulymap'])
+        size_x = float(fields.get('xdim', 1))
+        size_y = float(fields.get('ydim', 1))
+    except (KeyError, ValueError):
+        return None
+    # ULXMAP and ULYMAP are the center of the upper left cell
+    return (x - size_x / 2, size_x, 0.0, y + size_y / 2, 0.0, -size_y)
+
+
+def _envi_georeference(dataset):
+    ''' Describe the georeference of a dataset as ENVI header fields.
+
+    @param dataset GDAL dataset or MemmapDataset
+    @return georeference dict of map info and coordinate system string,
+            empty if the dataset is not georeferenced
+    '''
+    if not hasattr(dataset, 'GetGeoTransform'):
+        return {}
+    georeference = {}
+    geotransform = dataset.GetGeoTransform()
+    # GDAL reports (0, 1, 0, 0, 0, 1) for rasters without a geotransform
+    if (geotransform and not geotransform[2] and not geotransform[4] and
+            tuple(geotransform) != (0.0, 1.0, 0.0, 0.0, 0.0, 1.0)):
+        georeference['map info'] = ', '.join(
+            ['Arbitrary', '1', '1'] +
+            [str(float(geotransform[i])) for i in [0, 3, 1]] +
+            [str(-float(geotransform[5]))])
+    projection = dataset.GetProjection()
+    if projection:
+        georeference['coordinate system string'] = projection
+    return georeference
+
+
+def read_header(raster_file):
+    ''' Read the layout of a flat binary raster from its ENVI or EHdr header.
+
+    Only single band rasters are supported. The georeference is read from
+    the map info and coordinate system string of ENVI headers, and from the
+    map coordinates of EHdr headers with the projection in a .prj file next
+    to the raster.
+
+    @param raster_file String path to a raster file
+    @return layout dict with rows, cols, dtype (numpy.dtype with the byte
+            order of the file), offset (bytes), nodata, geotransform (GDAL
+            geotransform or None) and projection (WKT, empty if unknown),
+            or None if the raster has no supported header
+    '''
+    header = _header_file(raster_file)
+    if header is None:
+        return None
+
+    fields = {}
+    with open(header, 'r') as f:
+        lines = f.read().splitlines()
+    if not lines:
+        return None
+    envi = lines[0].strip().upper() == 'ENVI'
+    for line in lines[1:] if envi else lines:
+        if envi:
+            if '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+        else:
+            items = line.split(None, 1)
+            if len(items) < 2:
+                continue
+            key, value = items
+        fields[key.strip().lower()] = value.strip().strip('{}').strip()
+
+    try:
+        if envi:
+            if int(fields.get('bands', 1)) != 1:
+                return None
+            dtype = numpy.dtype(ENVI_DTYPES[int(fields['data type'])])
+            big_endian = fields.get('byte order', '0') == '1'
+            layout = {'rows': int(fields['lines']),
+                      'cols': int(fields['samples']),
+                      'offset': int(fields.get('header offset', 0)),
+                      'nodata': fields.get('data ignore value'),
+                      'georeference': dict(
+                          (key, fields[key]) for key in ENVI_GEOREFERENCE
+                          if key in fields),
+                      'geotransform': _envi_geotransform(
+                          fields.get('map info')),
+                      'projection': fields.get('coordinate system string',
+                                               '')}
+        else:
+            if int(fields.get('nbands', 1)) != 1:
+                return None
+            pixel_type = fields.get('pixeltype', 'UNSIGNEDINT').upper()
+            dtype = numpy.dtype(EHDR_DTYPES[(pixel_type,
+                                             int(fields.get('nbits', 8)))])
+            big_endian = fields.get('byteorder', 'I').upper() in ['M',
+                                                                  'MSBFIRST']
+            layout = {'rows': int(fields['nrows']),
+                      'cols': int(fields['ncols']),
+                      'offset': int(fields.get('skipbytes', 0)),
+                      'nodata': fields.get('nodata',
+                                           fields.get('nodata_value')),
+                      'geotransform': _ehdr_geotransform(fields),
+                      'projection': ''}
+    except (KeyError, ValueError):
+        return None
+
+    if not envi:
+        try:
+            with open(os.path.splitext(raster_file)[0] + '.prj', 'r') as f:
+                layout['projection'] = f.read().strip()
+        except (IOError, OSError):
+            pass
+
+    layout['dtype'] = dtype.newbyteorder('>' if big_endian else '<')
+    if layout['nodata'] is not None:
+        try:
+            layout['nodata'] = float(layout['nodata'])
+        except ValueError:
+            layout['nodata'] = None
+    return layout
+
+
+def payload_digest(raster_file, block_size=8 * 1024 * 1024):
+    ''' Calculate a fast non-cryptographic hash of a raster's cell values.
+
+    For flat binary rasters with a header only the layout (dimensions, data
+    type and NoData value) and the cell values are hashed, so rasters that
+    differ only in other header fields hash the same. Other formats are
+    hashed as whole files. The file is read sequentially in large blocks.
+
+    xxHash is used if the xxhash module is installed, otherwise CRC-32 and
+    Adler-32 from zlib combined. The digest names the algorithm, so digests
+    of different algorithms never match.
+
+    @param raster_file String path to a raster file
+    @param block_size int number of bytes read at a time
+    @return digest String
+    '''
+    start = 0
+    length = os.path.getsize(raster_file)
+    prefix = b''
+    layout = read_header(raster_file)
+    if layout is not None:
+        size = layout['rows'] * layout['cols'] * layout['dtype'].itemsize
+        if layout['offset'] + size <= length:
+            start, length = layout['offset'], size
+            prefix = '{0} {1} {2} {3}'.format(
+                layout['rows'], layout['cols'], layout['dtype'].str,
+                layout['nodata']).encode('ascii')
+
+    if xxhash is not None:
+        digest = xxhash.xxh64(prefix)
+    crc = zlib.crc32(prefix)
+    adler = zlib.adler32(prefix)
+
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    with open(raster_file, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            n = f.readinto(view[:min(block_size, length)])
+            if not n:
+                break
+            length -= n
+            if xxhash is not None:
+                digest.update(view[:n])
+            else:
+                crc = zlib.crc32(view[:n], crc)
+                adler = zlib.adler32(view[:n], adler)
+
+    if xxhash is not None:
+        return 'xxh64:' + digest.hexdigest()
+    return 'crc32-adler32:{0:08x}{1:08x}'.format(crc & 0xffffffff,
+                                                 adler & 0xffffffff)
+
+
+class MemmapBand(object):
+    ''' Band of a memory mapped raster with the GDAL band methods used by
+    ztools.tools.
+
+    ReadAsArray() returns views of the memory map, so blocks are read
+    straight from the page cache without copying.
+    '''
+
+    def __init__(self, data, nodata):
+        self._data = data
+        self._nodata = nodata
+        self.YSize, self.XSize = data.shape
+
+    def GetBlockSize(self):
+        # Rows are contiguous, blocks are bands of whole rows
+        return [self.XSize, max(1, min(self.YSize,
+                                       BLOCK_CELLS // self.XSize))]
+
+    def GetNoDataValue(self):
+        return self._nodata
+
+    def ReadAsArray(self, xoff=0, yoff=0, win_xsize=None, win_ysize=None):
+        if win_xsize is None:
+            win_xsize = self.XSize
+        if win_ysize is None:
+            win_ysize = self.YSize
+        return self._data[yoff:yoff + win_ysize, xoff:xoff + win_xsize]
+
+
+class MemmapDataset(object):
+    ''' Flat binary raster memory mapped with numpy.
+
+    Has the GDAL dataset attributes and methods used by ztools.tools, so it
+    can be used in place of a GDAL dataset.
+    '''
+
+    def __init__(self, raster_file, layout):
+        self.raster_file = raster_file
+        self.RasterXSize = layout['cols']
+        self.RasterYSize = layout['rows']
+        self.RasterCount = 1
+        self.georeference = layout.get('georeference') or {}
+        self._geotransform = layout.get('geotransform')
+        self._projection = layout.get('projection') or ''
+        data = numpy.memmap(raster_file, dtype=layout['dtype'], mode='r',
+                            offset=layout['offset'],
+                            shape=(layout['rows'], layout['cols']))
+        self._band = MemmapBand(data, layout['nodata'])
+
+    def GetGeoTransform(self):
+        return self._geotransform
+
+    def GetProjection(self):
+        return self._projection
+
+    def GetRasterBand(self, band):
+        if band != 1:
+            raise ValueError('Memory mapped rasters have a single band')
+        return self._band
+
+
+def open_raster(raster_file):
+    ''' Open a raster for reading.
+
+    Flat binary rasters with an ENVI or EHdr header (e.g. Zonation .img
+    outputs) are memory mapped, other formats are opened with GDAL.
+
+    @param raster_file String path to a raster file
+    @return dataset MemmapDataset or GDAL dataset
+    '''
+    layout = read_header(raster_file)
+    if layout is not None:
+        size = (layout['offset'] + layout['rows'] * layout['cols'] *
+                layout['dtype'].itemsize)
+        if os.path.getsize(raster_file) >= size:
+            return MemmapDataset(raster_file, layout)
+
+    if gdal is None:
+        raise IOError('Reading {0} requires GDAL'.format(raster_file))
+    dataset = gdal.Open(raster_file, GA_ReadOnly)
+    if dataset is None:
+        raise IOError('Could not open raster {0}'.format(raster_file))
+    return dataset
+
+
+def reopen_raster(dataset):
+    ''' Get a dataset of the same raster for use in another thread.
+
+    GDAL datasets must not be shared between threads, memory mapped
+    datasets are read-only and can be.
+
+    @param dataset MemmapDataset or GDAL dataset
+    @return dataset MemmapDataset or GDAL dataset
+    '''
+    if isinstance(dataset, MemmapDataset):
+        return dataset
+    return open_raster(dataset.GetDescription())
+
+
+class RasterWriter(object):
+    ''' Writes a single band raster block by block.
+
+    Files ending with .tif are written as tiled (and optionally compressed)
+    GeoTIFFs with GDAL, other files as flat binary ENVI rasters (with a .hdr
+    header) through a memory map, which does not need GDAL. Blocks may be
+    written from several threads.
+    '''
+
+    def __init__(self, raster_file, x_size, y_size, dtype=numpy.float32,
+                 nodata=None, like=None, compress=False):
+        '''
+        @param raster_file String path to the new raster
+        @param x_size int number of columns
+        @param y_size int number of rows
+        @param dtype numpy data type of the values
+        @param nodata NoData value or None
+        @param like dataset the georeference is copied from (optional)
+        @param compress boolean compress the tiles of GeoTIFFs (DEFLATE)
+        '''
+        self.raster_file = raster_file
+        self.dtype = numpy.dtype(dtype).newbyteorder('=')
+        self._lock = threading.Lock()
+        self._dataset = None
+        self._data = None
+
+        if os.path.splitext(raster_file)[1].lower() in ['.tif', '.tiff']:
+            if gdal is None:
+                raise IOError('Writing {0} requires GDAL'.format(raster_file))
+            gdal_type = getattr(gdal, 'GDT_' + GDAL_TYPES[self.dtype.name])
+            options = ['TILED=YES', 'BLOCKXSIZE={0}'.format(TILE_SIZE),
+                       'BLOCKYSIZE={0}'.format(TILE_SIZE), 'BIGTIFF=IF_SAFER']
+            if compress:
+                # Floating point predictor for float data
+                predictor = 3 if self.dtype.kind == 'f' else 2
+                options += ['COMPRESS=DEFLATE',
+                            'PREDICTOR={0}'.format(predictor)]
+            self._dataset = gdal.GetDriverByName('GTiff').Create(
+                raster_file, x_size, y_size, 1, gdal_type, options)
+            if like is not None and hasattr(like, 'GetGeoTransform'):
+                geotransform = like.GetGeoTransform()
+                if geotransform:
+                    self._dataset.SetGeoTransform(geotransform)
+                projection = like.GetProjection()
+                if projection:
+                    self._dataset.SetProjection(projection)
+            self._band = self._dataset.GetRasterBand(1)
+            if nodata is not None:
+                self._band.SetNoDataValue(nodata)
+        else:
+            codes = dict((numpy.dtype(value), key) for key, value in
+                         ENVI_DTYPES.items())
+            header = os.path.splitext(raster_file)[0] + '.hdr'
+            with open(header, 'w') as f:
+                f.write('ENVI\n')
+                f.write('samples = {0}\n'.format(x_size))
+                f.write('lines = {0}\n'.format(y_size))
+                f.write('bands = 1\n')
+                f.write('header offset = 0\n')
+                f.write('file type = ENVI Standard\n')
+                f.write('data type = {0}\n'.format(codes[self.dtype]))
+                f.write('interleave = bsq\n')
+                f.write('byte order = 0\n')
+                if nodata is not None:
+                    f.write('data ignore value = {0}\n'.format(nodata))
+                georeference = getattr(like, 'georeference', None) or {}
+                if 'map info' not in georeference:
+                    georeference = dict(_envi_georeference(like),
+                                        **georeference)
+                for key in ENVI_GEOREFERENCE:
+                    if key in georeference:
+                        f.write('{0} = {{{1}}}\n'.format(key,
+                                                         georeference[key]))
+            self._data = numpy.memmap(raster_file,
+                                      dtype=self.dtype.newbyteorder('<'),
+                                      mode='w+', shape=(y_size, x_size))
+
+    def write(self, data, xoff, yoff):
+        ''' Write a block of values.
+
+        @param data numpy 2D array of values
+        @param xoff int column of the upper left cell of the block
+        @param yoff int row of the upper left cell of the block
+        '''
+        data = numpy.asarray(data, dtype=self.dtype)
+        if self._data is not None:
+            # Blocks are disjoint slices of the memory map
+            rows, cols = data.shape
+            self._data[yoff:yoff + rows, xoff:xoff + cols] = data
+            return
+        with self._lock:
+            self._band.WriteArray(data, xoff, yoff)
+
+    def close(self):
+        ''' Flush the raster to disk. '''
+        if self._data is not None:
+            self._data.flush()
+            self._data = None
+        if self._dataset is not None:
+            self._band.FlushCache()
+            self._band = None
+            self._dataset = None
@@ -2,28 +2,134 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import hashlib
+from multiprocessing import cpu_count
 import os
+import pickle
 import sys
+
 import yaml
 
+from ztools.cache import CACHE_DIR
+from ztools.store import (format_table, GROUP_COLUMNS, ResultStore,
+                          STAGES, system_fields)
+from ztools.stats import mann_whitney_u, median, min_p_value, min_samples
+from ztools.utilities import check_output_name, load_results
+
+
+def read_result_file(input_file, cache_dir=CACHE_DIR):
+    ''' Read a result YAML file using a binary cache of parsed results.
+
+    Parsed results are pickled in cache_dir and reused as long as the size
+    and modification time of the YAML file do not change.
+
+    @param input_file String file path to the results YAML file
+    @param cache_dir String folder of the cache, None disables caching
+    @return results dict of file contents
+    '''
+    stat = os.stat(input_file)
+    key = (stat.st_size, stat.st_mtime)
+
+    cache_file = None
+    if cache_dir:
+        name = hashlib.sha1(os.path.abspath(input_file).encode('utf-8'))
+        cache_file = os.path.join(cache_dir, 'reader',
+                                  name.hexdigest() + '.pickle')
+        try:
+            with open(cache_file, 'rb') as f:
+                cached_key, results = pickle.load(f)
+            if cached_key == key:
+                return results
+        except (IOError, OSError, EOFError, pickle.UnpicklingError,
+                ValueError):
+            pass
+
+    results = load_results(input_file)
+
+    if cache_file:
+        try:
+            if not os.path.isdir(os.path.dirname(cache_file)):
+                os.makedirs(os.path.dirname(cache_file))
+            with open(cache_file, 'wb') as f:
+                pickle.dump((key, results), f, pickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError):
+            pass
+
+    return results
+
+
+def read_result_files(patterns, jobs=None, cache_dir=CACHE_DIR):
+    ''' Read many result YAML files in parallel.
+
+    File names may be glob patterns. Files that cannot be read are reported
+    and skipped.
+
+    @param patterns String list of file paths or glob patterns
+    @param jobs int number of parallel reader processes (default: core count)
+    @param cache_dir String folder of the parsed results cache
+    @return results list of (file path, results dict) tuples in input order
+    '''
+    input_files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        for match in matches:
+            if match not in input_files:
+                input_files.append(match)
+
+    if not jobs or jobs < 1:
+        jobs = cpu_count()
+    jobs = min(jobs, len(input_files))
+
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(read_result_file, input_file,
+                                       cache_dir)
+                       for input_file in input_files]
+            outcomes = []
+            for future in futures:
+                try:
+                    outcomes.append(future.result())
+                except (IOError, OSError, yaml.YAMLError) as e:
+                    outcomes.append(e)
+    else:
+        outcomes = []
+        for input_file in input_files:
+            try:
+                outcomes.append(read_result_file(input_file, cache_dir))
+            except (IOError, OSError, yaml.YAMLError) as e:
+                outcomes.append(e)
+
+    results = []
+    for input_file, outcome in zip(input_files, outcomes):
+        if isinstance(outcome, Exception):
+            sys.stderr.write('WARNING: Could not read {0}: {1}\n'.format(
+                             input_file, outcome))
+        else:
+            results.append((input_file, outcome))
+    return results
+
 
 class ZReader(object):
     ''' ZReader class for reading various ztests outputs.
 
     Each instance of ZReader class corresponds to a single result
-    (YAML) file.
+    (YAML) file. Already loaded file contents can be given as results.
     '''
 
-    def __init__(self, input_file):
+    def __init__(self, input_file, results=None):
         # Inititate instance attributes
         self.results = {}
+        # Machines of runs with their own sys_info (merged shards, workers)
+        self.machines = {}
         self.time = None
         self.uname = None
         self.version = None
         self.zversion = None
 
         self.input_file = input_file
-        self.parse_results(input_file)
+        self.parse_results(input_file, results)
 
     def print_cli(self, line_length=79):
 
@@ -45,41 +151,50 @@ class ZReader(object):
         print(header)
 
         if self.results:
-            run_names = self.results.keys()
-            run_names.sort()
-            for run_name in run_names:
+            for run_name in sorted(self.results.keys()):
                 print('[' + run_name + ']')
                 run_info = self.results[run_name]
+                if run_name in self.machines:
+                    print(self._pad_string('Test computer',
+                                           self.machines[run_name],
+                                           title_lenght=30))
                 if 'ERROR' in run_info.keys():
                     print('The run was not executed succesfully:')
                     print(run_info['ERROR'])
                 else:
                     print(self._pad_string('Time to initialize (Zonation)',
-                                           run_info['init'],
-                                           title_lenght=30) + ' s')
+                                           self._stage_value(run_info,
+                                                             'init'),
+                                           title_lenght=30))
                     print(self._pad_string('Cell removal time (Zonation)',
-                                           run_info['init'],
-                                           title_lenght=30) + ' s')
+                                           self._stage_value(run_info,
+                                                             'cellrem'),
+                                           title_lenght=30))
                     print(self._pad_string('Total elapsed time (Zonation)',
-                                           run_info['measured'],
-                                           title_lenght=30) + ' s')
+                                           self._stage_value(run_info,
+                                                             'elapsed'),
+                                           title_lenght=30))
 
                 print(self._pad_string('Total measured time (ztools)',
-                                       run_info['measured'],
-                                       title_lenght=30) + ' s')
+                                       self._stage_value(run_info,
+                                                         'measured'),
+                                       title_lenght=30))
                 print('\n')
         else:
             print('WARNING: No results parsed by the reader.')
 
-    def parse_results(self, input_file):
+    def parse_results(self, input_file, results=None):
         ''' Read in the provided YAML file and parse results.
 
         Common result inforamation are parsed to object attributes.
 
         @param input_file String file path to the results YAML file.
+        @param results dict of already loaded file contents
         '''
 
-        results = self._read_results(input_file)
+        if results is None:
+            results = self._read_results(input_file)
+        results = dict(results)
 
         # First, get the system information
         try:
@@ -88,7 +203,7 @@ class ZReader(object):
             sys_info = {}
             # Convert a list of dicts into a single dict
             for item in sys_info_list:
-                for key, value in item.iteritems():
+                for key, value in item.items():
                     sys_info[key] = value
 
             self.time = sys_info['Report time']
@@ -102,10 +217,14 @@ class ZReader(object):
             self.zversion = '.'.join(results.pop('z_info'))
 
             # Remaining key-value pairs are the actual runs
-            for run_file, run_info in results.iteritems():
-                self.results[os.path.basename(run_file)] = run_info
+            for run_file, run_info in results.items():
+                run_name = os.path.basename(run_file)
+                self.results[run_name] = run_info
+                if isinstance(run_info, dict) and run_info.get('sys_info'):
+                    self.machines[run_name] = system_fields(
+                        {}, run_info)['machine']
 
-        except KeyError, e:
+        except KeyError as e:
             sys.stderr.write('ERROR: Missing key {0}\n'.format(e))
 
     def _pad_string(self, title, value, title_lenght=15, line_length=79):
@@ -123,6 +242,24 @@ class ZReader(object):
         title_value = ' ' * n_pad_ws + title + ': ' + value
         return title_value
 
+    def _stage_value(self, run_info, stage):
+        ''' Helper method to format the time of a stage.
+
+        Repeated measurements are shown as median with their spread,
+        single measurements as such.
+
+        @param run_info dict of results of a single run
+        @param stage String name of the stage
+        @return value String formatted stage time
+        '''
+        stats = run_info.get('stats', {}).get(stage)
+        if stats:
+            return ('{0} s (median of {1}, IQR {2}, min {3}, 95% CI ' +
+                    '{4}-{5})').format(stats['median'], stats['n'],
+                                       stats['iqr'], stats['min'],
+                                       stats['ci'][0], stats['ci'][1])
+        return '{0} s'.format(run_info.get(stage, '-'))
+
     def _read_results(self, input_file):
         ''' Read in the provided YAML file of Zonation results.
 
@@ -130,23 +267,429 @@ class ZReader(object):
 
         '''
         try:
-            f = open(input_file, 'r')
-        except IOError:
+            return read_result_file(input_file)
+        except (IOError, OSError):
             sys.stderr.write('ERROR: Input YAML file {0}'.format(input_file) +
                              ' does not exist\n')
             sys.exit(1)
-        with f:
-            results = yaml.load(f)
-        return results
+
+
+def print_table(readers, stage='measured'):
+    ''' Print the time of a stage for all runs across result sets.
+
+    Rows are runs and columns are result sets, labelled by machine names and
+    Zonation version. Failed runs are shown as ERROR and missing runs as -.
+
+    @param readers list of ZReader objects
+    @param stage String stage time shown
+    '''
+    labels = []
+    counts = {}
+    for reader in readers:
+        machines = set(reader.machines.values())
+        machines.add(reader.uname['name'] if reader.uname else '?')
+        label = '{0} ({1})'.format('+'.join(sorted(machines)),
+                                   reader.zversion)
+        counts[label] = counts.get(label, 0) + 1
+        if counts[label] > 1:
+            label += ' [{0}]'.format(counts[label])
+        labels.append(label)
+
+    run_names = sorted(set(name for reader in readers
+                           for name in reader.results))
+    rows = []
+    for run_name in run_names:
+        row = [run_name]
+        for reader in readers:
+            run_info = reader.results.get(run_name)
+            if run_info is None:
+                row.append(None)
+            elif 'ERROR' in run_info:
+                row.append('ERROR')
+            else:
+                row.append(run_info.get(stage))
+        rows.append(row)
+
+    print(format_table(['run'] + labels, rows))
+
+
+def run_samples(readers):
+    ''' Pool the stage time samples of runs over result sets.
+
+    Repeated measurements contribute all their samples, single runs their
+    stage times. A run that failed in any of the result sets is failed,
+    whatever the order of the readers.
+
+    @param readers list of ZReader objects
+    @return samples dict mapping run names to dicts of stage sample lists,
+            failed runs map to None
+    '''
+    samples = {}
+    failed = set()
+    for reader in readers:
+        for run_name, run_info in reader.results.items():
+            run_samples = samples.setdefault(run_name, {})
+            if 'ERROR' in run_info:
+                failed.add(run_name)
+                continue
+            for stage in STAGES:
+                values = (run_info.get('samples') or {}).get(stage)
+                if values is None and run_info.get(stage) is not None:
+                    values = [run_info[stage]]
+                if values:
+                    run_samples.setdefault(stage, []).extend(values)
+    for run_name in failed:
+        samples[run_name] = None
+    return samples
+
+
+def compare_results(baseline, candidate, stages=STAGES, threshold=0.05,
+                    alpha=0.05):
+    ''' Compare the stage times of runs between two sets of results.
+
+    Runs are matched by name. For each stage the relative change of the
+    median time is calculated and, when both sides have enough samples for
+    the test to reach alpha (see min_p_value(), e.g. 4 each at 0.05),
+    tested with a two-sided Mann-Whitney U test. With fewer samples the
+    verdict only depends on the threshold. The verdict of a stage is
+
+        SLOWER   median slower by more than threshold and the change is
+                 significant at alpha (or cannot be tested)
+        FASTER   the same for a faster median
+        unclear  change beyond threshold but not significant
+        same     change within threshold
+        FAILED   run failed in the candidate
+        MISSING  run of the baseline not found in the candidate
+
+    @param baseline list of ZReader objects
+    @param candidate list of ZReader objects
+    @param stages String list of compared stages
+    @param threshold float relative change regarded as relevant
+    @param alpha float significance level
+    @return rows list of (run, stage, baseline median, candidate median,
+            change, p-value, verdict) tuples
+    '''
+    baseline_samples = run_samples(baseline)
+    candidate_samples = run_samples(candidate)
+
+    rows = []
+    for run_name in sorted(baseline_samples):
+        if run_name not in candidate_samples:
+            rows.append((run_name, '-', None, None, None, None, 'MISSING'))
+            continue
+        base_run = baseline_samples[run_name]
+        cand_run = candidate_samples[run_name]
+        if cand_run is None:
+            rows.append((run_name, '-', None, None, None, None, 'FAILED'))
+            continue
+        if base_run is None:
+            continue
+
+        for stage in stages:
+            base_values = base_run.get(stage)
+            cand_values = cand_run.get(stage)
+            if not base_values or not cand_values:
+                continue
+            base_median = median(base_values)
+            cand_median = median(cand_values)
+            if base_median > 0:
+                change = cand_median / base_median - 1
+            else:
+                change = 0.0 if cand_median == base_median else float('inf')
+
+            p = None
+            # Too few samples could never be significant, not even if all
+            # candidate samples are slower than all baseline samples
+            if min_p_value(len(base_values), len(cand_values)) <= alpha:
+                p = mann_whitney_u(base_values, cand_values)[1]
+
+            if abs(change) <= threshold:
+                verdict = 'same'
+            elif p is not None and p > alpha:
+                verdict = 'unclear'
+            elif change > 0:
+                verdict = 'SLOWER'
+            else:
+                verdict = 'FASTER'
+            rows.append((run_name, stage, base_median, cand_median, change,
+                         p, verdict))
+    return rows
+
+
+def _system_key(sys_info):
+    ''' Get the parts of sys_info identifying a system (all but the report
+    time) in a comparable form.
+    '''
+    items = {}
+    for item in sys_info or []:
+        items.update(item)
+    items.pop('Report time', None)
+    return repr(sorted((key, list(value) if isinstance(value, (list, tuple))
+                        else value) for key, value in items.items()))
+
+
+def _report_time(sys_info):
+    for item in sys_info or []:
+        if 'Report time' in item:
+            return item['Report time'] or ''
+    return ''
+
+
+def merge_results(result_sets):
+    ''' Merge the results of the shards of a suite into one result set.
+
+    All result sets must have been run with the same Zonation version and a
+    run may only appear in one of them. The merged sys_info is that of the
+    earliest report. Runs of shards that ran on a different system get the
+    sys_info of their shard under 'sys_info'.
+
+    @param result_sets list of (input_file, results) tuples
+    @return merged dict of results
+    @raise ValueError if the result sets are not consistent
+    '''
+    result_sets = sorted(result_sets,
+                         key=lambda item: _report_time(item[1].get(
+                             'sys_info')))
+    first_file, first = result_sets[0]
+    merged = {'sys_info': first.get('sys_info'),
+              'z_info': first.get('z_info')}
+    system = _system_key(merged['sys_info'])
+    z_info = list(merged['z_info'] or [])
+    origin = {}
+    for input_file, results in result_sets:
+        if list(results.get('z_info') or []) != z_info:
+            raise ValueError('Zonation version of {0} ({1}) differs from '
+                             'that of {2} ({3})'.format(
+                                 input_file, results.get('z_info'),
+                                 first_file, merged['z_info']))
+        other_system = _system_key(results.get('sys_info')) != system
+        for key, run_info in results.items():
+            if key in ['sys_info', 'z_info']:
+                continue
+            if key in origin:
+                raise ValueError('Run {0} found in both {1} and {2}'.format(
+                                 key, origin[key], input_file))
+            origin[key] = input_file
+            if other_system and isinstance(run_info, dict):
+                run_info = dict(run_info)
+                run_info.setdefault('sys_info', results.get('sys_info'))
+            merged[key] = run_info
+    return merged
+
+
+def compare_main(argv):
+    parser = argparse.ArgumentParser(prog='zreader compare',
+                                     description='Compare stage times ' +
+                                                 'between baseline and ' +
+                                                 'candidate results. Exits ' +
+                                                 'with status 1 if a run ' +
+                                                 'got slower, failed or is ' +
+                                                 'missing.')
+
+    parser.add_argument('-b', '--baseline', dest='baseline', nargs='+',
+                        required=True,
+                        help='baseline yaml files or glob patterns')
+    parser.add_argument('-c', '--candidate', dest='candidate', nargs='+',
+                        required=True,
+                        help='candidate yaml files or glob patterns')
+    parser.add_argument('-t', '--threshold', dest='threshold', type=float,
+                        default=0.05,
+                        help='relative slowdown regarded as a regression ' +
+                             '(default: 0.05)')
+    parser.add_argument('-a', '--alpha', dest='alpha', type=float,
+                        default=0.05,
+                        help='significance level (default: 0.05)')
+    parser.add_argument('--stages', dest='stages', nargs='+', choices=STAGES,
+                        default=STAGES,
+                        help='compared stages (default: all)')
+
+    args = parser.parse_args(argv)
+
+    readers = {}
+    for name in ['baseline', 'candidate']:
+        results = read_result_files(getattr(args, name))
+        if not results:
+            sys.stderr.write('ERROR: No {0} result files could be '
+                             'read\n'.format(name))
+            sys.exit(2)
+        readers[name] = [ZReader(input_file, file_results)
+                         for input_file, file_results in results]
+
+    rows = compare_results(readers['baseline'], readers['candidate'],
+                           args.stages, args.threshold, args.alpha)
+
+    table_rows = []
+    for run_name, stage, base, cand, change, p, verdict in rows:
+        if change is not None:
+            change = '{0:+.1f}%'.format(100 * change)
+        table_rows.append((run_name, stage, base, cand, change, p, verdict))
+    print(format_table(['run', 'stage', 'baseline', 'candidate', 'change',
+                        'p', 'verdict'], table_rows))
+
+    if any(row[4] is not None and row[5] is None for row in rows):
+        print('\nINFO: Changes without a p-value are judged by the threshold '
+              'only, testing them at alpha {0} needs at least {1} samples '
+              'on both sides (zrunner -r {1})'.format(
+                  args.alpha, min_samples(args.alpha)))
+
+    regressions = [row for row in rows
+                   if row[6] in ['SLOWER', 'FAILED', 'MISSING']]
+    if regressions:
+        print('\nERROR: {0} regressions found'.format(len(regressions)))
+        sys.exit(1)
+    print('\nINFO: No regressions found')
+
+
+def import_main(argv):
+    parser = argparse.ArgumentParser(prog='zreader import',
+                                     description='Import zrunner result ' +
+                                                 'files into a results ' +
+                                                 'database')
+
+    parser.add_argument('db_file', metavar='DB', type=str,
+                        help='results database (created if needed)')
+    parser.add_argument('input_files', metavar='INPUT', type=str, nargs='+',
+                        help='input yaml files')
+
+    args = parser.parse_args(argv)
+
+    store = ResultStore(args.db_file)
+    n_added = store.import_files(args.input_files)
+    store.close()
+    print('INFO: Imported {0} runs into {1}'.format(n_added, args.db_file))
+
+
+def query_main(argv):
+    parser = argparse.ArgumentParser(prog='zreader query',
+                                     description='Query a results database')
+
+    parser.add_argument('db_file', metavar='DB', type=str,
+                        help='results database')
+    parser.add_argument('--run', dest='run',
+                        help='run name, SQL LIKE patterns allowed')
+    parser.add_argument('--machine', dest='machine',
+                        help='machine name, SQL LIKE patterns allowed')
+    parser.add_argument('--zversion', dest='zversion',
+                        help='Zonation version, SQL LIKE patterns allowed')
+    parser.add_argument('--since', dest='since', metavar='DATE',
+                        help='earliest report date (YYYY-MM-DD)')
+    parser.add_argument('--until', dest='until', metavar='DATE',
+                        help='latest report date (YYYY-MM-DD)')
+    parser.add_argument('-g', '--group-by', dest='group_by', nargs='+',
+                        choices=sorted(GROUP_COLUMNS.keys()),
+                        help='summarise over groups')
+    parser.add_argument('--stage', dest='stage', default='measured',
+                        choices=STAGES,
+                        help='stage time summarised in groups ' +
+                             '(default: measured)')
+
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db_file):
+        sys.stderr.write('ERROR: Database {0} does not exist\n'.format(
+                         args.db_file))
+        sys.exit(1)
+
+    store = ResultStore(args.db_file)
+    header, rows = store.query(run=args.run, machine=args.machine,
+                               zversion=args.zversion, since=args.since,
+                               until=args.until, group_by=args.group_by,
+                               stage=args.stage)
+    store.close()
+    print(format_table(header, rows))
+
+
+def merge_main(argv):
+    parser = argparse.ArgumentParser(prog='zreader merge',
+                                     description='Merge the result files ' +
+                                                 'of suite shards (see ' +
+                                                 'zrunner --shard) into ' +
+                                                 'one result file')
+
+    parser.add_argument('input_files', metavar='INPUT', type=str, nargs='+',
+                        help='input yaml files or glob patterns')
+    parser.add_argument('-o', '--outputfile', dest='output_file',
+                        required=True, help='name of the merged result file')
+    parser.add_argument('-w', '--overwrite', dest='overwrite',
+                        action='store_true',
+                        help='overwrite an existing output file')
+
+    args = parser.parse_args(argv)
+
+    input_files = []
+    for pattern in args.input_files:
+        input_files.extend(sorted(glob.glob(pattern)) or [pattern])
+
+    result_sets = []
+    for input_file in input_files:
+        try:
+            results = load_results(input_file)
+        except (IOError, yaml.YAMLError) as e:
+            sys.stderr.write('ERROR: Could not read {0}: {1}\n'.format(
+                             input_file, e))
+            sys.exit(1)
+        if not isinstance(results, dict):
+            sys.stderr.write('ERROR: {0} is not a result file\n'.format(
+                             input_file))
+            sys.exit(1)
+        result_sets.append((input_file, results))
+
+    try:
+        merged = merge_results(result_sets)
+    except ValueError as e:
+        sys.stderr.write('ERROR: {0}\n'.format(e))
+        sys.exit(1)
+
+    output_file = args.output_file
+    if not args.overwrite:
+        output_file = check_output_name(output_file)
+    with open(output_file, 'w') as f:
+        f.write(yaml.dump(merged, canonical=True))
+    print('INFO: Merged {0} runs from {1} files into {2}'.format(
+          len(merged) - 2, len(result_sets), output_file))
+
+
+# Subcommands for results databases, given as the first argument
+COMMANDS = {'compare': compare_main,
+            'import': import_main,
+            'merge': merge_main,
+            'query': query_main}
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Read ztests result file')
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
 
-    parser.add_argument('input_file', metavar='INPUT', type=str,
-                        help='input yaml file')
+    parser = argparse.ArgumentParser(description='Read ztests result file',
+                                     epilog='Results databases are handled ' +
+                                            'with subcommands: ' +
+                                            ', '.join(sorted(COMMANDS)) +
+                                            ' (see zreader COMMAND -h)')
+
+    parser.add_argument('input_files', metavar='INPUT', type=str, nargs='+',
+                        help='input yaml files or glob patterns')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None,
+                        help='number of files read in parallel ' +
+                             '(default: number of cores)')
+    parser.add_argument('--stage', dest='stage', default='measured',
+                        choices=STAGES,
+                        help='stage time shown for many result files ' +
+                             '(default: measured)')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='do not use cached parsed results')
 
     args = parser.parse_args()
 
-    reader = ZReader(args.input_file)
-    reader.print_cli()
+    cache_dir = CACHE_DIR if args.cache else None
+    results = read_result_files(args.input_files, args.jobs, cache_dir)
+    if not results:
+        sys.stderr.write('ERROR: No result files could be read\n')
+        sys.exit(1)
+
+    readers = [ZReader(input_file, file_results)
+               for input_file, file_results in results]
+    if len(readers) == 1:
+        readers[0].print_cli()
+    else:
+        print_table(readers, args.stage)
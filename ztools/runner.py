@@ -2,17 +2,45 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import asyncio
+from asyncio import FIRST_COMPLETED
+from collections import OrderedDict
+from functools import partial
+import gzip
+import math
+from multiprocessing import cpu_count
 import os
 from pprint import pprint
-from subprocess import Popen
+import signal
+from subprocess import PIPE, Popen
 import sys
 import time
 
-from ztools.utilities import (check_output_name, display_time, get_system_info,
-                               get_zonation_info, pad_header,
-                               ZonationRuninfoException)
+try:
+    import resource
+except ImportError:
+    resource = None
 
-from ztools.parser import parse_results
+from ztools.utilities import (check_output_name, display_time, format_size,
+                               get_system_info, get_zonation_info, pad_header,
+                               parse_size, ZonationRuninfoException)
+
+from ztools.cache import HashCache, ResultCache, run_fingerprint, CACHE_DIR
+from ztools.history import load_history, recorded_duration
+from ztools.memory import estimate_memory
+from ztools.monitor import ResourceMonitor, rusage_dict, Watchdog
+from ztools.notify import Notifier, SlackSink, WebhookSink
+from ztools.parser import parse_results, RuninfoTailer
+from ztools.schedule import (lpt_order, parse_shard, predict_makespan,
+                             predicted_durations, shard_runs)
+from ztools.stats import summarize
+from ztools.store import format_table, ResultStore
+
+# Stage times sampled in repeated runs
+SAMPLED_STAGES = ['init', 'cellrem', 'elapsed', 'measured']
+
+# Seconds between polls of the run info file of a run in progress
+FOLLOW_INTERVAL = 1.0
 
 
 def read_run(file_list, executable=None):
@@ -68,34 +96,394 @@ def read_run(file_list, executable=None):
         sys.exit(1)
 
 
-def run_suite():
-    pass
+def run_suite(cmd_args, jobs=None, on_start=None, on_finish=None,
+              on_event=None, mem_budget=None, estimates=None,
+              run_options=None):
+    ''' Runs a suite of Zonation analyses concurrently.
+
+    The runs are orchestrated from a single asyncio event loop (see
+    run_suite_async()), which is created for the call and closed afterwards.
+    Parameters are those of run_suite_async().
+
+    @return output dict of per-run dicts keyed by the bat/sh file path
+    '''
+    return _run_coroutine(run_suite_async(cmd_args, jobs, on_start,
+                                          on_finish, on_event, mem_budget,
+                                          estimates, run_options))
+
+
+async def run_suite_async(cmd_args, jobs=None, on_start=None, on_finish=None,
+                          on_event=None, mem_budget=None, estimates=None,
+                          run_options=None):
+    ''' Runs a suite of Zonation analyses concurrently.
+
+    Each run is a task in the running event loop, at most jobs of them at a
+    time. The tasks only wait for their own Zonation process, so the wall
+    time measured by run_analysis_async() is not affected by other runs.
+
+    If a memory budget is given, a run is only started when its estimated
+    peak memory fits into the part of the budget not reserved by the runs
+    in progress. Pending runs are packed first-fit, so smaller runs can
+    start while a large one waits. A run larger than the whole budget is
+    started alone.
+
+    On SIGINT or SIGTERM no more runs are started, the runs in progress are
+    terminated and recorded with ERROR 'INTERRUPTED', and the results of
+    the finished runs are returned.
+
+    @param cmd_args dict of command sequences as returned by read_run()
+    @param jobs int maximum number of concurrent runs (default: core count)
+    @param on_start callable(file_path, run_no) called when a run starts
+    @param on_finish callable(file_path, run_no, run_info) called when a run
+                     finishes
+    @param on_event callable(file_path, event) called for run progress events
+                    (see ztools.parser.RuninfoTailer)
+    @param mem_budget int memory budget in bytes (default: no limit)
+    @param estimates dict of estimated peak memory in bytes per file path
+    @param run_options dict of keyword arguments passed to
+                       run_repeated_async()
+    @return output dict of per-run dicts keyed by the bat/sh file path
+    '''
+    if not jobs or jobs < 1:
+        jobs = cpu_count()
+    if estimates is None:
+        estimates = {}
+    if run_options is None:
+        run_options = {}
+
+    loop = asyncio.get_event_loop()
+    interrupt = asyncio.Event()
+    handled = []
+    for signum in [signal.SIGINT, getattr(signal, 'SIGTERM', None)]:
+        try:
+            loop.add_signal_handler(signum, interrupt.set)
+            handled.append(signum)
+        except (NotImplementedError, RuntimeError, TypeError, ValueError):
+            # Not supported by the loop (Windows) or not the main thread
+            pass
+    run_options = dict(run_options, interrupt=interrupt)
+
+    pending = list(cmd_args.items())
+    running = {}
+    output = {}
+    run_no = 0
+    reserved = 0
+
+    try:
+        while running or (pending and not interrupt.is_set()):
+            # Fill all free slots before waiting for anything to finish
+            while (pending and len(running) < jobs and
+                   not interrupt.is_set()):
+                index = 0
+                if mem_budget:
+                    index = _first_fit(pending, estimates,
+                                       mem_budget - reserved)
+                    if index is None:
+                        if running:
+                            # Wait for a run to finish and release its memory
+                            break
+                        index = 0
+                        print('WARNING: Estimated memory of {0} ({1}) '
+                              'exceeds the memory budget, running it '
+                              'alone'.format(
+                                  pending[0][0],
+                                  format_size(estimates[pending[0][0]])))
+                file_path, _cmd_args = pending.pop(index)
+                run_no += 1
+                reserved += estimates.get(file_path) or 0
+                if on_start:
+                    on_start(file_path, run_no)
+                task = asyncio.ensure_future(
+                    _run_task(file_path, _cmd_args, on_event, run_options))
+                running[task] = (file_path, run_no)
+
+            done, _ = await asyncio.wait(list(running),
+                                         return_when=FIRST_COMPLETED)
+            for task in done:
+                file_path, task_no = running.pop(task)
+                run_info = task.result()
+                reserved -= estimates.get(file_path) or 0
+                if estimates.get(file_path):
+                    run_info['mem_estimate'] = estimates[file_path]
+                output[file_path] = run_info
+                if on_finish:
+                    on_finish(file_path, task_no, run_info)
+    finally:
+        for signum in handled:
+            loop.remove_signal_handler(signum)
+
+    if pending:
+        print('WARNING: Interrupted, {0} runs not started'.format(
+              len(pending)))
+    return output
+
+
+def _first_fit(pending, estimates, available):
+    ''' Get the index of the first pending run fitting in available memory.
+
+    Runs without an estimate always fit.
+
+    @param pending list of (file_path, cmd_args) tuples
+    @param estimates dict of estimated peak memory in bytes per file path
+    @param available int memory available in bytes
+    @return index int index in pending or None if no run fits
+    '''
+    for index, (file_path, _cmd_args) in enumerate(pending):
+        if (estimates.get(file_path) or 0) <= available:
+            return index
+    return None
+
+
+async def _run_task(file_path, cmd_args, on_event, run_options):
+    ''' Task body for run_suite_async().
+
+    Any exception is reported as a run error so that a single failing run
+    (e.g. a missing executable) does not stall the whole suite.
+
+    @param file_path String path to the bat/sh file
+    @param cmd_args list of Zonation command line arguments
+    @param on_event callable(file_path, event) called for run progress events
+    @param run_options dict of keyword arguments passed to
+                       run_repeated_async()
+    @return run_info dict of run results
+    '''
+    if on_event:
+        run_options = dict(run_options, on_event=partial(on_event, file_path))
+    try:
+        return await run_repeated_async(file_path, cmd_args, **run_options)
+    except Exception as e:
+        print('ERROR: Run {0} failed: {1}'.format(file_path, e))
+        return {'ERROR': str(e)}
+
+
+def run_repeated(file_path, cmd_args, repeat=1, warmup=0, **options):
+    ''' Runs an analysis repeatedly for benchmarking.
 
+    Synchronous version of run_repeated_async() running in its own event
+    loop.
 
-def run_analysis(file_path, cmd_args):
+    @return run_info dict of run results
+    '''
+    return _run_coroutine(run_repeated_async(file_path, cmd_args, repeat,
+                                             warmup, **options))
+
+
+async def run_repeated_async(file_path, cmd_args, repeat=1, warmup=0,
+                             **options):
+    ''' Runs an analysis repeatedly for benchmarking.
+
+    The first warmup repetitions are run but not recorded. The stage times of
+    the recorded repetitions are stored as lists under 'samples' and
+    summarised under 'stats' (see ztools.stats.summarize), and the stage
+    times themselves are replaced by their medians. All other results are
+    those of the last repetition. A failing repetition ends the benchmark
+    and its results are returned.
+
+    @param file_path String path to the bat/sh file
+    @param cmd_args list of Zonation command line arguments
+    @param repeat int number of recorded repetitions
+    @param warmup int number of unrecorded repetitions run first
+    @param options keyword arguments passed to run_analysis_async()
+    @return run_info dict of run results
+    '''
+    if repeat <= 1 and warmup <= 0:
+        return await run_analysis_async(file_path, cmd_args, **options)
+
+    for i in range(warmup):
+        run_info = await run_analysis_async(file_path, cmd_args, **options)
+        if 'ERROR' in run_info:
+            return run_info
+
+    samples = {}
+    for i in range(max(repeat, 1)):
+        run_info = await run_analysis_async(file_path, cmd_args, **options)
+        if 'ERROR' in run_info:
+            return run_info
+        for stage in SAMPLED_STAGES:
+            if stage in run_info:
+                samples.setdefault(stage, []).append(run_info[stage])
+
+    run_info['samples'] = samples
+    run_info['stats'] = {}
+    for stage, values in samples.items():
+        run_info['stats'][stage] = summarize(values)
+        run_info[stage] = run_info['stats'][stage]['median']
+
+    return run_info
+
+
+def runinfo_path(file_path, cmd_args):
+    ''' Get the path of the run info file a Zonation run writes.
+
+    Output name pattern is the 5th item in the bat/sh file and it is relative
+    to the folder of the bat/sh file.
+
+    @param file_path String path to the bat/sh file
+    @param cmd_args list of Zonation command line arguments
+    @return output_filepath String absolute path to the run info file
+    '''
+    return os.path.abspath(os.path.join(os.path.dirname(file_path),
+                                        cmd_args[4]))
+
+
+def run_analysis(file_path, cmd_args, **options):
+    ''' Zonation analysis runner.
+
+    Synchronous version of run_analysis_async() running in its own event
+    loop.
+
+    @return elapsed_times dict of seconds of analysis runtime
+    '''
+    return _run_coroutine(run_analysis_async(file_path, cmd_args, **options))
+
+
+async def run_analysis_async(file_path, cmd_args, sample_interval=1.0,
+                             timeseries=False, on_event=None,
+                             stall_timeout=None, timeout=None, deadline=None,
+                             max_memory=None, max_cpu_time=None,
+                             interrupt=None, grace=5.0):
     ''' Zonation analysis runner.
 
-    Runs a single analysis based on parsed arguments.
+    Runs a single analysis based on parsed arguments. The standard output
+    and error of Zonation are written through async readers into gzip
+    compressed logs next to the run info file (RUNINFO.stdout.log.gz and
+    RUNINFO.stderr.log.gz), their paths are stored under 'logs'. While the
+    analysis runs, the resource use of its process tree is sampled every
+    sample_interval seconds (see ztools.monitor.ResourceMonitor) and the
+    run info file is followed for progress (see ztools.parser.RuninfoTailer).
+    The wall clock time spent in each stage is stored under 'stages'. All of
+    this is done in the running event loop, without threads. The exited
+    process is reaped with os.wait4() and the exact usage reported by the
+    kernel is stored under resources 'rusage', with the peak resident
+    memory under 'max_rss' and the user and system time under 'cpu_time'.
+
+    Zonation runs in its own process group. If the run exceeds its wall
+    clock limit (timeout or the suite deadline) or its memory limit, the
+    whole group is terminated (see ztools.monitor.Watchdog) and the run is
+    recorded with ERROR 'TIMEOUT' or 'OOM' and the usage at that time under
+    'killed'. The CPU time limit is applied with setrlimit and enforced by
+    the kernel. Without resource sampling the memory limit is applied to the
+    address space with setrlimit instead. Setting the interrupt event
+    terminates the run the same way with ERROR 'INTERRUPTED'.
 
     @param name String name of the analysis being run
     @param cmd_args list of Zonation command line arguments
+    @param sample_interval float seconds between resource samples, 0
+                           disables sampling
+    @param timeseries bool write the sampled time series next to the run
+                      info file
+    @param on_event callable(event) called for each progress event
+    @param stall_timeout float seconds without run info output after which
+                         a 'stalled' event is emitted
+    @param timeout float wall clock limit of the run in seconds
+    @param deadline float time (time.monotonic()) by which the suite must
+                    end
+    @param max_memory int memory limit of the run in bytes
+    @param max_cpu_time float CPU time limit of the run in seconds
+    @param interrupt asyncio.Event terminating the run when set
+    @param grace float seconds between SIGTERM and SIGKILL when terminating
 
     @return elapsed_times dict of seconds of analysis runtime
     '''
 
-    t0 = time.time()
-    p = Popen(cmd_args, cwd=os.path.dirname(file_path))
-    p.wait()
+    # Get also the times reported by Zonation
+    output_filepath = runinfo_path(file_path, cmd_args)
+
+    limit = 'wall clock'
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if timeout is None or remaining < timeout:
+            timeout = remaining
+            limit = 'suite'
+        if timeout <= 0:
+            print('WARNING: Suite time limit reached, not running {0}'.format(
+                  file_path))
+            return {'ERROR': 'TIMEOUT',
+                    'killed': {'limit': limit, 'elapsed': 0.0}}
+
+    rlimits = _rlimits(max_cpu_time,
+                       max_memory if sample_interval <= 0 else None)
+    preexec_fn = None
+    if rlimits and not hasattr(resource, 'prlimit'):
+        preexec_fn = partial(_set_rlimits, rlimits)
+
+    log_base = os.path.splitext(output_filepath)[0]
+    logs = {'stdout': log_base + '.stdout.log.gz',
+            'stderr': log_base + '.stderr.log.gz'}
+    if not os.path.isdir(os.path.dirname(log_base)):
+        os.makedirs(os.path.dirname(log_base))
+
+    tailer = RuninfoTailer(output_filepath, stall_timeout)
+
+    t0 = time.perf_counter()
+    process = Popen(cmd_args, cwd=os.path.dirname(file_path), stdout=PIPE,
+                    stderr=PIPE, start_new_session=hasattr(os, 'setsid'),
+                    preexec_fn=preexec_fn)
+    if rlimits and preexec_fn is None:
+        _set_rlimits(rlimits, process.pid)
+    readers = []
+    for stream in ['stdout', 'stderr']:
+        reader = await _pipe_reader(getattr(process, stream))
+        readers.append(asyncio.ensure_future(_write_log(reader,
+                                                        logs[stream])))
+    # Reaped here instead of by the loop to get the resource usage as well
+    exited = asyncio.ensure_future(_wait_exit(process))
+
+    monitor = None
+    if sample_interval > 0:
+        monitor = ResourceMonitor(process.pid, sample_interval)
+    watchdog = Watchdog(process, timeout, max_memory, monitor)
+
+    waiting = [exited]
+    if interrupt is not None:
+        interrupted = asyncio.ensure_future(interrupt.wait())
+        waiting.append(interrupted)
 
-    t1 = time.time()
+    # Times (seconds since t0) of the next sample, progress poll and kill
+    next_sample = next_poll = 0.0
+    kill_at = None
+    while not exited.done():
+        elapsed = time.perf_counter() - t0
+        if monitor and elapsed >= next_sample:
+            monitor.sample()
+            next_sample = elapsed + sample_interval
+        if elapsed >= next_poll:
+            _poll_events(tailer, on_event)
+            next_poll = elapsed + FOLLOW_INTERVAL
+        if watchdog.reason is None:
+            reason = watchdog.check(elapsed)
+            if reason is None and interrupt and interrupt.is_set():
+                reason = 'INTERRUPTED'
+            if reason:
+                watchdog.terminate(reason, elapsed)
+                kill_at = elapsed + grace
+        elif elapsed >= kill_at:
+            watchdog.kill()
+            kill_at = float('inf')
+        if interrupt is not None and interrupted.done() and \
+                interrupted in waiting:
+            # Handled, waiting for it again would return at once
+            waiting.remove(interrupted)
+
+        wake = [next_poll, kill_at or float('inf')]
+        if monitor:
+            wake.append(next_sample)
+        if timeout is not None and timeout > elapsed:
+            wake.append(timeout)
+        await asyncio.wait(waiting, timeout=max(min(wake) - elapsed, 0.01),
+                           return_when=FIRST_COMPLETED)
+
+    t1 = time.perf_counter()
 
     total = t1 - t0
+    rusage = exited.result()
+
+    if interrupt is not None:
+        interrupted.cancel()
+    await asyncio.gather(*readers)
+    _poll_events(tailer, on_event)
+    tailer.close()
 
-    # Get also the times reported by Zonation. Output name pattern is the 5th
-    # item in the bat/sh file
-    output_filepath = cmd_args[4]
-    output_filepath = os.path.abspath(os.path.join(os.path.dirname(file_path),
-                                                   output_filepath))
     try:
         elapsed_times = parse_results(output_filepath)
     except ZonationRuninfoException as e:
@@ -103,11 +491,223 @@ def run_analysis(file_path, cmd_args):
         elapsed_times = {}
         elapsed_times['ERROR'] = str(e)
 
-    elapsed_times['measured'] = round(total, 0)
+    elapsed_times['measured'] = round(total, 3)
+    elapsed_times['stages'] = tailer.stage_times()
+    elapsed_times['logs'] = logs
+
+    resources = {}
+    if monitor:
+        resources = monitor.summary()
+        resources['cpu_time'] = monitor.cpu_time()
+        if timeseries and monitor.samples:
+            timeseries_file = log_base + '.resources.csv'
+            monitor.write_timeseries(timeseries_file)
+            resources['timeseries'] = timeseries_file
+    if rusage:
+        resources['rusage'] = rusage_dict(rusage)
+        # Exact totals from the kernel, samples can miss a short peak and
+        # the CPU time used after the last sample
+        resources['max_rss'] = resources['rusage']['maxrss']
+        resources['peak_rss'] = max(resources.get('peak_rss', 0),
+                                    resources['max_rss'])
+        resources['cpu_time'] = round(resources['rusage']['utime'] +
+                                      resources['rusage']['stime'], 3)
+    if resources:
+        elapsed_times['resources'] = resources
+
+    killed = None
+    if watchdog.reason:
+        killed = dict(watchdog.usage)
+        killed['limit'] = {'TIMEOUT': limit, 'OOM': 'memory',
+                           'INTERRUPTED': 'signal'}[watchdog.reason]
+        elapsed_times['ERROR'] = watchdog.reason
+    elif max_cpu_time and process.returncode in [
+            -getattr(signal, 'SIGXCPU', 0), -signal.SIGKILL]:
+        killed = {'limit': 'cpu time', 'elapsed': round(total, 3)}
+        if 'cpu_time' in resources:
+            killed['cpu_time'] = resources['cpu_time']
+        elapsed_times['ERROR'] = 'TIMEOUT'
+    elif max_memory and not monitor and process.returncode < 0:
+        # Failed allocations beyond the address space limit
+        elapsed_times['ERROR'] = 'OOM'
+        killed = {'limit': 'memory', 'elapsed': round(total, 3)}
+    if killed:
+        if watchdog.reason == 'INTERRUPTED':
+            print('WARNING: Run {0} interrupted'.format(file_path))
+        else:
+            print('WARNING: Run {0} exceeded its {1} limit'.format(
+                  file_path, killed['limit']))
+        elapsed_times['killed'] = killed
 
     return elapsed_times
 
 
+async def _pipe_reader(pipe):
+    ''' Read a pipe of a subprocess.Popen in the running event loop.
+
+    @param pipe file object, e.g. Popen.stdout
+    @return reader asyncio.StreamReader
+    '''
+    loop = asyncio.get_event_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    return reader
+
+
+async def _wait_exit(process, poll_interval=0.1):
+    ''' Wait for a process to exit and reap it with its resource usage.
+
+    The process is reaped with os.wait4(), so it must not be waited for
+    elsewhere. Where the kernel supports pid file descriptors the exit wakes
+    the loop immediately, otherwise it is polled every poll_interval
+    seconds. The return code is set on the process.
+
+    @param process subprocess.Popen
+    @param poll_interval float seconds between polls
+    @return rusage resource.struct_rusage of the process and its reaped
+            children, None if not available
+    '''
+    if not hasattr(os, 'wait4'):
+        while process.poll() is None:
+            await asyncio.sleep(poll_interval)
+        return None
+
+    loop = asyncio.get_event_loop()
+    readable = asyncio.Event()
+    pidfd = None
+    if hasattr(os, 'pidfd_open'):
+        try:
+            pidfd = os.pidfd_open(process.pid)
+            loop.add_reader(pidfd, readable.set)
+        except OSError:
+            pidfd = None
+    try:
+        while True:
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                break
+            try:
+                await asyncio.wait_for(readable.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if pidfd is not None:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    return rusage
+
+
+async def _write_log(stream, log_file, chunk_size=65536):
+    ''' Copy a process output stream into a gzip compressed log file.
+
+    @param stream asyncio.StreamReader
+    @param log_file String path to the log file
+    @param chunk_size int maximum bytes read at a time
+    '''
+    with gzip.open(log_file, 'wb') as f:
+        while True:
+            chunk = await stream.read(chunk_size)
+            if not chunk:
+                break
+            f.write(chunk)
+
+
+def _poll_events(tailer, on_event):
+    ''' Pass the new progress events of a run to a callback.
+
+    @param tailer RuninfoTailer of the run
+    @param on_event callable(event) or None
+    '''
+    for event in tailer.poll():
+        if on_event:
+            on_event(event)
+
+
+def _run_coroutine(coroutine):
+    ''' Run a coroutine to completion in a new event loop.
+
+    @param coroutine coroutine object
+    @return result of the coroutine
+    '''
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def _rlimits(max_cpu_time=None, max_memory=None):
+    ''' Get the resource limits applied to a run.
+
+    @param max_cpu_time float CPU time limit in seconds
+    @param max_memory int address space limit in bytes
+    @return rlimits list of (resource, (soft, hard)) tuples
+    '''
+    if resource is None:
+        return []
+    rlimits = []
+    if max_cpu_time:
+        # SIGXCPU at the soft limit, SIGKILL at the hard limit
+        seconds = int(math.ceil(max_cpu_time))
+        rlimits.append((resource.RLIMIT_CPU, (seconds, seconds + 5)))
+    if max_memory:
+        rlimits.append((resource.RLIMIT_AS, (max_memory, max_memory)))
+    return rlimits
+
+
+def _set_rlimits(rlimits, pid=None):
+    ''' Apply resource limits to a process.
+
+    @param rlimits list of (resource, (soft, hard)) tuples
+    @param pid int process id, None for the calling process (preexec_fn)
+    '''
+    for limit, values in rlimits:
+        if pid is None:
+            resource.setrlimit(limit, values)
+        else:
+            resource.prlimit(pid, limit, values)
+
+
+def report_predictions(output, file_paths, durations, predicted, makespan):
+    ''' Print predicted and actual run times of a suite.
+
+    Run times are those of a single repetition, for benchmarks the median
+    of the recorded repetitions, as predicted from the history. The makespan
+    is the wall clock time of the whole suite, warmups included.
+
+    @param output dict of run results
+    @param file_paths String list of the bat/sh file paths run
+    @param durations dict of predicted seconds of a repetition per file path
+    @param predicted float predicted makespan in seconds
+    @param makespan float actual makespan in seconds
+    '''
+    rows = []
+    for file_path in file_paths:
+        run_info = output.get(file_path) or {}
+        actual = run_info.get('measured')
+        change = None
+        if actual is not None and durations[file_path] > 0:
+            change = '{0:+.1f}%'.format(
+                100.0 * (actual - durations[file_path]) /
+                durations[file_path])
+        rows.append((os.path.basename(file_path),
+                     round(durations[file_path], 3), actual, change,
+                     run_info.get('ERROR')))
+    rows.append(('makespan', round(predicted, 3), round(makespan, 3),
+                 '{0:+.1f}%'.format(100.0 * (makespan - predicted) /
+                                    predicted) if predicted > 0 else None,
+                 None))
+    print(format_table(['run', 'predicted', 'actual', 'change', 'error'],
+                       rows))
+
+
 def report_output(output_data, output_file=None, silent=False, print_width=80):
 
     if not silent:
@@ -117,9 +717,7 @@ def report_output(output_data, output_file=None, silent=False, print_width=80):
         print('Zonation version number: {0}'.format(output_data['z_info']))
         print(pad_header('BENCHMARK INFO', print_width))
 
-        keys = output_data.keys()
-        keys.sort()
-        for key in keys:
+        for key in sorted(output_data):
             if key not in ['sys_info', 'z_info']:
                 print('{0}:'.format(key))
                 pprint(output_data[key], width=print_width)
@@ -147,12 +745,94 @@ def main():
                         help='overwrite existing result file')
     parser.add_argument('-s', '--silent', dest='silent', action='store_true',
                         help='run everything silent')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None,
+                        help='number of runs executed concurrently ' +
+                             '(default: number of cores)')
+    parser.add_argument('-m', '--mem-budget', dest='mem_budget', default=None,
+                        help='memory available for concurrent runs, e.g. ' +
+                             '200G (default: no limit)')
+    parser.add_argument('--history', dest='history', metavar='RESULTFILE',
+                        nargs='+', default=[],
+                        help='previous result files used for estimating ' +
+                             'the resource use and run times of runs')
+    parser.add_argument('--sample-interval', dest='sample_interval',
+                        type=float, default=1.0, metavar='SECONDS',
+                        help='interval for sampling the resource use of ' +
+                             'runs, 0 disables sampling (default: 1.0)')
+    parser.add_argument('--timeseries', dest='timeseries',
+                        action='store_true',
+                        help='write sampled resource use of each run in a ' +
+                             'CSV file next to its run info file')
+    parser.add_argument('-p', '--progress', dest='progress',
+                        action='store_true',
+                        help='print progress of runs as reported in their ' +
+                             'run info files')
+    parser.add_argument('--stall-warning', dest='stall_warning', type=float,
+                        default=None, metavar='SECONDS',
+                        help='warn when a run info file has not grown in ' +
+                             'SECONDS')
+    parser.add_argument('--timeout', dest='timeout', type=float,
+                        default=None, metavar='SECONDS',
+                        help='terminate runs taking longer than SECONDS ' +
+                             'of wall clock time')
+    parser.add_argument('--suite-timeout', dest='suite_timeout', type=float,
+                        default=None, metavar='SECONDS',
+                        help='terminate runs still running SECONDS after ' +
+                             'the suite started and skip the rest')
+    parser.add_argument('--max-memory', dest='max_memory', default=None,
+                        metavar='SIZE',
+                        help='terminate runs using more than SIZE of ' +
+                             'memory, e.g. 16G')
+    parser.add_argument('--max-cpu-time', dest='max_cpu_time', type=float,
+                        default=None, metavar='SECONDS',
+                        help='limit the CPU time of runs to SECONDS')
+    parser.add_argument('-f', '--force', dest='force', action='store_true',
+                        help='run all runs even if cached results of ' +
+                             'unchanged runs exist')
+    parser.add_argument('--cache-dir', dest='cache_dir', default=CACHE_DIR,
+                        help='folder for cached run results ' +
+                             '(default: {0})'.format(CACHE_DIR))
+    parser.add_argument('--db', dest='db_file', default=None,
+                        help='results database the results are added to ' +
+                             '(see zreader query)')
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=1,
+                        help='number of recorded repetitions of each run ' +
+                             '(default: 1)')
+    parser.add_argument('--warmup', dest='warmup', type=int, default=0,
+                        help='number of unrecorded repetitions run before ' +
+                             'the recorded ones (default: 0)')
     parser.add_argument('--slack-config', dest='slack_config', default='',
                         help='Slack configuration file')
+    parser.add_argument('--shard', dest='shard', default=None,
+                        metavar='I/N',
+                        help='run only shard I (1-N) of the suite split ' +
+                             'in N disjoint shards, balanced by the ' +
+                             'recorded run times if --history is given')
+    parser.add_argument('--serve', dest='serve', default=None,
+                        metavar='[HOST:]PORT',
+                        help='hand out the runs to workers connecting to ' +
+                             'PORT instead of running them')
+    parser.add_argument('--worker', dest='worker', default=None,
+                        metavar='HOST:PORT',
+                        help='run the runs handed out by the coordinator ' +
+                             'at HOST:PORT (see --serve), -j runs at a time')
+    parser.add_argument('--webhook', dest='webhook', default=None,
+                        metavar='URL',
+                        help='URL notifications are posted to as JSON ' +
+                             '(ignored with --slack-config)')
 
     args = parser.parse_args()
 
-    slack_log = False
+    if args.worker:
+        from ztools.cluster import parse_address, work
+        try:
+            host, port = parse_address(args.worker)
+        except ValueError as e:
+            print('ERROR: {0}'.format(e))
+            sys.exit(2)
+        n_runs = _run_coroutine(work(host, port, args.jobs or cpu_count()))
+        print('INFO: Worker finished {0} runs'.format(n_runs))
+        return
 
     if args.input_yaml:
         if args.input_files:
@@ -203,61 +883,218 @@ def main():
 
     cmd_args = read_run(args.input_files, args.executable)
 
-    # Notify to slack if configured
+    # Notify to slack or a webhook if configured
+    sink = None
     if args.slack_config:
-        import slackpy
         import yaml
         try:
             f = open(args.slack_config, 'r')
             with f:
                 slack_config = yaml.safe_load(f)
-                slack_log = True
 
                 if 'WEBHOOK_URL' not in slack_config.keys():
                     print('ERROR: Slack configuration file does not have WEBHOOK_URL defined')
                     print('Slack notifications will not be enabled.')
-                    slack_log = False
                 elif 'CHANNEL' not in slack_config.keys():
                     print('ERROR: Slack configuration file does not have CHANNEL defined')
                     print('Slack notifications will not be enabled.')
-                    slack_log = False
                 else:
-                    WEBHOOK_URL = slack_config['WEBHOOK_URL']
-                    CHANNEL = slack_config['CHANNEL']
-                    USER_NAME = 'zlogger'
-                    # Create a new logger instance.
-                    slack_logger = slackpy.SlackLogger(WEBHOOK_URL, CHANNEL, USER_NAME)
+                    sink = SlackSink(slack_config['WEBHOOK_URL'],
+                                     slack_config['CHANNEL'], 'zlogger')
         except IOError:
             print('ERROR: Input Slack configuration YAML file {0} does not exist'.format(args.slack_config))
             print('Slack notifications will not be enabled.')
+    elif args.webhook:
+        sink = WebhookSink(args.webhook)
+
+    notifier = None
+    if sink:
+        # Deliveries happen in the background, never in the run loop
+        notifier = Notifier(sink)
+        notifier.start()
 
     # Collect output to a dict
     output = {}
     output['sys_info'] = get_system_info()
     output['z_info'] = get_zonation_info(args.executable)
 
-    if slack_log:
+    if notifier:
         z_version = '-'.join(output['z_info'])
         sys_name = '{0} ({1})'.format(output['sys_info'][1]['Uname'][1], output['sys_info'][1]['Uname'][0])
         sys_time = output['sys_info'][0]['Report time']
         msg = 'Starting runs using Zonation version <{0}> on {1} at {2}'.format(z_version, sys_name, sys_time)
-        slack_logger.info(title='Initializing runs', message=msg)
+        notifier.notify('Initializing runs', msg)
+
+    history = load_history(args.history)
+    durations = predicted_durations(list(cmd_args.keys()), history)
+
+    if args.shard:
+        try:
+            index, n_shards = parse_shard(args.shard)
+        except ValueError as e:
+            print('ERROR: {0}'.format(e))
+            sys.exit(2)
+        selected = shard_runs(sorted(cmd_args.keys()), index, n_shards,
+                              durations)
+        print('INFO: Shard {0} has {1} of {2} runs ({3})'.format(
+              args.shard, len(selected), len(cmd_args),
+              'balanced by recorded times' if durations else 'by name'))
+        cmd_args = dict((file_path, cmd_args[file_path])
+                        for file_path in selected)
+
+    # Reuse the results of runs whose inputs have not changed
+    hash_cache = HashCache(os.path.join(args.cache_dir, 'hashes.json'))
+    result_cache = ResultCache(args.cache_dir)
+    fingerprints = {}
+    for file_path, _cmd_args in list(cmd_args.items()):
+        try:
+            fingerprints[file_path] = run_fingerprint(file_path, _cmd_args,
+                                                      output['z_info'],
+                                                      hash_cache)
+        except (IOError, OSError) as e:
+            print('WARNING: Cannot fingerprint {0}: {1}'.format(file_path, e))
+            continue
+        # Benchmarks need fresh measurements
+        if args.force or args.repeat > 1:
+            continue
+        cached = result_cache.get(fingerprints[file_path],
+                                  runinfo_path(file_path, _cmd_args))
+        if cached is not None:
+            print('INFO: {0} unchanged, using cached results'.format(
+                  file_path))
+            output[file_path] = cached
+            del cmd_args[file_path]
+    hash_cache.save()
+
+    # Estimate the peak memory of each run if a memory budget is used
+    mem_budget = None
+    estimates = {}
+    if args.mem_budget:
+        try:
+            mem_budget = parse_size(args.mem_budget)
+        except ValueError as e:
+            print('ERROR: {0}'.format(e))
+            sys.exit(2)
+        for file_path, _cmd_args in cmd_args.items():
+            estimate = estimate_memory(file_path, _cmd_args, history)
+            if estimate is None:
+                print('WARNING: Cannot estimate memory use of ' +
+                      '{0}'.format(file_path))
+            else:
+                estimates[file_path] = estimate
+
+    max_memory = None
+    if args.max_memory:
+        try:
+            max_memory = parse_size(args.max_memory)
+        except ValueError as e:
+            print('ERROR: {0}'.format(e))
+            sys.exit(2)
+    deadline = None
+    if args.suite_timeout:
+        deadline = time.monotonic() + args.suite_timeout
+
+    # Start the longest runs first and predict the suite wall clock time
+    predicted = None
+    if durations:
+        order = lpt_order(list(cmd_args.keys()), durations)
+        cmd_args = OrderedDict((file_path, cmd_args[file_path])
+                               for file_path in order)
+        # Every repetition of a benchmark, warmups included, takes about as
+        # long
+        run_times = dict((file_path, duration * (max(args.repeat, 1) +
+                                                 max(args.warmup, 0)))
+                         for file_path, duration in durations.items())
+        n_recorded = len([file_path for file_path in cmd_args
+                          if recorded_duration(history, file_path)
+                          is not None])
+        if args.serve:
+            print('INFO: Predicted total run time {0} ({1} of {2} runs '
+                  'recorded)'.format(
+                      display_time(sum(run_times[file_path]
+                                       for file_path in cmd_args)),
+                      n_recorded, len(cmd_args)))
+        elif cmd_args:
+            predicted = predict_makespan(list(cmd_args.keys()), run_times,
+                                         args.jobs or cpu_count(),
+                                         mem_budget, estimates)
+            print('INFO: Predicted makespan {0} with {1} jobs ({2} of {3} '
+                  'runs recorded)'.format(display_time(predicted),
+                                          args.jobs or cpu_count(),
+                                          n_recorded, len(cmd_args)))
 
     # Run the actual analyses
-    run_no = 1
-    for file_path, _cmd_args in cmd_args.iteritems():
-        if slack_log:
+    n_runs = len(cmd_args)
+
+    def run_title(file_path, run_no):
+        run_name = os.path.basename(file_path).split('.')[0]
+        return 'Run {0} [{1}/{2}]'.format(run_name, run_no, n_runs)
+
+    def notify_start(file_path, run_no):
+        if notifier:
+            notifier.notify(run_title(file_path, run_no), 'Starting run')
+
+    def notify_finish(file_path, run_no, run_info):
+        if file_path in fingerprints:
+            result_cache.put(fingerprints[file_path], run_info,
+                             runinfo_path(file_path, cmd_args[file_path]))
+        if notifier:
             run_name = os.path.basename(file_path).split('.')[0]
-            slack_logger.info(title='Run {0} [{1}/{2}]'.format(run_name, run_no, len(cmd_args)), 
-                              message='Starting run')
+            level = 'info'
+            if 'ERROR' not in run_info:
+                msg = 'Run {0} finished in {1}'.format(
+                    run_name, display_time(run_info['measured']))
+            else:
+                msg = 'Run {0} failed: {1}'.format(run_name,
+                                                   run_info.get('ERROR'))
+                level = 'error'
+            notifier.notify(run_title(file_path, run_no), msg, level)
 
-        output[file_path] = run_analysis(file_path, _cmd_args)
-        
-        if slack_log:
-            slack_logger.info(title='Run {0} [{1}/{2}]'.format(run_name, run_no, len(cmd_args)), 
-                              message='Run {0} finished in {1}'.format(run_name, display_time(output[file_path]['measured'])))
+    def report_event(file_path, event):
+        run_name = os.path.basename(file_path).split('.')[0]
+        if event['event'] == 'stalled':
+            print('WARNING: [{0}] no output in {1} in stage {2}'.format(
+                  run_name, display_time(event['idle']), event['stage']))
+        elif args.progress:
+            details = ', '.join('{0}: {1}'.format(key, value)
+                                for key, value in sorted(event.items())
+                                if key not in ['event', 'stage', 'time'])
+            print('INFO: [{0}] {1} after {2} s {3}'.format(
+                  run_name, event['event'], int(event['time']), details))
 
-        run_no += 1
+    run_options = {'repeat': args.repeat,
+                   'warmup': args.warmup,
+                   'sample_interval': args.sample_interval,
+                   'timeseries': args.timeseries,
+                   'stall_timeout': args.stall_warning,
+                   'timeout': args.timeout,
+                   'deadline': deadline,
+                   'max_memory': max_memory,
+                   'max_cpu_time': args.max_cpu_time}
+    if args.serve:
+        from ztools.cluster import Coordinator, parse_address
+        try:
+            host, port = parse_address(args.serve, '')
+        except ValueError as e:
+            print('ERROR: {0}'.format(e))
+            sys.exit(2)
+        coordinator = Coordinator(cmd_args, run_options, notify_start,
+                                  notify_finish)
+        output.update(_run_coroutine(coordinator.serve(host, port)))
+    else:
+        t0 = time.time()
+        output.update(run_suite(cmd_args, jobs=args.jobs,
+                                on_start=notify_start,
+                                on_finish=notify_finish,
+                                on_event=report_event, mem_budget=mem_budget,
+                                estimates=estimates,
+                                run_options=run_options))
+        if predicted is not None:
+            report_predictions(output, cmd_args, durations, predicted,
+                               time.time() - t0)
+
+    if notifier:
+        notifier.close()
 
     if not args.silent:
         # Construct a suitable output name if it doesn't exist
@@ -276,6 +1113,13 @@ def main():
 
     report_output(output, args.output_file, args.silent)
 
+    if args.db_file:
+        store = ResultStore(args.db_file)
+        n_added = store.add_results(output, args.output_file or None)
+        store.close()
+        print('INFO: Added {0} runs to results database {1}'.format(
+              n_added, args.db_file))
+
     print('\nzrunner finished.\n')
 
 if __name__ == '__main__':
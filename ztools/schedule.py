@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+import os
+import zlib
+
+from ztools.history import recorded_duration
+
+
+def parse_shard(shard):
+    ''' Parse a shard specification I/N.
+
+    @param shard String shard number and count, e.g. "2/8" (1-based)
+    @return index, n_shards tuple of ints, index 0-based
+    '''
+    try:
+        index, n_shards = [int(item) for item in shard.split('/')]
+    except ValueError:
+        raise ValueError('Invalid shard (I/N): {0}'.format(shard))
+    if n_shards < 1 or not 1 <= index <= n_shards:
+        raise ValueError('Shard number must be 1-{0}: {1}'.format(
+                         max(n_shards, 1), shard))
+    return index - 1, n_shards
+
+
+def predicted_durations(file_paths, history):
+    ''' Predict the wall clock time of runs from their recorded times.
+
+    Runs without a recorded time are predicted the median of the others.
+
+    @param file_paths String list of bat/sh file paths
+    @param history dict run history as returned by load_history()
+    @return durations dict of predicted seconds per file path, empty if no
+            run has a recorded time
+    '''
+    durations = {}
+    for file_path in file_paths:
+        duration = recorded_duration(history, file_path)
+        if duration is not None:
+            durations[file_path] = duration
+    if not durations:
+        return {}
+
+    known = sorted(durations.values())
+    default = known[len(known) // 2]
+    for file_path in file_paths:
+        durations.setdefault(file_path, default)
+    return durations
+
+
+def shard_runs(file_paths, index, n_shards, durations=None):
+    ''' Select the runs of one shard of a suite.
+
+    The split only depends on the run names (basenames of the bat/sh
+    files) and the durations, so every shard computes the same split
+    independently and the shards are disjoint and cover the suite.
+
+    Without durations runs are assigned by a stable hash (CRC-32) of their
+    name. With durations they are balanced by the longest processing time
+    rule: in order of decreasing duration each run goes to the shard with
+    the least work so far.
+
+    @param file_paths String list of bat/sh file paths
+    @param index int 0-based shard index
+    @param n_shards int number of shards
+    @param durations dict of predicted seconds per file path
+    @return file_paths String list of the paths in the shard
+    '''
+    def name(file_path):
+        return os.path.basename(file_path)
+
+    if not durations:
+        return [file_path for file_path in file_paths
+                if zlib.crc32(name(file_path).encode('utf-8')) % n_shards ==
+                index]
+
+    loads = [0.0] * n_shards
+    shard_of = {}
+    for file_path in sorted(file_paths,
+                            key=lambda item: (-durations[item], name(item))):
+        shard = loads.index(min(loads))
+        loads[shard] += durations[file_path]
+        shard_of[file_path] = shard
+    return [file_path for file_path in file_paths
+            if shard_of[file_path] == index]
+
+
+def lpt_order(file_paths, durations):
+    ''' Order runs longest predicted duration first.
+
+    Starting the longest runs first keeps a long run started last from
+    dominating the makespan of a concurrent suite (longest processing time
+    first rule). Ties are ordered by run name.
+
+    @param file_paths String list of bat/sh file paths
+    @param durations dict of predicted seconds per file path
+    @return file_paths String list of the paths in run order
+    '''
+    return sorted(file_paths, key=lambda item: (-durations.get(item, 0.0),
+                                                os.path.basename(item)))
+
+
+def predict_makespan(file_paths, durations, jobs, mem_budget=None,
+                     estimates=None):
+    ''' Predict the wall clock time of a suite run jobs runs at a time.
+
+    Follows the scheduling of ztools.runner.run_suite_async(): runs are
+    started in the given order whenever a slot is free and, with a memory
+    budget, the first pending run fitting in the memory not reserved by the
+    runs in progress is started (a run larger than the whole budget runs
+    alone).
+
+    @param file_paths String list of bat/sh file paths in run order
+    @param durations dict of predicted seconds per file path
+    @param jobs int number of concurrent runs
+    @param mem_budget int memory budget in bytes (default: no limit)
+    @param estimates dict of estimated peak memory in bytes per file path
+    @return makespan float predicted seconds
+    '''
+    jobs = max(jobs, 1)
+    estimates = estimates or {}
+    pending = list(file_paths)
+    # Heap of (end time, start number, file path) of the runs in progress
+    running = []
+    reserved = 0
+    now = 0.0
+    n_started = 0
+    while pending or running:
+        while pending and len(running) < jobs:
+            index = 0
+            if mem_budget:
+                index = next((i for i, file_path in enumerate(pending)
+                              if (estimates.get(file_path) or 0) <=
+                              mem_budget - reserved), None)
+                if index is None:
+                    if running:
+                        break
+                    index = 0
+            file_path = pending.pop(index)
+            reserved += estimates.get(file_path) or 0
+            heapq.heappush(running, (now + durations.get(file_path, 0.0),
+                                     n_started, file_path))
+            n_started += 1
+        # Runs finishing at the same time release their slots together
+        now = running[0][0]
+        while running and running[0][0] == now:
+            file_path = heapq.heappop(running)[2]
+            reserved -= estimates.get(file_path) or 0
+    return now
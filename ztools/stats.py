@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+import random
+
+
+def quantile(samples, q):
+    ''' Calculate a quantile of samples using linear interpolation.
+
+    Same as the default method of numpy.percentile.
+
+    @param samples list of numbers
+    @param q float quantile in [0, 1]
+    @return value float quantile value
+    '''
+    values = sorted(samples)
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def median(samples):
+    ''' Calculate the median of samples.
+
+    @param samples list of numbers
+    @return median float
+    '''
+    return quantile(samples, 0.5)
+
+
+def bootstrap_ci(samples, statistic=median, confidence=0.95,
+                 n_resamples=2000, seed=0):
+    ''' Calculate a percentile bootstrap confidence interval for a statistic.
+
+    A fixed seed is used so that reporting the same samples twice gives the
+    same interval.
+
+    @param samples list of numbers
+    @param statistic callable calculating the statistic from a list
+    @param confidence float confidence level
+    @param n_resamples int number of bootstrap resamples
+    @param seed int seed of the random number generator
+    @return ci tuple (lower, upper) bounds of the interval
+    '''
+    if len(samples) < 2:
+        return (samples[0], samples[0])
+
+    rng = random.Random(seed)
+    n = len(samples)
+    estimates = [statistic([samples[rng.randrange(n)] for _ in range(n)])
+                 for _ in range(n_resamples)]
+    alpha = (1 - confidence) / 2
+    return (quantile(estimates, alpha), quantile(estimates, 1 - alpha))
+
+
+def summarize(samples, confidence=0.95):
+    ''' Summarise repeated measurements with robust statistics.
+
+    @param samples list of numbers
+    @param confidence float confidence level of the bootstrap interval
+    @return summary dict with n, median, iqr, min, max and ci (median)
+    '''
+    lower, upper = bootstrap_ci(samples, confidence=confidence)
+    return {'n': len(samples),
+            'median': round(median(samples), 3),
+            'iqr': round(quantile(samples, 0.75) - quantile(samples, 0.25), 3),
+            'min': min(samples),
+            'max': max(samples),
+            'ci': [round(lower, 3), round(upper, 3)]}
+
+
+def _rank(values):
+    ''' Rank values from 1, ties get the average of their ranks. '''
+    order = sorted(range(len(values)), key=lambda i: values[i])
+    ranks = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2.0 + 1
+        i = j + 1
+    return ranks
+
+
+def _u_distribution(m, n):
+    ''' Number of orderings of m and n samples giving each value of U.
+
+    @return counts list indexed by U
+    '''
+    # counts[j][u] for the current number of first-group samples and j
+    # second-group samples
+    counts = [[1] for _ in range(n + 1)]
+    for i in range(1, m + 1):
+        new_counts = [[1]]
+        for j in range(1, n + 1):
+            size = i * j + 1
+            row = [0] * size
+            # Last sample from the first group: it beats all j of the second
+            for u, count in enumerate(counts[j]):
+                row[u + j] += count
+            # Last sample from the second group
+            for u, count in enumerate(new_counts[j - 1]):
+                row[u] += count
+            new_counts.append(row)
+        counts = new_counts
+    return counts[n]
+
+
+def min_p_value(m, n):
+    ''' Smallest two-sided p-value of a Mann-Whitney U test of m and n
+    samples.
+
+    Reached when the samples do not overlap at all. With few samples it is
+    large, e.g. 0.33 for 2 and 2 or 0.1 for 3 and 3 samples, and no
+    difference can be significant at a smaller level.
+
+    @param m int number of samples in the first group
+    @param n int number of samples in the second group
+    @return p float
+    '''
+    orderings = math.factorial(m + n) // (math.factorial(m) *
+                                          math.factorial(n))
+    return min(1.0, 2.0 / orderings)
+
+
+def min_samples(alpha):
+    ''' Smallest number of samples per group with which a Mann-Whitney U
+    test can be significant at alpha.
+
+    @param alpha float significance level
+    @return n int samples needed in both groups
+    '''
+    n = 1
+    while min_p_value(n, n) > alpha:
+        n += 1
+    return n
+
+
+def mann_whitney_u(x, y):
+    ''' Two-sided Mann-Whitney U test for a difference between two samples.
+
+    The exact distribution of U is used for small samples without ties,
+    otherwise the normal approximation with tie and continuity corrections.
+
+    @param x list of numbers (first sample)
+    @param y list of numbers (second sample)
+    @return u, p tuple of the U statistic of x and the two-sided p-value
+    '''
+    m, n = len(x), len(y)
+    ranks = _rank(list(x) + list(y))
+    u = sum(ranks[:m]) - m * (m + 1) / 2.0
+    mean = m * n / 2.0
+
+    ties = len(set(list(x) + list(y))) < m + n
+    if not ties and m * n <= 400:
+        counts = _u_distribution(m, n)
+        total = float(sum(counts))
+        extreme = min(u, m * n - u)
+        tail = sum(counts[:int(extreme) + 1]) / total
+        return u, min(1.0, 2 * tail)
+
+    # Tie corrected variance
+    tie_sizes = {}
+    for value in list(x) + list(y):
+        tie_sizes[value] = tie_sizes.get(value, 0) + 1
+    correction = sum(t ** 3 - t for t in tie_sizes.values())
+    variance = m * n / 12.0 * ((m + n + 1) -
+                               correction / float((m + n) * (m + n - 1)))
+    if variance <= 0:
+        return u, 1.0
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+    p = math.erfc(max(z, 0) / math.sqrt(2))
+    return u, min(1.0, p)
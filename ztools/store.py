@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sqlite3
+
+import yaml
+
+from ztools.utilities import load_results
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    source TEXT,
+    report_time TEXT,
+    machine TEXT,
+    os TEXT,
+    kernel TEXT,
+    arch TEXT,
+    zversion TEXT,
+    run TEXT,
+    run_path TEXT,
+    init REAL,
+    cellrem REAL,
+    elapsed REAL,
+    measured REAL,
+    peak_rss INTEGER,
+    error TEXT,
+    data TEXT,
+    UNIQUE (report_time, machine, run_path)
+);
+CREATE INDEX IF NOT EXISTS results_run ON results (run);
+CREATE INDEX IF NOT EXISTS results_machine ON results (machine);
+CREATE INDEX IF NOT EXISTS results_zversion ON results (zversion);
+CREATE INDEX IF NOT EXISTS results_report_time ON results (report_time);
+'''
+
+# Columns results can be grouped by, 'date' is the day of the report time
+GROUP_COLUMNS = {'run': 'run',
+                 'machine': 'machine',
+                 'zversion': 'zversion',
+                 'os': 'os',
+                 'date': 'substr(report_time, 1, 10)'}
+
+STAGES = ['init', 'cellrem', 'elapsed', 'measured']
+
+
+def system_fields(results, run_info=None):
+    ''' Extract the system and Zonation information of a result set.
+
+    Runs of merged shards and of cluster workers may have been run on
+    another system than the one of the result set. Their own sys_info is
+    used when run_info is given.
+
+    @param results dict of results as written by zrunner
+    @param run_info dict of the results of a single run in results
+    @return fields dict with report_time, machine, os, kernel, arch and
+            zversion
+    '''
+    sys_info = {}
+    # Convert a list of dicts into a single dict
+    for item in results.get('sys_info') or []:
+        sys_info.update(item)
+    if run_info and run_info.get('sys_info'):
+        for item in run_info['sys_info']:
+            sys_info.update(item)
+
+    uname = list(sys_info.get('Uname') or [])
+    uname += [None] * (5 - len(uname))
+    z_info = results.get('z_info') or []
+
+    return {'report_time': sys_info.get('Report time'),
+            'machine': uname[1],
+            'os': uname[0],
+            'kernel': uname[2],
+            'arch': uname[4],
+            'zversion': '.'.join(str(item) for item in z_info)}
+
+
+class ResultStore(object):
+    ''' Local SQLite database of zrunner results.
+
+    Each row holds the results of a single run together with the system and
+    Zonation information of the result set it belongs to, or of the run
+    itself if it has its own sys_info (see system_fields()). The complete run
+    results are kept as JSON in column 'data'. Adding the same result set
+    twice does not create duplicate rows.
+    '''
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add_results(self, results, source=None):
+        ''' Add a result set to the database.
+
+        @param results dict of results as written by zrunner
+        @param source String origin of the results (e.g. result file path)
+        @return n_added int number of new rows
+        '''
+        rows = []
+        for run_path, run_info in results.items():
+            if run_path in ['sys_info', 'z_info'] or not isinstance(run_info,
+                                                                     dict):
+                continue
+            fields = system_fields(results, run_info)
+            resources = run_info.get('resources') or {}
+            rows.append((source, fields['report_time'], fields['machine'],
+                         fields['os'], fields['kernel'], fields['arch'],
+                         fields['zversion'], os.path.basename(run_path),
+                         run_path, run_info.get('init'),
+                         run_info.get('cellrem'), run_info.get('elapsed'),
+                         run_info.get('measured'), resources.get('peak_rss'),
+                         run_info.get('ERROR'),
+                         json.dumps(run_info, default=str)))
+
+        with self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO results (source, report_time, '
+                'machine, os, kernel, arch, zversion, run, run_path, init, '
+                'cellrem, elapsed, measured, peak_rss, error, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows)
+            return self.connection.total_changes - before
+
+    def import_files(self, result_files):
+        ''' Import result YAML files into the database.
+
+        Files that cannot be read are reported and skipped.
+
+        @param result_files String list of result file paths
+        @return n_added int number of new rows
+        '''
+        n_added = 0
+        for result_file in result_files:
+            try:
+                results = load_results(result_file)
+            except (IOError, yaml.YAMLError) as e:
+                print('WARNING: Could not read {0}: {1}'.format(result_file,
+                                                                e))
+                continue
+            if not isinstance(results, dict):
+                print('WARNING: {0} is not a result file'.format(result_file))
+                continue
+            n_added += self.add_results(results,
+                                        os.path.abspath(result_file))
+        return n_added
+
+    def query(self, run=None, machine=None, zversion=None, since=None,
+              until=None, group_by=None, stage='measured'):
+        ''' Query results with optional filters and grouping.
+
+        Filters on run, machine and zversion accept SQL LIKE patterns
+        (e.g. "do_0%"). Dates are compared against the ISO report time.
+
+        Without grouping a row is returned for every run with the columns
+        report_time, machine, zversion, run, init, cellrem, elapsed,
+        measured and error. With grouping the rows hold the group columns
+        followed by n, min, mean and max of the given stage over successful
+        runs.
+
+        @param run String run name filter
+        @param machine String machine name filter
+        @param zversion String Zonation version filter
+        @param since String earliest report date (inclusive)
+        @param until String latest report date (inclusive)
+        @param group_by String list of GROUP_COLUMNS keys
+        @param stage String stage time aggregated in groups
+        @return header, rows tuple of column names and list of row tuples
+        '''
+        conditions = []
+        params = []
+        for column, value in [('run', run), ('machine', machine),
+                              ('zversion', zversion)]:
+            if value:
+                conditions.append('{0} LIKE ?'.format(column))
+                params.append(value)
+        if since:
+            conditions.append('report_time >= ?')
+            params.append(since)
+        if until:
+            # Include the whole last day
+            conditions.append('report_time < ?')
+            params.append(until + '~')
+        where = ''
+        if conditions:
+            where = ' WHERE ' + ' AND '.join(conditions)
+
+        if group_by:
+            if stage not in STAGES:
+                raise ValueError('Unknown stage: {0}'.format(stage))
+            for key in group_by:
+                if key not in GROUP_COLUMNS:
+                    raise ValueError('Cannot group by {0}'.format(key))
+            groups = ', '.join(GROUP_COLUMNS[key] for key in group_by)
+            sql = ('SELECT {0}, count({1}), min({1}), avg({1}), max({1}) '
+                   'FROM results{2} AND error IS NULL GROUP BY {0} '
+                   'ORDER BY {0}').format(groups, stage, where or ' WHERE 1')
+            header = list(group_by) + ['n', 'min', 'mean', 'max']
+        else:
+            sql = ('SELECT report_time, machine, zversion, run, init, '
+                   'cellrem, elapsed, measured, error FROM results{0} '
+                   'ORDER BY run, report_time').format(where)
+            header = ['report_time', 'machine', 'zversion', 'run', 'init',
+                      'cellrem', 'elapsed', 'measured', 'error']
+
+        return header, self.connection.execute(sql, params).fetchall()
+
+
+def format_table(header, rows):
+    ''' Format query results as a plain text table.
+
+    @param header String list of column names
+    @param rows list of row tuples
+    @return table String
+    '''
+    def cell(value):
+        if value is None:
+            return '-'
+        if isinstance(value, float):
+            return '{0:.3f}'.format(value).rstrip('0').rstrip('.')
+        return str(value)
+
+    cells = [[cell(value) for value in row] for row in rows]
+    widths = [max([len(name)] + [len(row[i]) for row in cells])
+              for i, name in enumerate(header)]
+    lines = ['  '.join(name.ljust(width) for name, width in
+                       zip(header, widths)).rstrip()]
+    lines.append('  '.join('-' * width for width in widths))
+    for row in cells:
+        lines.append('  '.join(value.ljust(width) for value, width in
+                               zip(row, widths)).rstrip())
+    return '\n'.join(lines)
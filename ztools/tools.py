@@ -1,29 +1,472 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import argparse
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
 import glob
+from multiprocessing import cpu_count
 import os
 from pprint import pprint
 import sys
 
-import gdal
-from gdalconst import *
 import numpy
-from scipy.spatial.distance import jaccard
-from scipy.stats import kendalltau
 import yaml
 
-from utilities import check_output_name
+from ztools.cache import CACHE_DIR, HashCache
+from ztools.correlation import (CORRELATION_METHODS, rank_correlations,
+                                stratified_sample)
+from ztools import rasters
+from ztools.rasters import (open_raster, payload_digest, RasterWriter,
+                            reopen_raster)
+from ztools.utilities import check_output_name, format_size, parse_size
 
+# Overlap indices of the cells above a threshold: Jaccard, Sorensen-Dice and
+# overlap (Szymkiewicz-Simpson) coefficient
+OVERLAP_INDICES = ['jaccard', 'dice', 'overlap']
 
-def raster_differences(raster_dataset_1, raster_dataset_2, tolerance=1e-08):
+# NoData value of the difference rasters
+DIFFERENCE_NODATA = numpy.nan
+
+# NoData value of the variability rasters, the statistics are never negative
+VARIABILITY_NODATA = -1.0
+
+# Bytes per cell used by the exact rank correlations besides the values
+# themselves (ranks, sorting orders and merge keys)
+CORRELATION_CELL_BYTES = 96
+
+
+def block_windows(band, x_size, y_size):
+    ''' Iterate over the windows of a raster following its natural blocks.
+
+    Reading whole GDAL blocks avoids reading (and decompressing) any block
+    more than once.
+
+    @param band GDAL band
+    @param x_size int number of columns
+    @param y_size int number of rows
+    @return generator of (xoff, yoff, cols, rows) tuples
+    '''
+    block_x, block_y = band.GetBlockSize()
+    for yoff in range(0, y_size, block_y):
+        rows = min(block_y, y_size - yoff)
+        for xoff in range(0, x_size, block_x):
+            cols = min(block_x, x_size - xoff)
+            yield xoff, yoff, cols, rows
+
+
+def valid_mask(data, nodata):
+    ''' Get a mask of cells holding data.
+
+    @param data numpy array of raster values
+    @param nodata NoData value of the band or None
+    @return mask numpy boolean array, True for cells with data
+    '''
+    mask = numpy.ones(data.shape, dtype=bool)
+    if nodata is not None:
+        mask &= data != nodata
+    if data.dtype.kind == 'f':
+        mask &= ~numpy.isnan(data)
+    return mask
+
+
+def threshold_range(start=0.5, stop=0.99, step=0.01):
+    ''' Get evenly spaced thresholds from start to stop (inclusive).
+
+    @param start double lowest threshold
+    @param stop double highest threshold
+    @param step double step between thresholds
+    @return thresholds numpy float64 array
+    '''
+    n = int(round((stop - start) / step)) + 1
+    return numpy.round(start + step * numpy.arange(n), 10)
+
+
+def overlap_indices(counts_both, counts_1, counts_2, indices=OVERLAP_INDICES):
+    ''' Calculate overlap indices of the cells above thresholds.
+
+    @param counts_both numpy array of cells above each threshold in both
+    @param counts_1 numpy array of cells above each threshold in the first
+    @param counts_2 numpy array of cells above each threshold in the second
+    @param indices String list of OVERLAP_INDICES to calculate
+    @return overlap dict of index name to list of values, 1.0 where neither
+            raster has cells above the threshold
+    '''
+    both = counts_both.astype(numpy.float64)
+    denominators = {'jaccard': counts_1 + counts_2 - counts_both,
+                    'dice': (counts_1 + counts_2) / 2.0,
+                    'overlap': numpy.minimum(counts_1, counts_2)}
+    overlap = {}
+    for index in indices:
+        denominator = denominators[index].astype(numpy.float64)
+        values = numpy.ones(both.size)
+        nonzero = denominator > 0
+        values[nonzero] = both[nonzero] / denominator[nonzero]
+        overlap[index] = [float(value) for value in values]
+    return overlap
+
+
+def difference(data_1, data_2):
+    ''' Calculate the differences of two blocks of values.
+
+    Float data is compared in its own precision, integer data in floating
+    point to avoid overflows (e.g. unsigned types).
+
+    @param data_1 numpy array of values of the first raster
+    @param data_2 numpy array of values of the second raster
+    @return diff numpy float array data_1 - data_2
+    '''
+    dtype = numpy.result_type(data_1.dtype, data_2.dtype)
+    if dtype.kind != 'f':
+        dtype = numpy.float64
+    return data_1.astype(dtype, copy=False) - data_2.astype(dtype, copy=False)
+
+
+class DifferenceStatistics(object):
+    ''' Streaming statistics of the differences between two rasters.
+
+    Blocks of the two rasters are added with update(). Only cells that have
+    data in both rasters are compared. Mean and variance of the differences
+    are accumulated with the parallel variant of Welford's algorithm, so no
+    more than a block of differences is held in memory, and partial
+    statistics can be combined with merge().
+
+    If thresholds are given, a joint histogram of the two rasters binned by
+    the thresholds is accumulated as well. It holds the number of cells
+    above every combination of thresholds, so the overlap of the cells above
+    any number of thresholds is calculated from it at once (see overlap()).
+    '''
+
+    def __init__(self, tolerance=1e-08, treshold=0.99, thresholds=None):
+        self.tolerance = tolerance
+        self.treshold = treshold
+        self.thresholds = None
+        self.histogram = None
+        if thresholds is not None:
+            self.thresholds = numpy.sort(numpy.asarray(thresholds,
+                                                       dtype=numpy.float64))
+            n_bins = self.thresholds.size + 1
+            self.histogram = numpy.zeros((n_bins, n_bins), dtype=numpy.int64)
+        self.equal = True
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.max = -numpy.inf
+        self.min = numpy.inf
+        # Cells above the treshold in both, only the first and only the
+        # second raster
+        self.top_both = 0
+        self.top_1 = 0
+        self.top_2 = 0
+
+    def update(self, data_1, data_2, mask):
+        ''' Add a block of both rasters.
+
+        @param data_1 numpy array block of the first raster
+        @param data_2 numpy array block of the second raster
+        @param mask numpy boolean array of cells with data in both rasters
+        '''
+        data_1 = data_1[mask]
+        data_2 = data_2[mask]
+        if data_1.size == 0:
+            return
+
+        if self.equal and not numpy.allclose(data_1, data_2,
+                                             atol=self.tolerance):
+            self.equal = False
+
+        diff = difference(data_1, data_2)
+        n = diff.size
+        mean = float(diff.sum(dtype=numpy.float64)) / n
+        m2 = float(numpy.square(diff - mean, dtype=numpy.float64).sum())
+        self._combine(n, mean, m2, float(diff.max()), float(diff.min()))
+
+        top_1 = data_1 >= self.treshold
+        top_2 = data_2 >= self.treshold
+        both = int(numpy.count_nonzero(top_1 & top_2))
+        self.top_both += both
+        self.top_1 += int(numpy.count_nonzero(top_1)) - both
+        self.top_2 += int(numpy.count_nonzero(top_2)) - both
+
+        if self.histogram is not None:
+            n_bins = self.histogram.shape[0]
+            bins = self._bins(data_1) * n_bins + self._bins(data_2)
+            self.histogram += numpy.bincount(
+                bins, minlength=n_bins * n_bins).reshape(n_bins, n_bins)
+
+    def merge(self, other):
+        ''' Combine the statistics of another instance into this one.
+
+        @param other DifferenceStatistics
+        '''
+        self.equal = self.equal and other.equal
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.max,
+                          other.min)
+        self.top_both += other.top_both
+        self.top_1 += other.top_1
+        self.top_2 += other.top_2
+        if self.histogram is not None:
+            self.histogram += other.histogram
+
+    def overlap(self, indices=OVERLAP_INDICES):
+        ''' Get the overlap of the cells above each of the thresholds.
+
+        Reverse cumulative sums of the joint histogram give the number of
+        cells at or above threshold i in the first and threshold j in the
+        second raster for all i and j.
+
+        @param indices String list of OVERLAP_INDICES to calculate
+        @return overlap dict with the thresholds and a list of values for
+                each index, or None if no thresholds were given
+        '''
+        if self.histogram is None:
+            return None
+        above = self.histogram[::-1, ::-1].cumsum(0).cumsum(1)[::-1, ::-1]
+        # Bin k + 1 onwards holds the values at or above threshold k
+        k = numpy.arange(1, self.thresholds.size + 1)
+        overlap = overlap_indices(above[k, k], above[k, 0], above[0, k],
+                                  indices)
+        overlap['thresholds'] = [float(value) for value in self.thresholds]
+        return overlap
+
+    def differences(self):
+        ''' Get the statistics of the differences.
+
+        @return differences dict with max, min, mean, std (population) and
+                the jaccard index of cells above the treshold
+        '''
+        differences = {}
+        if self.count:
+            differences['max'] = self.max
+            differences['min'] = self.min
+            differences['mean'] = self.mean
+            differences['std'] = float(numpy.sqrt(self.m2 / self.count))
+        union = self.top_both + self.top_1 + self.top_2
+        jaccard = 1.0
+        if union:
+            jaccard = float(self.top_both) / union
+        differences['jaccard'] = (self.treshold, jaccard)
+        return differences
+
+    def _combine(self, n, mean, m2, max_value, min_value):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.max = max(self.max, max_value)
+        self.min = min(self.min, min_value)
+
+    def _bins(self, data):
+        # Compare float data in its own precision like the single treshold
+        thresholds = self.thresholds
+        if data.dtype.kind == 'f':
+            thresholds = thresholds.astype(data.dtype)
+        return numpy.searchsorted(thresholds, data, side='right')
+
+
+class TileStatistics(object):
+    ''' Per-tile statistics of the differences between two rasters.
+
+    The raster is divided into a grid of square tiles and for each tile the
+    number of compared cells, the sum and sum of squares of the differences,
+    the largest absolute difference and the number of cells differing by
+    more than the tolerance are accumulated. Blocks may cover tiles
+    partially, and partial statistics can be combined with merge().
+
+    Summing 2 x 2 tiles gives the next coarser level of a pyramid (see
+    pyramid()), so hotspots of differences can be found from the coarse
+    levels without reading the full resolution differences.
+    '''
+
+    FIELDS = ['count', 'sum', 'sum_sq', 'max_abs', 'different']
+
+    def __init__(self, x_size, y_size, tile_size=256, tolerance=1e-08):
+        self.x_size = x_size
+        self.y_size = y_size
+        self.tile_size = tile_size
+        self.tolerance = tolerance
+        shape = (-(-y_size // tile_size), -(-x_size // tile_size))
+        self.tiles = {'count': numpy.zeros(shape, dtype=numpy.int64),
+                      'sum': numpy.zeros(shape),
+                      'sum_sq': numpy.zeros(shape),
+                      'max_abs': numpy.zeros(shape),
+                      'different': numpy.zeros(shape, dtype=numpy.int64)}
+
+    def update(self, diff, mask, xoff, yoff):
+        ''' Add a block of differences.
+
+        Each cell with data gets the index of its tile and the statistics
+        of all tiles covered by the block are accumulated at once with
+        numpy.bincount() and numpy.maximum.at().
+
+        @param diff numpy 2D array of differences
+        @param mask numpy boolean array of cells with data in both rasters
+        @param xoff int column of the upper left cell of the block
+        @param yoff int row of the upper left cell of the block
+        '''
+        size = self.tile_size
+        rows, cols = diff.shape
+        # Tiles covered by the block and the index of the tile of each cell
+        # within them
+        row_tiles = numpy.arange(yoff, yoff + rows) // size
+        col_tiles = numpy.arange(xoff, xoff + cols) // size
+        window = (slice(row_tiles[0], row_tiles[-1] + 1),
+                  slice(col_tiles[0], col_tiles[-1] + 1))
+        shape = (row_tiles[-1] - row_tiles[0] + 1,
+                 col_tiles[-1] - col_tiles[0] + 1)
+        index = ((row_tiles - row_tiles[0])[:, None] * shape[1] +
+                 (col_tiles - col_tiles[0])[None, :])[mask]
+        values = diff[mask].astype(numpy.float64)
+        abs_values = numpy.abs(values)
+        n_tiles = shape[0] * shape[1]
+
+        def tile_sums(weights=None, cells=index):
+            return numpy.bincount(cells, weights, n_tiles).reshape(shape)
+
+        tiles = self.tiles
+        tiles['count'][window] += tile_sums()
+        tiles['sum'][window] += tile_sums(values)
+        tiles['sum_sq'][window] += tile_sums(values * values)
+        tiles['different'][window] += tile_sums(
+            cells=index[abs_values > self.tolerance])
+        max_abs = numpy.zeros(n_tiles)
+        numpy.maximum.at(max_abs, index, abs_values)
+        numpy.maximum(tiles['max_abs'][window], max_abs.reshape(shape),
+                      out=tiles['max_abs'][window])
+
+    def merge(self, other):
+        ''' Combine the statistics of another instance into this one.
+
+        @param other TileStatistics of the same grid
+        '''
+        for field in self.FIELDS:
+            if field == 'max_abs':
+                numpy.maximum(self.tiles[field], other.tiles[field],
+                              out=self.tiles[field])
+            else:
+                self.tiles[field] += other.tiles[field]
+
+    def pyramid(self):
+        ''' Build the pyramid of tile statistics.
+
+        @return levels list of dicts of FIELDS arrays, from the tile grid
+                (level 0) to a single tile covering the whole raster
+        '''
+        levels = [self.tiles]
+        while levels[-1]['count'].size > 1:
+            coarser = {}
+            for field, values in levels[-1].items():
+                # Pad to an even number of rows and columns
+                rows, cols = values.shape
+                padded = numpy.zeros((rows + rows % 2, cols + cols % 2),
+                                     dtype=values.dtype)
+                padded[:rows, :cols] = values
+                blocks = padded.reshape(padded.shape[0] // 2, 2,
+                                        padded.shape[1] // 2, 2)
+                if field == 'max_abs':
+                    coarser[field] = blocks.max(axis=(1, 3))
+                else:
+                    coarser[field] = blocks.sum(axis=(1, 3))
+            levels.append(coarser)
+        return levels
+
+    def save(self, file_path):
+        ''' Write the pyramid into a compressed numpy .npz file.
+
+        The arrays are named level<N>_<field>, e.g. level0_max_abs. The size
+        of the raster and of the tiles are stored as well.
+
+        @param file_path String path to the output file
+        '''
+        arrays = {'raster_size': numpy.array([self.x_size, self.y_size]),
+                  'tile_size': numpy.array(self.tile_size)}
+        for level, tiles in enumerate(self.pyramid()):
+            for field, values in tiles.items():
+                arrays['level{0}_{1}'.format(level, field)] = values
+        with open(file_path, 'wb') as f:
+            numpy.savez_compressed(f, **arrays)
+
+    def hotspots(self, n=5):
+        ''' Get the tiles with the largest differences.
+
+        @param n int number of tiles
+        @return hotspots list of dicts with the window (xoff, yoff, cols,
+                rows), rms and max_abs difference and the number of cells
+                differing more than the tolerance, largest rms first
+        '''
+        count = self.tiles['count']
+        rms = numpy.zeros(count.shape)
+        nonzero = count > 0
+        rms[nonzero] = numpy.sqrt(self.tiles['sum_sq'][nonzero] /
+                                  count[nonzero])
+        hotspots = []
+        for index in numpy.argsort(rms, axis=None)[::-1][:n]:
+            row, col = numpy.unravel_index(index, rms.shape)
+            if not rms[row, col]:
+                break
+            xoff = int(col) * self.tile_size
+            yoff = int(row) * self.tile_size
+            hotspots.append({
+                'window': [xoff, yoff,
+                           min(self.tile_size, self.x_size - xoff),
+                           min(self.tile_size, self.y_size - yoff)],
+                'rms': float(rms[row, col]),
+                'max_abs': float(self.tiles['max_abs'][row, col]),
+                'different': int(self.tiles['different'][row, col])})
+        return hotspots
+
+
+def raster_differences(raster_dataset_1, raster_dataset_2, tolerance=1e-08,
+                       correlation='exact', sample_size=1000000, seed=0,
+                       thresholds=None, indices=None, threads=1,
+                       difference_file=None, pyramid_file=None,
+                       tile_size=256, max_memory=None):
     ''' Compares the values of two rasters given a certain treshold.
 
     The default tolerance value is the same as the one used by numpy.allclose.
 
-    @param raster_dataset_1 GDAL dataset
-    @param raster_dataset_2 GDAL dataset
+    The rasters are read block by block following the natural block size of
+    the first raster, so memory use depends on the block size rather than on
+    the raster size. Cells that are NoData in either raster are ignored. The
+    blocks can be processed on several threads (see map_tiles()), the
+    partial statistics of the threads are merged.
+
+    Rank correlations (Kendall's tau and Spearman's rho) are calculated if
+    the rasters differ. With correlation 'exact' all cells with data are
+    used, with 'sample' a stratified random sample of about sample_size
+    cells (one stratum per raster block) and the error bound of tau is
+    reported as well. 'none' skips the correlations. Unlike the other
+    statistics the exact correlations are not computed block by block: the
+    values of all cells with data are held in memory (about
+    CORRELATION_CELL_BYTES plus the size of the two values per cell). If
+    this would need more than max_memory bytes, they are estimated from a
+    sample fitting in it instead.
+
+    If thresholds are given, the overlap of the cells at or above each
+    threshold in the two rasters is calculated in the same pass over the
+    blocks (key 'overlap').
+
+    To locate the differences, the differences can be written into a raster
+    (difference_file, see RasterWriter, NoData where either raster has no
+    data) and statistics of square tiles into a pyramid file (see
+    TileStatistics.save()), both in the same pass. The tiles with the
+    largest differences are reported as hotspots.
+
+    @param raster_dataset_1 GDAL dataset or MemmapDataset (see open_raster())
+    @param raster_dataset_2 GDAL dataset or MemmapDataset
     @param tolerance double defining the raster similarity tolerance (see http://docs.scipy.org/doc/numpy/reference/generated/numpy.allclose.html)
+    @param correlation String rank correlation method (see CORRELATION_METHODS)
+    @param sample_size int number of cells sampled with correlation 'sample'
+    @param seed int seed of the random sample
+    @param thresholds list of thresholds for the overlap (see threshold_range())
+    @param indices String list of OVERLAP_INDICES, only jaccard by default
+    @param threads int number of threads the tiles are processed on
+    @param difference_file String path of the difference raster (optional)
+    @param pyramid_file String path of the tile statistics pyramid (optional)
+    @param tile_size int size of the tiles of the pyramid in cells
+    @param max_memory int memory limit of the rank correlations in bytes
     @return differences dict holding information on the potential differences
     '''
 
@@ -34,41 +477,384 @@ def raster_differences(raster_dataset_1, raster_dataset_2, tolerance=1e-08):
     print("INFO: Extracting bands from the second dataset...")
     band_2 = raster_dataset_2.GetRasterBand(1)
 
-    print("INFO: Extracting band 1 from the first dataset...")
-    data_1 = band_1.ReadAsArray(0, 0, raster_dataset_1.RasterXSize,
-                                raster_dataset_1.RasterYSize).astype(numpy.float)
-    print("INFO: Extracting band 1 from the second dataset...")
-    data_2 = band_2.ReadAsArray(0, 0, raster_dataset_2.RasterXSize,
-                                raster_dataset_2.RasterYSize).astype(numpy.float)
+    x_size = raster_dataset_1.RasterXSize
+    y_size = raster_dataset_1.RasterYSize
+    if (x_size, y_size) != (raster_dataset_2.RasterXSize,
+                            raster_dataset_2.RasterYSize):
+        raise ValueError('Raster datasets have different dimensions')
+    tiles = list(block_windows(band_1, x_size, y_size))
+    # Number of cells with data in both rasters in each tile
+    counts = [0] * len(tiles)
+
+    writer = None
+    if difference_file:
+        writer = RasterWriter(difference_file, x_size, y_size, numpy.float32,
+                              DIFFERENCE_NODATA, like=raster_dataset_1,
+                              compress=True)
+
+    def compare_tiles(bands, indices):
+        band_1, band_2 = bands
+        nodata_1 = band_1.GetNoDataValue()
+        nodata_2 = band_2.GetNoDataValue()
+        stats = DifferenceStatistics(tolerance, thresholds=thresholds)
+        tile_stats = None
+        if pyramid_file:
+            tile_stats = TileStatistics(x_size, y_size, tile_size, tolerance)
+        for i in indices:
+            xoff, yoff, cols, rows = tiles[i]
+            data_1 = band_1.ReadAsArray(xoff, yoff, cols, rows)
+            data_2 = band_2.ReadAsArray(xoff, yoff, cols, rows)
+            mask = valid_mask(data_1, nodata_1) & valid_mask(data_2, nodata_2)
+            counts[i] = int(numpy.count_nonzero(mask))
+            stats.update(data_1, data_2, mask)
+            if writer or tile_stats:
+                diff = difference(data_1, data_2)
+                if writer:
+                    writer.write(numpy.where(mask, diff, DIFFERENCE_NODATA),
+                                 xoff, yoff)
+                if tile_stats:
+                    tile_stats.update(diff, mask, xoff, yoff)
+        return stats, tile_stats
 
     print("INFO: Comparing values...")
-    equal = numpy.allclose(data_1, data_2, atol=tolerance)
+    partials = map_tiles([raster_dataset_1, raster_dataset_2], len(tiles),
+                         compare_tiles, threads)
+    if writer:
+        writer.close()
+    stats, tile_stats = partials[0]
+    for partial, partial_tiles in partials[1:]:
+        stats.merge(partial)
+        if tile_stats:
+            tile_stats.merge(partial_tiles)
+    if tile_stats:
+        tile_stats.save(pyramid_file)
 
-    if not equal:
+    if not stats.equal:
         print("WARNING: Raster dataset values not equal at {0} tolerance".format(tolerance))
-        diff = data_1 - data_2
-
-        differences['max'] = float(numpy.max(diff))
-        differences['min'] = float(numpy.min(diff))
-        differences['mean'] = float(numpy.mean(diff))
-        differences['std'] = float(numpy.std(diff))
-        #differences['quantiles'] = [float(item) for item in mquantiles(diff)]
-        print("INFO: Calculating Kendall's tau statistics, this may take a while...")
-        tau = kendalltau(data_1, data_2)
-        differences['kendall_tau'] = (float(tau[0]), float(tau[1]))
-
-        treshold = 0.99
-        print("INFO: Calculating jaccard distance for treshold {0}".format(treshold))
-        frac_data_1 = data_1 >= treshold
-        frac_data_1 = numpy.reshape(frac_data_1, frac_data_1.size)
-        frac_data_2 = data_2 >= treshold
-        frac_data_2 = numpy.reshape(frac_data_2, frac_data_2.size)
-        # Calculate jaccard index instead of distance
-        differences['jaccard'] = (treshold, float(1-jaccard(frac_data_1, frac_data_2)))
+        differences = stats.differences()
+        print("INFO: Calculated jaccard index for treshold {0}".format(
+              stats.treshold))
+        if thresholds is not None:
+            differences['overlap'] = stats.overlap(indices or ['jaccard'])
+            print("INFO: Calculated overlap for {0} thresholds".format(
+                  len(differences['overlap']['thresholds'])))
+        if difference_file:
+            differences['difference_raster'] = difference_file
+        if tile_stats:
+            differences['pyramid'] = pyramid_file
+            differences['hotspots'] = tile_stats.hotspots()
+
+        if correlation != 'none':
+            differences.update(rank_correlation_values(
+                raster_dataset_1, raster_dataset_2, tiles, counts,
+                correlation, sample_size, seed, threads, max_memory))
 
     return differences
 
 
+def map_tiles(datasets, n_tiles, function, threads=1):
+    ''' Process the tiles of rasters on a pool of threads.
+
+    Thread i processes tiles i, i + threads, i + 2 * threads, ... with its
+    own datasets (GDAL datasets must not be shared between threads), so the
+    partial results do not depend on the timing of the threads. Reading and
+    the numpy kernels release the GIL.
+
+    @param datasets list of GDAL datasets or MemmapDatasets
+    @param n_tiles int number of tiles
+    @param function callable(bands, indices) processing the tiles with the
+                    given indices of the first bands of the datasets and
+                    returning a partial result
+    @param threads int number of threads
+    @return partials list of partial results, one per thread
+    '''
+    threads = max(1, min(threads or 1, n_tiles))
+    if threads == 1:
+        return [function([dataset.GetRasterBand(1) for dataset in datasets],
+                         range(n_tiles))]
+
+    def worker(i):
+        thread_datasets = datasets
+        if i > 0:
+            thread_datasets = [reopen_raster(dataset) for dataset in datasets]
+        return function([dataset.GetRasterBand(1) for dataset in
+                         thread_datasets], range(i, n_tiles, threads))
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(worker, range(threads)))
+
+
+def rank_correlation_values(raster_dataset_1, raster_dataset_2, tiles,
+                            counts, correlation='exact', sample_size=1000000,
+                            seed=0, threads=1, max_memory=None):
+    ''' Calculate rank correlations of the cells with data in two rasters.
+
+    The correlations need all (or all sampled) cells at once, so the cells
+    are collected in their native data type in a second pass over the
+    tiles. Each tile is sampled with its own random state derived from the
+    seed, so the sample does not depend on the number of threads.
+
+    The memory needed is known exactly once the cells with data have been
+    counted. If it exceeds max_memory, the correlations are calculated from
+    the largest sample fitting in max_memory instead of all cells.
+
+    @param raster_dataset_1 GDAL dataset or MemmapDataset
+    @param raster_dataset_2 GDAL dataset or MemmapDataset
+    @param tiles list of (xoff, yoff, cols, rows) tuples
+    @param counts int list of cells with data in both rasters in each tile
+    @param correlation String 'exact' or 'sample'
+    @param sample_size int number of cells sampled with correlation 'sample'
+    @param seed int seed of the random sample
+    @param threads int number of threads
+    @param max_memory int memory limit in bytes (default: no limit)
+    @return correlations dict as returned by rank_correlations()
+    '''
+    n_cells = sum(counts)
+    dtype_1 = raster_dataset_1.GetRasterBand(1).ReadAsArray(0, 0, 1, 1).dtype
+    dtype_2 = raster_dataset_2.GetRasterBand(1).ReadAsArray(0, 0, 1, 1).dtype
+    cell_bytes = CORRELATION_CELL_BYTES + dtype_1.itemsize + dtype_2.itemsize
+    if max_memory:
+        max_cells = max(int(max_memory // cell_bytes), 2)
+        if correlation == 'exact' and n_cells > max_cells:
+            print("WARNING: Exact rank correlations of {0} cells need {1}, "
+                  "more than the memory limit of {2}, sampling instead".format(
+                      n_cells, format_size(n_cells * cell_bytes),
+                      format_size(max_memory)))
+            correlation = 'sample'
+            sample_size = max_cells
+        sample_size = min(sample_size, max_cells)
+
+    fraction = 1.0
+    if correlation == 'sample' and n_cells > sample_size:
+        fraction = float(sample_size) / n_cells
+        print("INFO: Calculating rank correlations from a sample of {0} "
+              "cells...".format(sample_size))
+    else:
+        print("INFO: Calculating rank correlations of {0} cells, this may "
+              "take a while...".format(n_cells))
+
+    sample = fraction < 1.0
+    if sample:
+        samples = [None] * len(tiles)
+    else:
+        # Each tile fills its own slice of the values
+        offsets = numpy.concatenate(([0], numpy.cumsum(counts)))
+        values_1 = numpy.empty(n_cells, dtype=dtype_1)
+        values_2 = numpy.empty(n_cells, dtype=dtype_2)
+
+    def collect_tiles(bands, indices):
+        band_1, band_2 = bands
+        nodata_1 = band_1.GetNoDataValue()
+        nodata_2 = band_2.GetNoDataValue()
+        for i in indices:
+            if not counts[i]:
+                continue
+            xoff, yoff, cols, rows = tiles[i]
+            data_1 = band_1.ReadAsArray(xoff, yoff, cols, rows)
+            data_2 = band_2.ReadAsArray(xoff, yoff, cols, rows)
+            mask = valid_mask(data_1, nodata_1) & valid_mask(data_2, nodata_2)
+            if sample:
+                index = stratified_sample(
+                    mask, fraction, numpy.random.RandomState([seed, i]))
+                samples[i] = (data_1.ravel()[index], data_2.ravel()[index])
+            else:
+                values_1[offsets[i]:offsets[i + 1]] = data_1[mask]
+                values_2[offsets[i]:offsets[i + 1]] = data_2[mask]
+
+    map_tiles([raster_dataset_1, raster_dataset_2], len(tiles), collect_tiles,
+              threads)
+
+    if sample:
+        samples = [item for item in samples if item is not None]
+        values_1 = numpy.concatenate([item[0] for item in samples])
+        values_2 = numpy.concatenate([item[1] for item in samples])
+    return rank_correlations(values_1, values_2, correlation, n_cells)
+
+
+class ReplicateStatistics(object):
+    ''' Summary of the per-cell variability across replicate rasters.
+
+    Blocks of per-cell statistics are added with update() and partial
+    summaries combined with merge(), like DifferenceStatistics.
+    '''
+
+    def __init__(self, tolerance=1e-08):
+        self.tolerance = tolerance
+        # Cells with data in all and in only some of the replicates
+        self.count = 0
+        self.partial = 0
+        # Cells whose range across the replicates exceeds the tolerance
+        self.unstable = 0
+        self.sums = {'mean': 0.0, 'variance': 0.0, 'std': 0.0, 'range': 0.0}
+        self.max = {'mean': -numpy.inf, 'variance': -numpy.inf,
+                    'std': -numpy.inf, 'range': -numpy.inf}
+
+    def update(self, mean, variance, ranges, partial=0):
+        ''' Add the per-cell statistics of a block.
+
+        @param mean numpy array of per-cell means of cells with data in all
+                    replicates
+        @param variance numpy array of per-cell variances
+        @param ranges numpy array of per-cell ranges
+        @param partial int number of cells with data in only some replicates
+        '''
+        self.partial += partial
+        if mean.size == 0:
+            return
+        self.count += mean.size
+        self.unstable += int(numpy.count_nonzero(ranges > self.tolerance))
+        for key, values in [('mean', mean), ('variance', variance),
+                            ('std', numpy.sqrt(variance)),
+                            ('range', ranges)]:
+            self.sums[key] += float(values.sum(dtype=numpy.float64))
+            self.max[key] = max(self.max[key], float(values.max()))
+
+    def merge(self, other):
+        ''' Combine the statistics of another instance into this one.
+
+        @param other ReplicateStatistics
+        '''
+        self.count += other.count
+        self.partial += other.partial
+        self.unstable += other.unstable
+        for key in self.sums:
+            self.sums[key] += other.sums[key]
+            self.max[key] = max(self.max[key], other.max[key])
+
+    def summary(self):
+        ''' Get the summary of the variability.
+
+        @return summary dict with the number of cells, partial cells (data in
+                only some replicates), unstable cells (range above the
+                tolerance) and the mean and max of the per-cell mean,
+                variance, standard deviation and range
+        '''
+        summary = {'cells': self.count, 'partial_cells': self.partial,
+                   'unstable_cells': self.unstable}
+        if self.count:
+            for key in self.sums:
+                summary[key] = {'mean': self.sums[key] / self.count,
+                                'max': self.max[key]}
+        return summary
+
+
+def replicate_variability(datasets, output_files=None, tolerance=1e-08,
+                          threads=1):
+    ''' Calculate the per-cell variability of replicate rasters.
+
+    The replicates are read block by block and the per-cell mean, variance
+    (with K - 1 degrees of freedom for K replicates) and range are
+    accumulated one replicate at a time with Welford's algorithm, so only a
+    block of each statistic is held in memory. Cells that are NoData in any
+    replicate are ignored.
+
+    @param datasets list of GDAL datasets or MemmapDatasets (K >= 2)
+    @param output_files dict of rasters written, keys 'mean', 'variance'
+                        and/or 'range' and values paths (see RasterWriter)
+    @param tolerance double range of values considered stable
+    @param threads int number of threads the tiles are processed on
+    @return summary dict as returned by ReplicateStatistics.summary()
+    '''
+    x_size = datasets[0].RasterXSize
+    y_size = datasets[0].RasterYSize
+    for dataset in datasets[1:]:
+        if (x_size, y_size) != (dataset.RasterXSize, dataset.RasterYSize):
+            raise ValueError('Raster datasets have different dimensions')
+    tiles = list(block_windows(datasets[0].GetRasterBand(1), x_size, y_size))
+    n_replicates = len(datasets)
+
+    writers = {}
+    for key, output_file in (output_files or {}).items():
+        writers[key] = RasterWriter(output_file, x_size, y_size,
+                                    numpy.float32, VARIABILITY_NODATA,
+                                    like=datasets[0])
+
+    def variability_tiles(bands, indices):
+        stats = ReplicateStatistics(tolerance)
+        nodata = [band.GetNoDataValue() for band in bands]
+        for i in indices:
+            xoff, yoff, cols, rows = tiles[i]
+            mean = numpy.zeros((rows, cols))
+            m2 = numpy.zeros((rows, cols))
+            low = numpy.full((rows, cols), numpy.inf)
+            high = numpy.full((rows, cols), -numpy.inf)
+            valid = numpy.ones((rows, cols), dtype=bool)
+            any_valid = numpy.zeros((rows, cols), dtype=bool)
+            for k, band in enumerate(bands):
+                data = band.ReadAsArray(xoff, yoff, cols, rows)
+                mask = valid_mask(data, nodata[k])
+                valid &= mask
+                any_valid |= mask
+                data = data.astype(numpy.float64)
+                delta = data - mean
+                mean += delta / (k + 1)
+                m2 += delta * (data - mean)
+                numpy.minimum(low, data, out=low)
+                numpy.maximum(high, data, out=high)
+            variance = m2 / (n_replicates - 1)
+            ranges = high - low
+            stats.update(mean[valid], variance[valid], ranges[valid],
+                         int(numpy.count_nonzero(any_valid & ~valid)))
+
+            for key, values in [('mean', mean), ('variance', variance),
+                                ('range', ranges)]:
+                if key in writers:
+                    block = numpy.where(valid, values, VARIABILITY_NODATA)
+                    writers[key].write(block, xoff, yoff)
+        return stats
+
+    partials = map_tiles(datasets, len(tiles), variability_tiles, threads)
+    for writer in writers.values():
+        writer.close()
+    stats = partials[0]
+    for partial in partials[1:]:
+        stats.merge(partial)
+
+    summary = stats.summary()
+    summary['replicates'] = n_replicates
+    return summary
+
+
+def raster_groups(folders, suffix='', ext=''):
+    ''' Scan Zonation output folders and search for raster files with the same name in all of them.
+
+    Additional arguments can be provided to define a known filename suffix and/or extension.
+
+    @param folders String list of paths to the folders
+    @param suffix String filename suffix (glob pattern)
+    @param ext String filename extension
+    @return list of tuples (paths of the same raster in each folder)
+    '''
+
+    groups = []
+    pattern = '*' + suffix + ext
+
+    # Index the rasters of each folder by file name
+    indices = []
+    for i, folder in enumerate(folders):
+        rasters = glob.glob(os.path.join(folder, pattern))
+        if len(rasters) == 0:
+            print('ERROR: No suitable files (pattern: {0}) found in folder {1}'.format(pattern, i + 1))
+            sys.exit(0)
+        indices.append(dict((os.path.basename(item), item) for item in rasters))
+
+    for raster_name in sorted(indices[0]):
+        missing = [i + 1 for i, index in enumerate(indices)
+                   if raster_name not in index]
+        if missing:
+            print('WARNING: Raster {0} not found in folder(s) {1}'.format(
+                  raster_name, ', '.join(str(i) for i in missing)))
+        else:
+            groups.append(tuple(index[raster_name] for index in indices))
+
+    if not groups:
+        print('ERROR: none of the rasters in folder 1 found in the other folders')
+        sys.exit(0)
+
+    print('INFO: Found {0} raster groups'.format(len(groups)))
+    return groups
+
+
 def raster_pairs(folder1, folder2, suffix='', ext=''):
     ''' Scan two Zonation output folders and search for raster files with the same name.
 
@@ -78,74 +864,398 @@ def raster_pairs(folder1, folder2, suffix='', ext=''):
     @param folder2 String path to second folder
     @return list of tuples (pairs of paths in the two folders)
     '''
+    return raster_groups([folder1, folder2], suffix=suffix, ext=ext)
 
-    pairs = []
-    pattern = '*' + suffix + ext
 
-    rasters_1 = glob.glob(os.path.join(folder1, pattern))
-    if len(rasters_1) == 0:
-        print('ERROR: No suitable files (pattern: {0}) found in folder 1'.format(pattern))
-        sys.exit(0)
+def checksum_pairs(pairs, hash_cache, jobs=None):
+    ''' Find the pairs of rasters with identical cell values by checksums.
 
-    rasters_2 = glob.glob(os.path.join(folder2, pattern))
-    if len(rasters_2) == 0:
-        print('ERROR: No suitable files (pattern: {0}) found in folder 2'.format(pattern))
-        sys.exit(0)
+    The payload of every raster is hashed (see payload_digest()) on a pool
+    of threads, zlib and file reads release the GIL. Hashes are taken from
+    and added to the cache, so rasters that have not changed since an
+    earlier comparison are not read again.
+
+    @param pairs list of tuples of paths as returned by raster_pairs()
+    @param hash_cache HashCache with payload_digest() as hash function
+    @param jobs int number of threads (default: core count)
+    @return identical dict of the digest of each identical pair
+    '''
+    def file_hash(file_path):
+        try:
+            return hash_cache.file_hash(file_path)
+        except (IOError, OSError) as e:
+            print('WARNING: Could not hash {0}: {1}'.format(file_path, e))
+            return None
 
-    raster_names_2 = [os.path.basename(item) for item in rasters_2]
+    files = sorted(set(path for pair in pairs for path in pair))
+    with ThreadPoolExecutor(max_workers=jobs or cpu_count()) as executor:
+        digests = dict(zip(files, executor.map(file_hash, files)))
 
-    for raster_1 in rasters_1:
+    identical = {}
+    for pair in pairs:
+        if digests[pair[0]] and digests[pair[0]] == digests[pair[1]]:
+            identical[pair] = digests[pair[0]]
+    return identical
 
-        raster_name_1 = os.path.basename(raster_1)
 
-        # FIXME: rasters 2 indexing very fragile
-        if raster_name_1 in raster_names_2:
-            pairs.append((raster_1,
-                          rasters_2[raster_names_2.index(raster_name_1)]))
-        else:
-            print('WARNING: Raster {0} not found in other folder'.format(raster_name_1))
-            pprint(rasters_2)
-            rasters_1.remove(raster_1)
+def pair_memory(pair, correlation='exact', sample_size=1000000):
+    ''' Estimate the peak memory of comparing a pair of rasters.
 
-    if not rasters_1:
-        print('ERROR: none of the rasters in folder 1 found in folder 2')
-        sys.exit(0)
+    Memory is dominated by the cells collected for the rank correlations,
+    the blocks themselves are small.
 
-    print(pairs)
-    return pairs
+    @param pair tuple of paths to the two rasters
+    @param correlation String rank correlation method
+    @param sample_size int number of cells sampled with correlation 'sample'
+    @return estimate int estimated peak memory in bytes
+    '''
+    cell_bytes = CORRELATION_CELL_BYTES
+    n_cells = 0
+    for raster in pair:
+        dataset = open_raster(raster)
+        band = dataset.GetRasterBand(1)
+        n_cells = dataset.RasterXSize * dataset.RasterYSize
+        cell_bytes += band.ReadAsArray(0, 0, 1, 1).dtype.itemsize
+        block_x, block_y = band.GetBlockSize()
+    if correlation == 'none':
+        n_cells = 0
+    elif correlation == 'sample':
+        n_cells = min(n_cells, sample_size)
+    return n_cells * cell_bytes + 4 * block_x * block_y * 8
 
-if __name__ == '__main__':
 
-    folder_1 = '/media/DATAPART1/Zprojects/ESMK/zsetup-esmk/zsetup/output/22_caz'
-    folder_2 = '/media/DATAPART1/Zprojects/ESMK/zsetup-esmk/zsetup/output/22_caz_2'
+def compare_pair(pair, options):
+    ''' Compare a pair of rasters, run in a worker process by main().
+
+    If options['difference_dir'] is given, the difference raster and the
+    tile statistics pyramid are written there named after the rasters.
+
+    @param pair tuple of paths to the two rasters
+    @param options dict of keyword arguments passed to raster_differences(),
+                   difference_dir and raster_ext
+    @return differences dict as returned by raster_differences() with the
+            file names
+    '''
+    options = dict(options)
+    difference_dir = options.pop('difference_dir', None)
+    raster_ext = options.pop('raster_ext', '.tif')
+    if difference_dir:
+        root = os.path.splitext(os.path.basename(pair[0]))[0]
+        options['difference_file'] = os.path.join(
+            difference_dir, '{0}.difference{1}'.format(root, raster_ext))
+        options['pyramid_file'] = os.path.join(
+            difference_dir, '{0}.pyramid.npz'.format(root))
+    if os.path.basename(pair[0]) != os.path.basename(pair[1]):
+        print('WARNING: comparing raster datasets with different names')
+
+    print("INFO: Reading in FIRST dataset {0}".format(pair[0]))
+    raster_dataset1 = open_raster(pair[0])
+    print("INFO: Reading in SECOND dataset {0}".format(pair[1]))
+    raster_dataset2 = open_raster(pair[1])
+
+    differences = raster_differences(raster_dataset1, raster_dataset2,
+                                     **options)
+    differences.update(group_files(pair))
+    return differences
+
+
+def compare_group(group, options):
+    ''' Calculate the variability of replicate rasters, run in a worker
+    process by main().
+
+    The rasters given in options['rasters'] (mean, variance and/or range)
+    are written to options['raster_dir'] named after the replicates.
+
+    @param group tuple of paths to the replicate rasters
+    @param options dict with raster_dir, rasters, raster_ext and keyword
+                   arguments passed to replicate_variability()
+    @return variability dict as returned by replicate_variability() with
+            the file names and the written rasters
+    '''
+    options = dict(options)
+    raster_dir = options.pop('raster_dir')
+    raster_ext = options.pop('raster_ext')
+    root = os.path.splitext(os.path.basename(group[0]))[0]
+    output_files = {}
+    for key in options.pop('rasters'):
+        output_files[key] = os.path.join(
+            raster_dir, '{0}.{1}{2}'.format(root, key, raster_ext))
+
+    print("INFO: Calculating the variability of {0} replicates of "
+          "{1}".format(len(group), os.path.basename(group[0])))
+    datasets = [open_raster(raster) for raster in group]
+    variability = replicate_variability(datasets, output_files, **options)
+    variability.update(group_files(group))
+    if output_files:
+        variability['rasters'] = output_files
+    return variability
+
+
+def group_files(group):
+    ''' Describe the rasters of a pair or group in a result dict.
+
+    @param group tuple of paths to rasters
+    @return files dict with file1 and file2 for a pair, files otherwise
+    '''
+    if len(group) == 2:
+        return {'file1': group[0], 'file2': group[1]}
+    return {'files': list(group)}
+
+
+def compare_pairs(pairs, options, jobs=None, mem_budget=None,
+                  estimates=None, on_finish=None, worker=compare_pair):
+    ''' Compare raster pairs (or groups) concurrently in a pool of processes.
+
+    If a memory budget is given, a pair is only started when its estimated
+    peak memory (see pair_memory()) fits into the part of the budget not
+    reserved by the comparisons in progress. A pair larger than the whole
+    budget is compared alone.
 
-    pairs = raster_pairs(folder_1, folder_2, suffix='.rank.*', ext='.img')
+    @param pairs list of tuples of paths as returned by raster_pairs()
+    @param options dict of keyword options passed to the worker
+    @param jobs int maximum number of concurrent comparisons (default: core
+                count)
+    @param mem_budget int memory budget in bytes (default: no limit)
+    @param estimates dict of estimated peak memory in bytes per pair
+    @param on_finish callable(differences) called when a pair is compared
+    @param worker callable(pair, options) comparing a pair in a worker
+                  process, compare_pair() or compare_group()
+    @return all_differences list of differences dicts in completion order
+    '''
+    if not jobs or jobs < 1:
+        jobs = cpu_count()
+    if estimates is None:
+        estimates = {}
 
+    pending = list(pairs)
+    running = {}
     all_differences = []
+    reserved = 0
 
-    for pair in pairs:
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            while pending and len(running) < jobs:
+                index = 0
+                if mem_budget:
+                    index = _first_fit(pending, estimates,
+                                       mem_budget - reserved)
+                    if index is None:
+                        if running:
+                            break
+                        index = 0
+                        print('WARNING: Estimated memory of comparing {0} '
+                              '({1}) exceeds the memory budget, comparing '
+                              'it alone'.format(
+                                  pending[0][0],
+                                  format_size(estimates[pending[0]])))
+                pair = pending.pop(index)
+                reserved += estimates.get(pair, 0)
+                running[executor.submit(worker, pair, options)] = pair
 
-        if os.path.basename(pair[0]) != os.path.basename(pair[1]):
-            print('WARNING: comparing raster datasets with different names')
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                pair = running.pop(future)
+                reserved -= estimates.get(pair, 0)
+                try:
+                    differences = future.result()
+                except Exception as e:
+                    print('ERROR: Comparing {0} failed: {1}'.format(pair[0],
+                                                                    e))
+                    differences = group_files(pair)
+                    differences['ERROR'] = str(e)
+                all_differences.append(differences)
+                if on_finish:
+                    on_finish(differences)
 
-        print("INFO: Reading in FIRST dataset {0}".format(pair[0]))
-        raster_dataset1 = gdal.Open(pair[0], GA_ReadOnly)
-        print("INFO: Reading in SECOND dataset {0}".format(pair[1]))
-        raster_dataset2 = gdal.Open(pair[1], GA_ReadOnly)
+    return all_differences
 
-        differences = raster_differences(raster_dataset1, raster_dataset2)
-        if differences:
-            differences['file1'] = pair[0]
-            differences['file2'] = pair[1]
 
-        all_differences.append(differences)
+def _first_fit(pending, estimates, available):
+    ''' Get the index of the first pending pair fitting in available memory.
 
-    for diff in all_differences:
-        if diff:
-            pprint(diff)
-        else:
-            print("INFO: All values in all pairs seem to be the same")
+    @param pending list of pairs
+    @param estimates dict of estimated peak memory in bytes per pair
+    @param available int memory available in bytes
+    @return index int index in pending or None if no pair fits
+    '''
+    for index, pair in enumerate(pending):
+        if estimates.get(pair, 0) <= available:
+            return index
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the rasters of ' +
+                                                 'two Zonation output ' +
+                                                 'folders or calculate ' +
+                                                 'their variability across ' +
+                                                 'replicate folders.')
+
+    parser.add_argument('folders', metavar='FOLDER', type=str, nargs='+',
+                        help='output folders, two unless --replicates')
+    parser.add_argument('-s', '--suffix', dest='suffix', default='.rank.*',
+                        help='filename suffix (glob pattern) of compared ' +
+                             'rasters (default: .rank.*)')
+    parser.add_argument('-e', '--ext', dest='ext', default='.img',
+                        help='filename extension of compared rasters ' +
+                             '(default: .img)')
+    parser.add_argument('-o', '--outputfile', dest='output_file',
+                        default=None,
+                        help='name of the output file (default: ' +
+                             'raster_differences.yaml or ' +
+                             'raster_variability.yaml)')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None,
+                        help='number of pairs compared concurrently ' +
+                             '(default: number of cores)')
+    parser.add_argument('-m', '--mem-budget', dest='mem_budget', default=None,
+                        help='memory available for concurrent comparisons, ' +
+                             'e.g. 16G (default: no limit)')
+    parser.add_argument('-T', '--threads', dest='threads', type=int,
+                        default=1,
+                        help='number of threads used for comparing a ' +
+                             'single pair (default: 1)')
+    parser.add_argument('-t', '--tolerance', dest='tolerance', type=float,
+                        default=1e-08,
+                        help='tolerance of equal values (default: 1e-08)')
+    parser.add_argument('-c', '--correlation', dest='correlation',
+                        choices=CORRELATION_METHODS, default='exact',
+                        help='rank correlation method, exact holds all ' +
+                             'cells with data in memory (default: exact)')
+    parser.add_argument('--sample-size', dest='sample_size', type=int,
+                        default=1000000,
+                        help='number of cells sampled with --correlation ' +
+                             'sample (default: 1000000)')
+    parser.add_argument('--thresholds', dest='thresholds', type=float,
+                        nargs=3, default=None,
+                        metavar=('START', 'STOP', 'STEP'),
+                        help='calculate the overlap of cells above ' +
+                             'thresholds from START to STOP, e.g. ' +
+                             '0.5 0.99 0.01')
+    parser.add_argument('--indices', dest='indices', nargs='+',
+                        choices=OVERLAP_INDICES, default=['jaccard'],
+                        help='overlap indices calculated with --thresholds ' +
+                             '(default: jaccard)')
+    parser.add_argument('-d', '--difference-dir', dest='difference_dir',
+                        default=None,
+                        help='write the difference raster and a pyramid ' +
+                             'of tile statistics of each pair into ' +
+                             'DIFFERENCE_DIR')
+    parser.add_argument('--tile-size', dest='tile_size', type=int,
+                        default=256,
+                        help='size of the tiles of the pyramid in cells ' +
+                             '(default: 256)')
+    parser.add_argument('--no-checksum', dest='checksum',
+                        action='store_false',
+                        help='compare all pairs in full, also those whose ' +
+                             'checksums match')
+    parser.add_argument('--hash-cache', dest='hash_cache',
+                        default=os.path.join(CACHE_DIR, 'raster_hashes.json'),
+                        help='cache of raster checksums (default: ' +
+                             '{0})'.format(os.path.join(CACHE_DIR,
+                                                        'raster_hashes.json')))
+    parser.add_argument('-r', '--replicates', dest='replicates',
+                        action='store_true',
+                        help='calculate the per-cell variability of the ' +
+                             'rasters across all folders')
+    parser.add_argument('--rasters', dest='rasters', nargs='*',
+                        choices=['mean', 'variance', 'range'],
+                        default=['variance'],
+                        help='per-cell statistics written as rasters with ' +
+                             '--replicates (default: variance)')
+    parser.add_argument('--raster-dir', dest='raster_dir', default='.',
+                        help='folder of the rasters written with ' +
+                             '--replicates (default: current folder)')
+
+    args = parser.parse_args()
 
-    output_file = check_output_name('raster_differences.yaml')
+    if args.replicates and len(args.folders) < 2:
+        parser.error('--replicates needs at least two folders')
+    if not args.replicates and len(args.folders) != 2:
+        parser.error('two folders are compared, use --replicates for more')
+
+    mem_budget = None
+    if args.mem_budget:
+        try:
+            mem_budget = parse_size(args.mem_budget)
+        except ValueError as e:
+            print('ERROR: {0}'.format(e))
+            sys.exit(1)
+
+    pairs = raster_groups(args.folders, suffix=args.suffix, ext=args.ext)
+
+    estimates = {}
+    # Tiled GeoTIFFs need GDAL, otherwise ENVI rasters are written
+    raster_ext = '.tif'
+    if rasters.gdal is None:
+        raster_ext = '.img'
+    if args.replicates:
+        worker = compare_group
+        output_file = args.output_file or 'raster_variability.yaml'
+        if args.rasters and not os.path.isdir(args.raster_dir):
+            os.makedirs(args.raster_dir)
+        options = {'tolerance': args.tolerance,
+                   'threads': args.threads,
+                   'rasters': args.rasters,
+                   'raster_dir': args.raster_dir,
+                   'raster_ext': raster_ext}
+    else:
+        worker = compare_pair
+        output_file = args.output_file or 'raster_differences.yaml'
+        options = {'tolerance': args.tolerance,
+                   'threads': args.threads,
+                   'correlation': args.correlation,
+                   'sample_size': args.sample_size,
+                   'indices': args.indices,
+                   'tile_size': args.tile_size,
+                   'difference_dir': args.difference_dir,
+                   'raster_ext': raster_ext}
+        if args.difference_dir and not os.path.isdir(args.difference_dir):
+            os.makedirs(args.difference_dir)
+        if args.thresholds:
+            options['thresholds'] = threshold_range(*args.thresholds)
+
+    identical = {}
+    if not args.replicates and args.checksum:
+        print('INFO: Calculating checksums...')
+        hash_cache = HashCache(args.hash_cache, hash_function=payload_digest)
+        identical = checksum_pairs(pairs, hash_cache, args.jobs)
+        hash_cache.save()
+        print('INFO: {0} of {1} pairs are identical by checksum'.format(
+              len(identical), len(pairs)))
+        pairs = [pair for pair in pairs if pair not in identical]
+
+    if mem_budget and not args.replicates:
+        # No single pair may use more than the whole budget
+        options['max_memory'] = mem_budget
+        for pair in pairs:
+            estimates[pair] = pair_memory(pair, args.correlation,
+                                          args.sample_size)
+
+    output_file = check_output_name(output_file)
+    print('INFO: Writing results to {0}'.format(output_file))
     with open(output_file, 'w') as outfile:
-            outfile.write(yaml.dump(all_differences, canonical=True))
+
+        def write_differences(differences):
+            # Each pair is written as an item of a YAML list as soon as it
+            # is compared, so partial results survive an interrupted run
+            outfile.write(yaml.dump([differences], default_flow_style=False))
+            outfile.flush()
+            if 'ERROR' in differences:
+                return
+            if 'jaccard' in differences or 'replicates' in differences:
+                pprint(differences)
+            else:
+                print("INFO: All values in {0} seem to be the same".format(
+                      os.path.basename(differences['file1'])))
+
+        for pair, digest in sorted(identical.items()):
+            differences = group_files(pair)
+            differences['checksum'] = digest
+            write_differences(differences)
+
+        compare_pairs(pairs, options, jobs=args.jobs, mem_budget=mem_budget,
+                      estimates=estimates, on_finish=write_differences,
+                      worker=worker)
+
+if __name__ == '__main__':
+    main()
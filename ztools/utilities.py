@@ -4,8 +4,11 @@
 import datetime
 import os
 import platform
+import re
 from subprocess import Popen, PIPE
 
+import yaml
+
 
 class ZonationRuninfoException(Exception):
     def __init__(self, value):
@@ -40,6 +43,80 @@ def check_output_name(filename):
     return filename
 
 
+def parse_size(size):
+    ''' Converts a human readable memory size into bytes.
+
+    Sizes are given as a number with an optional binary unit suffix, e.g.
+    "200G", "512M" or "1.5T". A plain number is taken as bytes.
+
+    @param size String (or number) memory size
+    @return size int number of bytes
+    '''
+    units = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3,
+             'T': 1024 ** 4}
+
+    match = re.match(r'^\s*([0-9]*\.?[0-9]+)\s*([KMGT]?)i?B?\s*$',
+                     str(size), re.IGNORECASE)
+    if not match:
+        raise ValueError('Invalid memory size: {0}'.format(size))
+    value, unit = match.groups()
+    return int(float(value) * units[unit.upper()])
+
+
+def format_size(n_bytes):
+    ''' Converts a number of bytes into a human readable memory size.
+
+    @param n_bytes int number of bytes
+    @return size String memory size, e.g. "1.5G"
+    '''
+    size = float(n_bytes)
+    for unit in ['', 'K', 'M', 'G']:
+        if abs(size) < 1024:
+            return '{0:.1f}{1}'.format(size, unit)
+        size /= 1024
+    return '{0:.1f}T'.format(size)
+
+
+# Use the libyaml based parser if PyYAML has been built with it
+try:
+    _SafeLoader = yaml.CSafeLoader
+except AttributeError:
+    _SafeLoader = yaml.SafeLoader
+
+
+class ResultsLoader(_SafeLoader):
+    ''' Safe YAML loader for zrunner result files.
+
+    Result files are dumps of Python objects and contain python/tuple and
+    python/object tags (e.g. platform.uname_result). These are loaded as
+    plain lists instead of constructing arbitrary Python objects.
+    '''
+    pass
+
+
+def _construct_python_tag(loader, suffix, node):
+    if isinstance(node, yaml.SequenceNode):
+        return loader.construct_sequence(node, deep=True)
+    elif isinstance(node, yaml.MappingNode):
+        mapping = loader.construct_mapping(node, deep=True)
+        # Objects reduced with keyword form keep their values in args
+        return mapping.get('args', mapping)
+    return loader.construct_scalar(node)
+
+ResultsLoader.add_multi_constructor('tag:yaml.org,2002:python/',
+                                    _construct_python_tag)
+
+
+def load_results(file_path):
+    ''' Loads a zrunner result YAML file without executing any Python tags.
+
+    @param file_path String path to a result YAML file
+    @return results dict of result file contents
+    '''
+    with open(file_path, 'r') as f:
+        return yaml.load(f, Loader=ResultsLoader)
+
+
 def get_system_info():
     ''' Function to retrieve system related information.
 
@@ -47,16 +124,42 @@ def get_system_info():
     '''
     sys_info = []
     sys_info.append({'Report time': datetime.datetime.now().isoformat()})
-    sys_info.append({'Uname': platform.uname()})
+    sys_info.append({'Uname': tuple(platform.uname())})
 
     if platform.system() == 'Linux':
-        sys_info.append({'Version': platform.linux_distribution()})
+        sys_info.append({'Version': linux_distribution()})
     else:
         sys_info.append({'Version': platform.win32_ver()})
 
     return sys_info
 
 
+def linux_distribution(release_files=('/etc/os-release',
+                                      '/usr/lib/os-release')):
+    ''' Get the name, version and codename of the Linux distribution.
+
+    Replaces platform.linux_distribution(), which was removed in Python 3.8,
+    by reading the os-release file.
+
+    @param release_files String list of os-release files tried in order
+    @return tuple (name, version, codename), empty strings if unknown
+    '''
+    for release_file in release_files:
+        try:
+            with open(release_file, 'r') as f:
+                lines = f.read().splitlines()
+        except (IOError, OSError):
+            continue
+        fields = {}
+        for line in lines:
+            key, _, value = line.partition('=')
+            if key and not key.startswith('#'):
+                fields[key.strip()] = value.strip().strip('"\'')
+        return (fields.get('NAME', ''), fields.get('VERSION_ID', ''),
+                fields.get('VERSION_CODENAME', ''))
+    return ('', '', '')
+
+
 def get_zonation_info(executable='zig3'):
     ''' Function to retrieve Zonation version info.
 
@@ -64,9 +167,9 @@ def get_zonation_info(executable='zig3'):
 
     @return tuple Zonation version number
     '''
-    version = Popen([executable, '-v'], stdout=PIPE)
-    version, errs = version.communicate()[0]
-    version = version.split('\n')[0].strip()
+    process = Popen([executable, '-v'], stdout=PIPE)
+    out, _ = process.communicate()
+    version = out.decode('utf-8', 'replace').split('\n')[0].strip()
     version = version.split(':')[1].strip()
     version = tuple(version.split('.'))
 